@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Specialization, Appointment, ChatMessage, UserStatus, Counselor
+from . import stats
+from .models import User, Specialization, Appointment, ChatMessage, UserStatus, Counselor, WorkingHours
 
 # =========================
 # CUSTOM USER ADMIN
@@ -15,7 +16,9 @@ class CustomUserAdmin(UserAdmin):
     actions = ['approve_students']
 
     def approve_students(self, request, queryset):
-        queryset.filter(role='student', is_approved=False).update(is_approved=True)
+        approved = queryset.filter(role='student', is_approved=False).update(is_approved=True)
+        # update() skips signals, so adjust the dashboard counter here
+        stats.bump([('pending', '')], -approved)
     approve_students.short_description = "Approve selected students"
 
     # -------------------------
@@ -41,6 +44,14 @@ class SpecializationAdmin(admin.ModelAdmin):
 class AppointmentAdmin(admin.ModelAdmin):
     list_display = ('student', 'counselor', 'specialization', 'date', 'time', 'status')
 
+# =========================
+# WORKING HOURS ADMIN
+# =========================
+@admin.register(WorkingHours)
+class WorkingHoursAdmin(admin.ModelAdmin):
+    list_display = ('counselor', 'weekday', 'start_time', 'end_time')
+    list_filter = ('weekday',)
+
 # =========================
 # CHAT MESSAGES ADMIN
 # =========================
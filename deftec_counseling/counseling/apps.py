@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CounselingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'counseling'
+
+    def ready(self):
+        from . import signals
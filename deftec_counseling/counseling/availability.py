@@ -0,0 +1,126 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Appointment, WorkingHours
+
+SLOT_MINUTES = getattr(settings, 'APPOINTMENT_SLOT_MINUTES', 60)
+
+# Used for counselors who have not set any WorkingHours rows.
+# weekday -> [(start, end), ...]
+DEFAULT_WORKING_HOURS = getattr(settings, 'DEFAULT_WORKING_HOURS', {
+    weekday: [('08:00', '17:00')] for weekday in range(5)
+})
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def _parse(value):
+    return value if isinstance(value, time) else time.fromisoformat(value)
+
+
+def slot_starts(intervals):
+    """Start times of every full slot that fits in the given intervals."""
+    step = timedelta(minutes=SLOT_MINUTES)
+    starts = []
+    for start, end in intervals:
+        cursor = datetime.combine(datetime.min, _parse(start))
+        end = datetime.combine(datetime.min, _parse(end))
+        while cursor + step <= end:
+            starts.append(cursor.time())
+            cursor += step
+    return starts
+
+
+def load_working_hours(counselor_ids):
+    """counselor_id -> weekday -> [(start, end), ...]"""
+    hours = defaultdict(lambda: defaultdict(list))
+    for counselor_id, weekday, start, end in WorkingHours.objects.filter(
+        counselor_id__in=counselor_ids
+    ).values_list('counselor_id', 'weekday', 'start_time', 'end_time'):
+        hours[counselor_id][weekday].append((start, end))
+    return hours
+
+
+def working_slots(hours, date):
+    return slot_starts((hours or DEFAULT_WORKING_HOURS).get(date.weekday(), []))
+
+
+def has_started(date, slot, now=None):
+    """True once the slot's start time has passed, in local time."""
+    now = timezone.localtime(now)
+    return (date, slot) <= (now.date(), now.time())
+
+
+# =========================
+# SLOT INDEX
+# =========================
+class SlotIndex:
+    """
+    Working hours and booked slots for a set of counselors over a date
+    range, loaded with one query each. The booked-slot query is served by
+    the (counselor, date, time) unique index, so it never scans appointments
+    outside the requested counselors and dates.
+    """
+
+    def __init__(self, counselor_ids, start_date, end_date):
+        self.start_date = start_date
+        self.end_date = end_date
+        self._now = timezone.now()
+
+        self._hours = load_working_hours(counselor_ids)
+
+        self._booked = defaultdict(lambda: defaultdict(set))
+        for counselor_id, date, slot in Appointment.objects.filter(
+            counselor_id__in=counselor_ids,
+            date__range=(start_date, end_date),
+        ).order_by().values_list('counselor_id', 'date', 'time'):
+            self._booked[counselor_id][date].add(slot)
+
+    def working_slots(self, counselor_id, date):
+        return working_slots(self._hours.get(counselor_id), date)
+
+    def is_working_slot(self, counselor_id, date, slot):
+        return slot in self.working_slots(counselor_id, date)
+
+    def is_free(self, counselor_id, date, slot):
+        return slot not in self._booked[counselor_id][date]
+
+    def free_slots(self, counselor_id, date):
+        """Slots still open for booking: not taken and not yet started."""
+        booked = self._booked[counselor_id][date]
+        return [
+            s for s in self.working_slots(counselor_id, date)
+            if s not in booked and not has_started(date, s, self._now)
+        ]
+
+
+# =========================
+# BOOKING
+# =========================
+def check_working_hours(counselor_id, date, slot):
+    """Raise SlotUnavailable unless the slot starts on the counselor's grid."""
+    hours = load_working_hours([counselor_id]).get(counselor_id)
+    if slot not in working_slots(hours, date):
+        raise SlotUnavailable("The counselor is not available at that time.")
+
+
+def book(appointment):
+    """
+    Save a new appointment. The unique constraint on (counselor, date, time)
+    settles races between two students booking the same slot.
+    """
+    if has_started(appointment.date, appointment.time):
+        raise SlotUnavailable("That slot has already started.")
+    check_working_hours(appointment.counselor_id, appointment.date, appointment.time)
+    try:
+        with transaction.atomic():
+            appointment.save()
+    except IntegrityError:
+        raise SlotUnavailable("That slot is already booked.")
+    return appointment
@@ -0,0 +1,114 @@
+import statistics
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import User
+from .report import percentile
+
+# (name, role of the requesting user, url name, query string)
+VIEWS = [
+    ('admin_dashboard', 'admin', 'admin_dashboard', {}),
+    ('manage_students', 'admin', 'manage_students', {}),
+    ('manage_students_search', 'admin', 'manage_students', {'service_number': 'Mensah'}),
+    ('manage_students_rank', 'admin', 'manage_students', {'rank': 'Sgt'}),
+    ('view_appointments', 'admin', 'view_appointments', {}),
+    ('admin_call_logs', 'admin', 'admin_call_logs', {}),
+    ('export_students_excel', 'admin', 'export_students_excel', {}),
+    ('export_students_csv', 'admin', 'export_students_csv', {}),
+    ('counselor_dashboard', 'counselor', 'counselor_dashboard', {}),
+    ('counselor_appointments_ajax', 'counselor', 'counselor_appointments_ajax', {}),
+    ('student_dashboard', 'student', 'student_dashboard', {}),
+]
+
+
+def benchmark_users():
+    """
+    The users each view is requested as: an admin, and the counselor and
+    student with the most appointments, so the heaviest pages get measured.
+    """
+    admin = User.objects.filter(role='admin').order_by('pk').first() \
+        or User.objects.filter(is_superuser=True).order_by('pk').first()
+    counselor = User.objects.filter(role='counselor') \
+        .annotate(n=Count('counselor_appointments')).order_by('-n', 'pk').first()
+    student = User.objects.filter(role='student', is_approved=True) \
+        .annotate(n=Count('student_appointments')).order_by('-n', 'pk').first()
+    return {'admin': admin, 'counselor': counselor, 'student': student}
+
+
+def _fetch(client, url):
+    """Request ``url`` and read the whole body, streamed or not."""
+    response = client.get(url)
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    response.close()
+    return response.status_code, size
+
+
+def run(repeat=5, views=None, cold=False):
+    """
+    Time each view with the test client against the configured database
+    (see seed_data). Every view is requested once to warm up, ``repeat``
+    times timed, and once more under tracemalloc for peak memory. With
+    ``cold`` the cache is cleared before every request.
+    """
+    users = benchmark_users()
+    clients = {}
+    for role, user in users.items():
+        if user is not None:
+            clients[role] = Client()
+            clients[role].force_login(user)
+
+    results = []
+    for name, role, url_name, params in VIEWS:
+        if views and name not in views:
+            continue
+        if role not in clients:
+            results.append({'view': name, 'role': role, 'skipped': f"no {role} user"})
+            continue
+        client = clients[role]
+        url = reverse(url_name)
+        if params:
+            url += '?' + '&'.join(f'{key}={value}' for key, value in params.items())
+
+        _fetch(client, url)
+        timings, queries = [], 0
+        for _ in range(repeat):
+            if cold:
+                cache.clear()
+            # Report views read from their own alias (counseling.routers)
+            with ExitStack() as stack:
+                captured = [stack.enter_context(CaptureQueriesContext(c)) for c in connections.all()]
+                started = time.perf_counter()
+                status, size = _fetch(client, url)
+                timings.append(time.perf_counter() - started)
+            queries = max(queries, sum(len(c) for c in captured))
+
+        if cold:
+            cache.clear()
+        tracemalloc.start()
+        _fetch(client, url)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results.append({
+            'view': name,
+            'role': role,
+            'status': status,
+            'median_ms': round(statistics.median(timings) * 1000, 2),
+            'p95_ms': round(percentile(timings, 95) * 1000, 2),
+            'min_ms': round(min(timings) * 1000, 2),
+            'queries': queries,
+            'peak_memory_kb': round(peak / 1024, 1),
+            'response_kb': round(size / 1024, 1),
+        })
+    return results
@@ -0,0 +1,69 @@
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values`` (0 when empty)."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write(path, suite, params, results):
+    """
+    Save a run as JSON. Keys are sorted and results keep their order, so
+    two runs can be compared with diff or compare().
+    """
+    report = {
+        'suite': suite,
+        'commit': _git_commit(),
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'params': params,
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+    return report
+
+
+def compare(baseline_path, results, key, metrics):
+    """
+    Lines describing how each metric in ``results`` moved against the run
+    saved at ``baseline_path``. Rows are matched on the ``key`` fields.
+    """
+    with open(baseline_path) as f:
+        baseline = {tuple(row[k] for k in key): row for row in json.load(f)['results']}
+
+    lines = []
+    for row in results:
+        old = baseline.get(tuple(row[k] for k in key))
+        if old is None:
+            continue
+        label = ' '.join(str(row[k]) for k in key)
+        for metric in metrics:
+            before, after = old.get(metric), row.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            lines.append(f'{label:<40} {metric:<24} {before:>12} -> {after:<12} ({change:+.1f}%)')
+    return lines
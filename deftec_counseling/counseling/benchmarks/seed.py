@@ -0,0 +1,156 @@
+import datetime
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .. import directory, stats, student_search
+from ..models import (
+    Appointment,
+    CallLog,
+    ChatMessage,
+    Counselor,
+    Specialization,
+    User,
+    normalize_service_number,
+)
+
+# Seeded usernames start with this, so a later run can remove them
+PREFIX = 'seed-'
+
+RANKS = ['Pte', 'LCpl', 'Cpl', 'Sgt', 'SSgt', 'WO2', 'WO1', '2Lt', 'Lt', 'Capt']
+FIRST_NAMES = ['Ama', 'Kofi', 'Yaw', 'Akosua', 'Kwame', 'Efua', 'Kojo', 'Abena', 'Kwesi', 'Adwoa']
+LAST_NAMES = ['Mensah', 'Owusu', 'Boateng', 'Asante', 'Osei', 'Addo', 'Appiah', 'Darko', 'Quaye', 'Ofori']
+# Appointments are spread over this many hourly slots a day from 08:00
+SLOTS_PER_DAY = 9
+
+BATCH_SIZE = 1000
+
+
+def clear():
+    """Delete everything an earlier seed() created."""
+    with transaction.atomic():
+        # No signals on these, so each goes in one DELETE rather than
+        # through the per-row cascade below
+        ChatMessage.objects.filter(appointment__student__username__startswith=PREFIX).delete()
+        CallLog.objects.filter(caller__username__startswith=PREFIX).delete()
+        User.objects.filter(username__startswith=PREFIX).delete()
+        Specialization.objects.filter(name__startswith=PREFIX).delete()
+        stats.reconcile()
+        student_search.rebuild()
+
+
+@transaction.atomic
+def seed(
+    students=1000, counselors=50, specializations=10, appointments_per_student=5,
+    messages_per_appointment=10, calls_per_appointment=1, password='password', rng_seed=0,
+):
+    """
+    Bulk-create a synthetic population. Signals don't fire for
+    bulk_create, so the dashboard counters, student search index and
+    counselor directory are rebuilt once at the end. Returns the number of
+    rows created per model.
+    """
+    rng = random.Random(rng_seed)
+    hashed = make_password(password)
+
+    def name():
+        return rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+
+    # Somebody to request the admin pages as
+    User.objects.create(
+        username=f'{PREFIX}admin', password=hashed, role='admin', is_staff=True,
+        email=f'{PREFIX}admin@example.com',
+    )
+
+    specs = Specialization.objects.bulk_create([
+        Specialization(name=f'{PREFIX}specialization-{i}', description=f'Seeded specialization {i}')
+        for i in range(specializations)
+    ])
+
+    counselor_users = []
+    for i in range(counselors):
+        first_name, last_name = name()
+        counselor_users.append(User(
+            username=f'{PREFIX}counselor-{i}', password=hashed, role='counselor',
+            is_approved=True, first_name=first_name, last_name=last_name,
+            email=f'{PREFIX}counselor-{i}@example.com',
+        ))
+    counselor_users = User.objects.bulk_create(counselor_users, batch_size=BATCH_SIZE)
+    Counselor.objects.bulk_create([
+        Counselor(user=user, specialization=specs[i % len(specs)] if specs else None)
+        for i, user in enumerate(counselor_users)
+    ], batch_size=BATCH_SIZE)
+
+    student_users = []
+    for i in range(students):
+        first_name, last_name = name()
+        service_number = f'SN{i:06d}'
+        student_users.append(User(
+            username=f'{PREFIX}student-{i}', password=hashed, role='student',
+            # Roughly one in ten still waiting for approval
+            is_approved=rng.random() > 0.1,
+            first_name=first_name, last_name=last_name,
+            service_number=service_number,
+            service_number_key=normalize_service_number(service_number),
+            rank=rng.choice(RANKS),
+            school=f'School {rng.randrange(8)}', class_name=f'Class {rng.randrange(20)}',
+        ))
+    student_users = User.objects.bulk_create(student_users, batch_size=BATCH_SIZE)
+
+    appointments = []
+    if counselor_users:
+        start = timezone.localdate()
+        for i, student in enumerate(student_users):
+            for j in range(appointments_per_student):
+                # Counselor and slot both follow from the running index, so
+                # no counselor is ever booked twice for one slot
+                n = i * appointments_per_student + j
+                counselor_index, slot = n % len(counselor_users), n // len(counselor_users)
+                counselor = counselor_users[counselor_index]
+                day = start + datetime.timedelta(days=slot // SLOTS_PER_DAY - 30)
+                appointments.append(Appointment(
+                    student=student, counselor=counselor,
+                    specialization=specs[counselor_index % len(specs)],
+                    date=day, time=datetime.time(8 + slot % SLOTS_PER_DAY),
+                    status='completed' if day < start else rng.choice(['pending', 'approved']),
+                ))
+    appointments = Appointment.objects.bulk_create(appointments, batch_size=BATCH_SIZE)
+
+    messages, calls = [], []
+    for appointment in appointments:
+        at = timezone.make_aware(datetime.datetime.combine(appointment.date, appointment.time))
+        people = [appointment.student, appointment.counselor]
+        for k in range(messages_per_appointment):
+            messages.append(ChatMessage(
+                appointment=appointment, sender=people[k % 2],
+                message=f'Seeded message {k}', timestamp=at + datetime.timedelta(seconds=30 * k),
+            ))
+        for k in range(calls_per_appointment):
+            answered = rng.random() > 0.3
+            started = at + datetime.timedelta(minutes=5 * k)
+            calls.append(CallLog(
+                caller=people[k % 2], receiver=people[(k + 1) % 2], appointment=appointment,
+                call_type=rng.choice(['voice', 'video']),
+                status='completed' if answered else 'missed',
+                started_at=started,
+                answered_at=started + datetime.timedelta(seconds=10) if answered else None,
+                ended_at=started + datetime.timedelta(minutes=rng.randrange(1, 40)),
+            ))
+    ChatMessage.objects.bulk_create(messages, batch_size=BATCH_SIZE)
+    CallLog.objects.bulk_create(calls, batch_size=BATCH_SIZE)
+
+    stats.reconcile()
+    student_search.rebuild()
+    transaction.on_commit(directory.invalidate)
+
+    return {
+        'admins': 1,
+        'specializations': len(specs),
+        'counselors': len(counselor_users),
+        'students': len(student_users),
+        'appointments': len(appointments),
+        'chat messages': len(messages),
+        'call logs': len(calls),
+    }
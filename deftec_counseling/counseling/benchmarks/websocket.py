@@ -0,0 +1,203 @@
+import asyncio
+import datetime
+import gc
+import json
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import msgpack
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import override_settings
+
+from ..framing import MSGPACK_SUBPROTOCOL
+from ..models import Appointment, Specialization, User
+from ..routing import websocket_urlpatterns
+from .report import percentile
+
+LAYERS = {
+    'inmemory': lambda: {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+    'unixsocket': lambda: {
+        'BACKEND': 'counseling.layers.UnixSocketChannelLayer',
+        'CONFIG': {'socket_dir': tempfile.mkdtemp(prefix='bench-channels-')},
+    },
+}
+
+FRAMINGS = ['json', 'msgpack']
+
+# Seconds to wait for a burst to arrive before counting the rest as lost
+DELIVERY_TIMEOUT = 30
+
+
+class _ForceUser:
+    """Puts the room's user in the scope, standing in for AuthMiddlewareStack."""
+
+    def __init__(self, app, user):
+        self.app = app
+        self.user = user
+
+    async def __call__(self, scope, receive, send):
+        return await self.app(dict(scope, user=self.user), receive, send)
+
+
+def seed_rooms(rooms):
+    """One appointment (student + counselor) per room. Returns the appointments."""
+    spec = Specialization.objects.create(name='Benchmark', description='')
+    counselors = User.objects.bulk_create([
+        User(username=f'bench-counselor-{i}', role='counselor') for i in range(rooms)
+    ])
+    students = User.objects.bulk_create([
+        User(username=f'bench-student-{i}', role='student', is_approved=True) for i in range(rooms)
+    ])
+    Appointment.objects.bulk_create([
+        Appointment(
+            student=student, counselor=counselor, specialization=spec,
+            date=datetime.date.today(), time=datetime.time(9), status='approved',
+        )
+        for student, counselor in zip(students, counselors)
+    ])
+    return list(Appointment.objects.select_related('student', 'counselor').order_by('pk'))
+
+
+class _Client:
+    """
+    One simulated browser tab. Frames are read straight off the
+    communicator's output queue: receive_output() with a timeout would
+    cancel the consumer.
+    """
+
+    def __init__(self, app, user, path, framing):
+        subprotocols = [MSGPACK_SUBPROTOCOL] if framing == 'msgpack' else []
+        self.communicator = WebsocketCommunicator(_ForceUser(app, user), path, subprotocols=subprotocols)
+        self.framing = framing
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect()
+        if not connected:
+            raise RuntimeError("Benchmark client was refused")
+
+    async def send(self, payload):
+        if self.framing == 'msgpack':
+            await self.communicator.send_to(bytes_data=msgpack.packb(payload, use_bin_type=True))
+        else:
+            await self.communicator.send_to(text_data=json.dumps(payload))
+
+    async def frames(self):
+        queue = self.communicator.output_queue
+        while True:
+            message = await queue.get()
+            if message['type'] != 'websocket.send':
+                return
+            if message.get('bytes') is not None:
+                yield msgpack.unpackb(message['bytes'], raw=False)
+            else:
+                yield json.loads(message['text'])
+
+
+async def _run(appointments, clients_per_room, messages, framing):
+    app = URLRouter(websocket_urlpatterns)
+    rooms = []
+    for appointment in appointments:
+        path = f'/ws/chat/{appointment.pk}/'
+        users = [appointment.student, appointment.counselor]
+        rooms.append([
+            _Client(app, users[i % 2], path, framing) for i in range(clients_per_room)
+        ])
+    clients = [client for room in rooms for client in room]
+
+    # Python heap held per open connection, measured on its own because
+    # tracing slows everything else down
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for client in clients:
+        await client.connect()
+    gc.collect()
+    memory_per_connection = (tracemalloc.get_traced_memory()[0] - before) / len(clients)
+    tracemalloc.stop()
+
+    sent_at = {}
+    latencies = []
+    expected = len(appointments) * messages * clients_per_room
+    done = asyncio.Event()
+
+    async def read(client):
+        async for frame in client.frames():
+            if frame.get('type') != 'chat_message':
+                continue
+            sent = sent_at.get(frame['message'])
+            if sent is None:
+                continue
+            latencies.append(time.perf_counter() - sent)
+            if len(latencies) >= expected:
+                done.set()
+
+    readers = [asyncio.create_task(read(client)) for client in clients]
+    # Let connect-time frames (presence, history) drain first
+    await asyncio.sleep(0.5)
+
+    async def burst(room_index, room):
+        sender = room[0]
+        for seq in range(messages):
+            text = f'{room_index}:{seq}'
+            sent_at[text] = time.perf_counter()
+            await sender.send({'type': 'chat_message', 'message': text})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(burst(i, room) for i, room in enumerate(rooms)))
+    try:
+        await asyncio.wait_for(done.wait(), DELIVERY_TIMEOUT)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - started
+
+    for reader in readers:
+        reader.cancel()
+    for client in clients:
+        await client.communicator.disconnect()
+    await get_channel_layer().close()
+
+    return {
+        'connections': len(clients),
+        'expected': expected,
+        'delivered': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(max(latencies, default=0) * 1000, 3),
+        'throughput_per_s': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'memory_per_connection_kb': round(memory_per_connection / 1024, 1),
+    }
+
+
+def run(rooms=10, clients=4, messages=20, layers=None, framings=None):
+    """
+    Fan-out benchmark: ``rooms`` chat rooms with ``clients`` sockets each;
+    the first socket in every room sends a burst of ``messages``, all rooms
+    at once. Runs once per channel layer and framing; needs a database with
+    migrations applied (the benchmark command uses a throwaway test one).
+    """
+    appointments = seed_rooms(rooms)
+    # Untimed pass so imports, first queries and thread pools don't land
+    # in the first measurement
+    with override_settings(CHANNEL_LAYERS={'default': LAYERS['inmemory']()}):
+        asyncio.run(_run(appointments, 1, 2, 'json'))
+
+    results = []
+    for layer in layers or list(LAYERS):
+        for framing in framings or FRAMINGS:
+            config = LAYERS[layer]()
+            with override_settings(CHANNEL_LAYERS={'default': config}):
+                result = asyncio.run(_run(appointments, clients, messages, framing))
+            if 'socket_dir' in config.get('CONFIG', {}):
+                shutil.rmtree(config['CONFIG']['socket_dir'], ignore_errors=True)
+            results.append({
+                'layer': layer, 'framing': framing,
+                'rooms': rooms, 'clients': clients, 'messages': messages,
+                **result,
+            })
+    return results
@@ -0,0 +1,370 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from . import fragments
+from .models import CallLog
+
+logger = logging.getLogger(__name__)
+
+# Seconds a call may ring before it counts as missed
+RING_TIMEOUT = getattr(settings, 'CALL_RING_TIMEOUT', 45)
+# Seconds an answered call may go without any signaling before it is closed
+IDLE_TIMEOUT = getattr(settings, 'CALL_IDLE_TIMEOUT', 120)
+# How often the reaper looks for stale calls (seconds)
+REAP_INTERVAL = getattr(settings, 'CALL_REAP_INTERVAL', 15)
+# Answered calls no process is tracking are closed after this long (minutes)
+MAX_CALL_MINUTES = getattr(settings, 'CALL_MAX_MINUTES', 240)
+# Where signs of life are recorded. The two participants' signaling may go
+# through different workers, so this must be a cache the workers share.
+CACHE = getattr(settings, 'CALL_CACHE', 'default')
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+def _seen_key(call_id):
+    return f'calls:seen:{call_id}'
+
+
+def signal_group(appointment_id, user_id):
+    """One user's signaling sockets for one appointment (see SignalingConsumer)."""
+    return f'signal_{appointment_id}_{user_id}'
+
+
+# =========================
+# STATE MACHINE
+# =========================
+# (state, event) -> new state. CallLog keeps 'ongoing' as the answered state.
+TRANSITIONS = {
+    ('ringing', 'answer'): 'ongoing',
+    ('ringing', 'decline'): 'missed',
+    ('ringing', 'hangup'): 'missed',
+    ('ringing', 'timeout'): 'missed',
+    ('ongoing', 'hangup'): 'completed',
+    ('ongoing', 'timeout'): 'completed',
+}
+
+FINAL_STATES = {'completed', 'missed'}
+
+
+def next_state(state, event):
+    try:
+        return TRANSITIONS[(state, event)]
+    except KeyError:
+        raise InvalidTransition(f"Can't {event} a call that is {state}")
+
+
+# =========================
+# ACTIVE CALL REGISTRY
+# =========================
+@dataclass
+class ActiveCall:
+    id: int
+    caller_id: int
+    receiver_id: int
+    call_type: str
+    state: str
+    started_at: object
+    last_seen: object
+    answered_at: object = None
+    # Appointment the call was placed from; its participants' signaling
+    # sockets are told about state changes
+    appointment_id: int = None
+
+    def groups(self):
+        if self.appointment_id is None:
+            return []
+        return [
+            signal_group(self.appointment_id, user_id)
+            for user_id in (self.caller_id, self.receiver_id)
+        ]
+
+    def as_event(self):
+        return {
+            'type': 'call_state',
+            'call_id': self.id,
+            'state': self.state,
+            'call_type': self.call_type,
+            'caller_id': self.caller_id,
+            'receiver_id': self.receiver_id,
+        }
+
+
+class CallRegistry:
+    """
+    Calls that are ringing or answered which this process watches for
+    timeouts. Any worker can act on any call: state is read from the
+    CallLog row on every change, and signs of life go through the shared
+    cache, so an entry here is only this worker's last view of them.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def add(self, call):
+        with self._lock:
+            self._calls[call.id] = call
+
+    def get(self, call_id):
+        return self._calls.get(call_id)
+
+    def remove(self, call_id):
+        with self._lock:
+            return self._calls.pop(call_id, None)
+
+    def touch(self, call_id, now=None):
+        call = self._calls.get(call_id)
+        if call is not None:
+            call.last_seen = now or timezone.now()
+        return call
+
+    def ids(self):
+        return list(self._calls)
+
+    def calls(self):
+        return list(self._calls.values())
+
+    def __len__(self):
+        return len(self._calls)
+
+    def pop_stale(self, now):
+        """Remove and return calls that rang or idled past their timeout."""
+        ring_cutoff = now - timedelta(seconds=RING_TIMEOUT)
+        idle_cutoff = now - timedelta(seconds=IDLE_TIMEOUT)
+        with self._lock:
+            stale = [
+                call for call in self._calls.values()
+                if (call.state == 'ringing' and call.started_at < ring_cutoff)
+                or (call.state == 'ongoing' and call.last_seen < idle_cutoff)
+            ]
+            for call in stale:
+                del self._calls[call.id]
+        return stale
+
+
+registry = CallRegistry()
+
+
+# =========================
+# LIFECYCLE
+# =========================
+def ring(caller_id, receiver_id, call_type, appointment_id=None):
+    now = timezone.now()
+    log = CallLog.objects.create(
+        caller_id=caller_id,
+        receiver_id=receiver_id,
+        appointment_id=appointment_id,
+        call_type=call_type,
+        status='ringing',
+        started_at=now,
+    )
+    call = ActiveCall(
+        id=log.pk, caller_id=caller_id, receiver_id=receiver_id, call_type=call_type,
+        state='ringing', started_at=now, last_seen=now, appointment_id=appointment_id,
+    )
+    registry.add(call)
+    ensure_reaper()
+    return call
+
+
+def _load(call_id):
+    """
+    The registry entry brought up to date from the row, which another
+    worker may have moved on; one is added if another worker rang the call.
+    """
+    log = CallLog.objects.filter(pk=call_id).exclude(status__in=FINAL_STATES).first()
+    if log is None:
+        registry.remove(call_id)
+        raise InvalidTransition("No such active call")
+    call = registry.get(call_id)
+    if call is not None:
+        call.state = log.status
+        call.answered_at = log.answered_at
+        return call
+    call = ActiveCall(
+        id=log.pk, caller_id=log.caller_id, receiver_id=log.receiver_id,
+        call_type=log.call_type, state=log.status, started_at=log.started_at,
+        last_seen=timezone.now(), answered_at=log.answered_at,
+        appointment_id=log.appointment_id,
+    )
+    registry.add(call)
+    return call
+
+
+def _transition(call_id, user_id, event, allowed):
+    call = _load(call_id)
+    if user_id not in allowed(call):
+        raise InvalidTransition("Not a participant in this call")
+    state = next_state(call.state, event)
+    now = timezone.now()
+
+    fields = {'status': state}
+    if state == 'ongoing':
+        fields['answered_at'] = now
+    else:
+        fields['ended_at'] = now
+
+    # Conditional on the old status, so two racing events can't both win
+    if not CallLog.objects.filter(pk=call.id, status=call.state).update(**fields):
+        registry.remove(call.id)
+        raise InvalidTransition("The call has already changed state")
+
+    # update() sends no signals; the receiver's missed calls may have changed
+    fragments.bump_on_commit('calls', call.receiver_id)
+    call.state = state
+    call.last_seen = now
+    if state == 'ongoing':
+        call.answered_at = now
+        ensure_reaper()
+    else:
+        registry.remove(call.id)
+    return call
+
+
+def answer(call_id, user_id):
+    return _transition(call_id, user_id, 'answer', lambda c: {c.receiver_id})
+
+
+def decline(call_id, user_id):
+    return _transition(call_id, user_id, 'decline', lambda c: {c.receiver_id})
+
+
+def hang_up(call_id, user_id):
+    return _transition(call_id, user_id, 'hangup', lambda c: {c.caller_id, c.receiver_id})
+
+
+def touch(call_id):
+    """Any signaling on a call counts as a sign of life, whichever worker relays it."""
+    now = timezone.now()
+    caches[CACHE].set(_seen_key(call_id), now, IDLE_TIMEOUT * 2)
+    return registry.touch(call_id, now)
+
+
+def _catch_up(calls):
+    """Move last_seen on to signs of life other workers recorded."""
+    answered = [call for call in calls if call.state == 'ongoing']
+    if not answered:
+        return
+    seen = caches[CACHE].get_many([_seen_key(call.id) for call in answered])
+    for call in answered:
+        when = seen.get(_seen_key(call.id))
+        if when is not None and when > call.last_seen:
+            call.last_seen = when
+
+
+# =========================
+# REAPER
+# =========================
+def _notify(calls):
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    for call in calls:
+        for group in call.groups():
+            try:
+                async_to_sync(layer.group_send)(group, call.as_event())
+            except Exception:
+                logger.exception("Failed to announce the end of call %s", call.id)
+
+
+def reap(now=None):
+    """
+    Close stale calls in bulk. Calls in the registry time out from their
+    ring or idle limits; rows no process is tracking (the process died)
+    are closed from the database alone. Returns the number closed.
+    """
+    now = now or timezone.now()
+    _catch_up(registry.calls())
+    stale = registry.pop_stale(now)
+    if stale:
+        # Drop calls another process already moved on, so nobody is told
+        # about a timeout that didn't happen
+        current = dict(CallLog.objects.filter(
+            pk__in=[call.id for call in stale]
+        ).values_list('pk', 'status'))
+        stale = [call for call in stale if current.get(call.id) == call.state]
+
+    unanswered = [call for call in stale if call.state == 'ringing']
+    answered = [call for call in stale if call.state == 'ongoing']
+    closed = 0
+
+    if unanswered:
+        closed += CallLog.objects.filter(
+            pk__in=[call.id for call in unanswered], status='ringing'
+        ).update(status='missed', ended_at=now)
+    if answered:
+        # Ended when it was last heard from, not when the reaper noticed
+        closed += CallLog.objects.filter(
+            pk__in=[call.id for call in answered], status='ongoing'
+        ).update(status='completed', ended_at=Case(
+            *[When(pk=call.id, then=Value(call.last_seen)) for call in answered],
+            output_field=DateTimeField(),
+        ))
+
+    tracked = registry.ids()
+    orphaned = CallLog.objects.filter(
+        status='ringing', started_at__lt=now - timedelta(seconds=RING_TIMEOUT),
+    ).exclude(pk__in=tracked).update(status='missed', ended_at=now)
+    closed += orphaned
+    closed += CallLog.objects.filter(
+        status='ongoing', started_at__lt=now - timedelta(minutes=MAX_CALL_MINUTES),
+    ).exclude(pk__in=tracked).update(status='completed', ended_at=now)
+
+    # update() sends no signals, so refresh the receivers' missed calls here
+    receivers = {call.receiver_id for call in unanswered}
+    if orphaned:
+        # Only rows closed just now carry this exact ended_at
+        receivers.update(
+            CallLog.objects.filter(status='missed', ended_at=now)
+            .order_by().values_list('receiver_id', flat=True).distinct()
+        )
+    for receiver_id in receivers:
+        fragments.bump_on_commit('calls', receiver_id)
+
+    for call in unanswered:
+        call.state = 'missed'
+    for call in answered:
+        call.state = 'completed'
+    _notify(stale)
+    return closed
+
+
+_reaper = None
+_reaper_lock = threading.Lock()
+
+
+def _run_reaper():
+    global _reaper
+    while True:
+        time.sleep(REAP_INTERVAL)
+        close_old_connections()
+        try:
+            reap()
+        except Exception:
+            logger.exception("Call reaper failed")
+        with _reaper_lock:
+            if not len(registry):
+                _reaper = None
+                return
+
+
+def ensure_reaper():
+    """Start the background reaper thread; it exits once no calls are active."""
+    global _reaper
+    with _reaper_lock:
+        if _reaper is None:
+            _reaper = threading.Thread(target=_run_reaper, name='call-reaper', daemon=True)
+            _reaper.start()
@@ -0,0 +1,110 @@
+import asyncio
+import atexit
+import logging
+import threading
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# WRITE-BEHIND CHAT BUFFER
+# =========================
+class ChatMessageBuffer:
+    """
+    Collects chat messages in memory and writes them with bulk_create.
+
+    A flush happens when the buffer reaches ``max_batch`` rows, every
+    ``flush_interval`` seconds while there is something pending, when a
+    consumer disconnects and once more at interpreter shutdown.
+    """
+
+    def __init__(self, max_batch=50, flush_interval=1.0):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flusher = None
+        self.buffered = 0
+        self.flushed = 0
+        self.failed = 0
+
+    def add(self, appointment_id, sender_id, message, timestamp):
+        """Queue a message. Returns True when the batch is full."""
+        with self._lock:
+            self._pending.append(ChatMessage(
+                appointment_id=appointment_id,
+                sender_id=sender_id,
+                message=message,
+                timestamp=timestamp,
+            ))
+            self.buffered += 1
+            return len(self._pending) >= self.max_batch
+
+    def _take(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        return batch
+
+    def _write(self, batch):
+        try:
+            ChatMessage.objects.bulk_create(batch, batch_size=self.max_batch)
+        except Exception:
+            logger.exception("Failed to persist %d chat messages", len(batch))
+            with self._lock:
+                self.failed += len(batch)
+            return 0
+        with self._lock:
+            self.flushed += len(batch)
+        return len(batch)
+
+    async def flush(self):
+        batch = self._take()
+        if not batch:
+            return 0
+        return await database_sync_to_async(self._write)(batch)
+
+    def flush_sync(self):
+        batch = self._take()
+        if not batch:
+            return 0
+        close_old_connections()
+        return self._write(batch)
+
+    def ensure_flusher(self):
+        """Start the periodic flush task on the running event loop."""
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if not self.pending:
+                return
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'buffered': self.buffered,
+                'flushed': self.flushed,
+                'failed': self.failed,
+                'pending': len(self._pending),
+            }
+
+
+chat_buffer = ChatMessageBuffer(
+    max_batch=getattr(settings, 'CHAT_BUFFER_MAX_BATCH', 50),
+    flush_interval=getattr(settings, 'CHAT_BUFFER_FLUSH_INTERVAL', 1.0),
+)
+
+atexit.register(chat_buffer.flush_sync)
@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import ChatMessage
+
+PAGE_SIZE = getattr(settings, 'CHAT_HISTORY_PAGE_SIZE', 30)
+
+
+# =========================
+# KEYSET CURSORS
+# =========================
+def encode_cursor(msg):
+    return f"{msg.timestamp.isoformat()}|{msg.id}"
+
+
+def decode_cursor(cursor):
+    """Returns (timestamp, id) or None for a missing/garbled cursor."""
+    try:
+        ts, pk = cursor.rsplit('|', 1)
+        return datetime.fromisoformat(ts), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+# =========================
+# HISTORY PAGES
+# =========================
+def history_page(appointment_id, before=None, limit=PAGE_SIZE):
+    """
+    Returns (messages, next_cursor) for the page of messages older than
+    ``before``, oldest first. ``next_cursor`` is None on the last page.
+
+    Seeks on (timestamp, id) so every page costs the same regardless of
+    how long the thread is.
+    """
+    qs = ChatMessage.objects.filter(appointment_id=appointment_id)
+
+    position = decode_cursor(before) if before else None
+    if position:
+        ts, pk = position
+        qs = qs.filter(Q(timestamp__lt=ts) | Q(timestamp=ts, id__lt=pk))
+
+    rows = list(
+        qs.select_related('sender')
+        .order_by('-timestamp', '-id')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+
+    next_cursor = encode_cursor(rows[0]) if has_more else None
+    return rows, next_cursor
+
+
+def serialize_message(msg):
+    return {
+        'id': msg.id,
+        'sender': msg.sender.get_full_name() or msg.sender.username,
+        'message': msg.message,
+        'timestamp': msg.timestamp.isoformat(),
+    }
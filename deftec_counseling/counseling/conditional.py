@@ -0,0 +1,66 @@
+import hashlib
+from functools import wraps
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+# =========================
+# VALIDATORS
+# =========================
+def make_etag(*parts):
+    """Strong ETag from ``parts``, hashed so nothing about them leaks."""
+    digest = hashlib.md5('|'.join(map(str, parts)).encode(), usedforsecurity=False).hexdigest()
+    return f'"{digest}"'
+
+
+def _timestamp(value):
+    return int(value.timestamp()) if value is not None else None
+
+
+# =========================
+# DECORATOR
+# =========================
+def conditional(validators):
+    """
+    Answer GET/HEAD with 304 when the client's copy is still current.
+
+    ``validators(request, *args, **kwargs)`` returns (etag_parts,
+    last_modified) without building the page, or None to skip. The ETag
+    also covers the user and CSRF cookie, since pages are per user and
+    embed a token. Full responses are marked private, no-cache so the
+    browser revalidates instead of reusing them blindly.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            found = validators(request, *args, **kwargs)
+            if found is None:
+                return view(request, *args, **kwargs)
+
+            parts, last_modified = found
+            last_modified = _timestamp(last_modified)
+
+            def etag():
+                # The CSRF secret is read each time: rendering the page
+                # sets one if the client had none
+                return make_etag(request.user.pk, request.META.get('CSRF_COOKIE', ''), *parts)
+
+            response = get_conditional_response(request, etag=etag(), last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            elif response.status_code != 304:
+                # A failed If-Match precondition
+                return response
+
+            response['ETag'] = etag()
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -1,34 +1,325 @@
-import json
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import calls, presence
+from .chat_buffer import chat_buffer
+from .chat_history import history_page, serialize_message
+from .framing import FramedConsumerMixin, encode
+from .models import Appointment
+
+logger = logging.getLogger(__name__)
+
 
-class ChatConsumer(AsyncWebsocketConsumer):
+def appointment_participants(user, appointment_id):
+    """(student_id, counselor_id) if ``user`` is one of them, else None."""
+    if user is None or not user.is_authenticated:
+        return None
+    return Appointment.objects.filter(
+        Q(student_id=user.id) | Q(counselor_id=user.id),
+        id=appointment_id,
+    ).values_list('student_id', 'counselor_id').first()
+
+
+# =========================
+# CHAT
+# =========================
+class ChatConsumer(FramedConsumerMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.appointment_id = self.scope['url_route']['kwargs']['appointment_id']
         self.room_group_name = f'chat_{self.appointment_id}'
+        self.presence_groups = []
 
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
-        await self.accept()
+        participants = await self.get_participants()
+        if participants is None:
+            await self.close()
+            return
+
+        self.user = self.scope['user']
+        self.presence_groups = [presence.group_name(uid) for uid in participants]
+
+        for group in [self.room_group_name] + self.presence_groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+        await self.accept_framed()
+
+        first, online = await self.join_presence(participants)
+        if first:
+            await self.broadcast_presence(True)
+        for uid in participants:
+            await self.send_frame({
+                'type': 'presence',
+                'user_id': uid,
+                'is_online': online[uid],
+            })
+
+        # Messages still sitting in the write-behind buffer belong in history
+        await chat_buffer.flush()
+        await self.send_history()
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        for group in [self.room_group_name] + self.presence_groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+        if self.presence_groups and await database_sync_to_async(presence.registry.disconnect)(
+            self.user.id, self.channel_name,
+        ):
+            await self.broadcast_presence(False)
+        await chat_buffer.flush()
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive_frame(self, data):
+        if data.get('type') == 'load_history':
+            await self.send_history(before=data.get('before'))
+            return
 
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
+        message = data.get('message')
+        if not message:
+            return
+
+        timestamp = timezone.now()
+        sender = self.user.get_full_name() or self.user.username
+
+        if chat_buffer.add(self.appointment_id, self.user.id, message, timestamp):
+            await chat_buffer.flush()
+        else:
+            chat_buffer.ensure_flusher()
+
+        # Encoded once here; every socket in the room sends the same frame
+        await self.channel_layer.group_send(self.room_group_name, {
+            'type': 'chat_message',
+            **encode({
                 'type': 'chat_message',
-                'message': data['message'],
-                'sender': data['sender']
-            }
-        )
+                'message': message,
+                'sender': sender,
+                'timestamp': timestamp.isoformat(),
+            }),
+        })
 
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps(event))
+        await self.send_encoded(event)
+
+    async def presence_update(self, event):
+        await self.send_encoded(event)
+
+    # -------------------------
+    # Helpers
+    # -------------------------
+    @database_sync_to_async
+    def get_participants(self):
+        return appointment_participants(self.scope.get('user'), self.appointment_id)
+
+    @database_sync_to_async
+    def join_presence(self, participants):
+        """
+        Register this socket and read everyone's presence. Both touch the
+        shared cache, which may be on disk, so they stay off the event loop.
+        """
+        first = presence.registry.connect(self.user.id, self.channel_name)
+        return first, {uid: presence.is_online(uid) for uid in participants}
+
+    async def broadcast_presence(self, online):
+        """Only called on real online/offline transitions, already recorded by the registry."""
+        await self.channel_layer.group_send(presence.group_name(self.user.id), {
+            'type': 'presence_update',
+            **encode({
+                'type': 'presence',
+                'user_id': self.user.id,
+                'is_online': online,
+            }),
+        })
+
+    @database_sync_to_async
+    def load_history(self, before):
+        rows, next_cursor = history_page(self.appointment_id, before=before)
+        return [serialize_message(m) for m in rows], next_cursor
+
+    async def send_history(self, before=None):
+        rows, next_cursor = await self.load_history(before)
+        await self.send_frame({
+            'type': 'chat_history',
+            'messages': rows,
+            'before': before,
+            'next_cursor': next_cursor,
+        })
+
+
+# =========================
+# CALL SIGNALING
+# =========================
+# ICE candidates are held this long (seconds) and sent to the peer as one
+# frame, unless ICE_BATCH_MAX of them arrive first
+ICE_BATCH_DELAY = getattr(settings, 'SIGNALING_ICE_BATCH_DELAY', 0.05)
+ICE_BATCH_MAX = getattr(settings, 'SIGNALING_ICE_BATCH_MAX', 20)
+
+
+class SignalingConsumer(FramedConsumerMixin, AsyncWebsocketConsumer):
+    """
+    WebRTC signaling for one appointment. Each user's sockets join their
+    own group, so every frame goes straight to the other participant
+    instead of the whole chat room. Frames drive the call state machine
+    in counseling.calls.
+    """
+
+    async def connect(self):
+        self.appointment_id = int(self.scope['url_route']['kwargs']['appointment_id'])
+        self.group = None
+        self.call_ids = set()
+        self._ice = {}
+        self._ice_flush = None
+
+        participants = await database_sync_to_async(appointment_participants)(
+            self.scope.get('user'), self.appointment_id,
+        )
+        if participants is None:
+            await self.close()
+            return
+
+        self.user = self.scope['user']
+        student_id, counselor_id = participants
+        self.peer_id = counselor_id if self.user.id == student_id else student_id
+        self.group = calls.signal_group(self.appointment_id, self.user.id)
+        self.peer_group = calls.signal_group(self.appointment_id, self.peer_id)
+
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept_framed()
+
+    async def disconnect(self, close_code):
+        if self.group is None:
+            return
+        if self._ice_flush is not None:
+            self._ice_flush.cancel()
+        await self.channel_layer.group_discard(self.group, self.channel_name)
+
+        # Closing the page ends any call started or answered on it
+        for call_id in list(self.call_ids):
+            await self.call_event(calls.hang_up, call_id, reply=False)
+
+    async def receive_frame(self, data):
+        signal = data.get('type')
+        try:
+            call_id = int(data['call_id']) if data.get('call_id') is not None else None
+        except (TypeError, ValueError):
+            return
+
+        if signal in ('ice_candidate', 'ice_candidates'):
+            candidates = data.get('data')
+            if signal == 'ice_candidate':
+                candidates = [candidates]
+            if call_id is not None and isinstance(candidates, list):
+                await self.queue_ice(call_id, candidates)
+            return
+
+        if signal == 'keepalive':
+            # Sent while a call is up, since a connected call signals nothing
+            if call_id is not None:
+                await self.touch(call_id)
+            return
+
+        # Anything else must not overtake candidates already queued
+        await self.flush_ice()
+
+        if signal == 'offer' and call_id is None:
+            call_type = 'voice' if data.get('call_type') == 'voice' else 'video'
+            call = await database_sync_to_async(calls.ring)(
+                self.user.id, self.peer_id, call_type, appointment_id=self.appointment_id,
+            )
+            call_id = call.id
+            self.call_ids.add(call_id)
+            await self.announce(call)
+        elif signal == 'offer':
+            # Renegotiation inside a call
+            await self.touch(call_id)
+        elif signal == 'answer':
+            if await self.call_event(calls.answer, call_id) is None:
+                return
+            self.call_ids.add(call_id)
+        elif signal in ('hangup', 'decline'):
+            await self.call_event(calls.hang_up if signal == 'hangup' else calls.decline, call_id)
+            return
+        else:
+            return
+
+        await self.to_peer({'type': signal, 'call_id': call_id, 'data': data.get('data')})
+
+    # -------------------------
+    # Delivery
+    # -------------------------
+    async def to_peer(self, payload):
+        # Encoded once here; the peer's sockets send the frame as is
+        await self.channel_layer.group_send(self.peer_group, {
+            'type': 'signal_frame',
+            **encode(payload),
+        })
+
+    async def announce(self, call):
+        """Tell both participants about a call state change."""
+        event = {'type': 'signal_frame', **encode(call.as_event())}
+        for group in call.groups():
+            await self.channel_layer.group_send(group, event)
+
+    async def signal_frame(self, event):
+        await self.send_encoded(event)
+
+    async def call_state(self, event):
+        # Sent by the call reaper when a call times out
+        self.call_ids.discard(event['call_id'])
+        await self.send_frame(event)
+
+    # -------------------------
+    # ICE batching
+    # -------------------------
+    async def queue_ice(self, call_id, candidates):
+        self._ice.setdefault(call_id, []).extend(candidates)
+        if sum(len(batch) for batch in self._ice.values()) >= ICE_BATCH_MAX:
+            await self.flush_ice()
+        elif self._ice_flush is None:
+            self._ice_flush = asyncio.create_task(self.flush_ice_later())
+
+    async def flush_ice_later(self):
+        await asyncio.sleep(ICE_BATCH_DELAY)
+        # Done waiting: flush_ice() must not cancel the task running it
+        self._ice_flush = None
+        try:
+            await self.flush_ice()
+        except Exception:
+            logger.exception("Failed to relay ICE candidates on appointment %s", self.appointment_id)
+
+    async def flush_ice(self):
+        if self._ice_flush is not None:
+            self._ice_flush.cancel()
+            self._ice_flush = None
+        batches, self._ice = self._ice, {}
+        for call_id, candidates in batches.items():
+            # One sign of life per batch rather than per candidate. The call
+            # may be tracked by another process, so this doesn't gate the relay.
+            await self.touch(call_id)
+            await self.to_peer({'type': 'ice_candidates', 'call_id': call_id, 'data': candidates})
+
+    # -------------------------
+    # Call state
+    # -------------------------
+    async def touch(self, call_id):
+        # calls.touch() writes the shared cache, which may be on disk
+        await sync_to_async(calls.touch)(call_id)
+
+    async def call_event(self, transition, call_id, reply=True):
+        """Apply a state change and tell both sides; errors go back to the sender."""
+        try:
+            call = await database_sync_to_async(transition)(call_id, self.user.id)
+        except calls.InvalidTransition as e:
+            if calls.registry.get(call_id) is None:
+                self.call_ids.discard(call_id)
+            if reply:
+                await self.send_frame({
+                    'type': 'call_error',
+                    'call_id': call_id,
+                    'error': str(e),
+                })
+            return None
+        await self.announce(call)
+        return call
@@ -0,0 +1,113 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import User
+
+# Every process checks a version number in this cache, so when it is
+# shared between workers an edit made in one process drops the others'
+# copies too. Turn off to skip that lookup when there is only one process.
+SHARED_VERSION = getattr(settings, 'COUNSELOR_DIRECTORY_SHARED_VERSION', True)
+CACHE = getattr(settings, 'COUNSELOR_DIRECTORY_CACHE', 'default')
+
+VERSION_KEY = 'counselor_directory:version'
+
+_lock = threading.Lock()
+_directory = {'version': None, 'by_specialization': None}
+# Bumped by every local invalidate() so a load that raced with it is
+# never kept
+_generation = [0]
+
+
+def display_name(first_name, last_name, username):
+    return f"{first_name} {last_name}" if first_name else username
+
+
+# =========================
+# LOADING
+# =========================
+def _load():
+    """specialization_id -> [{'id': user_id, 'name': ...}, ...] in one query."""
+    by_specialization = {}
+    rows = User.objects.filter(
+        role='counselor',
+        is_approved=True,
+        counselor_profile__specialization__isnull=False,
+    ).order_by('counselor_profile__id').values_list(
+        'counselor_profile__specialization_id', 'id', 'first_name', 'last_name', 'username',
+    )
+    for specialization_id, user_id, first_name, last_name, username in rows:
+        by_specialization.setdefault(specialization_id, []).append({
+            'id': user_id,
+            'name': display_name(first_name, last_name, username),
+        })
+    return by_specialization
+
+
+def _cache():
+    return caches[CACHE]
+
+
+def _current_version():
+    if not SHARED_VERSION:
+        return None
+    version = _cache().get(VERSION_KEY)
+    if version is None:
+        _reset_version()
+        version = _cache().get(VERSION_KEY)
+    return version
+
+
+def _reset_version():
+    # Start from the clock rather than 1, so a flushed or restarted cache
+    # never hands back a version some process already has loaded
+    _cache().add(VERSION_KEY, time.time_ns(), None)
+
+
+def _get():
+    version = _current_version()
+    directory = _directory
+    if directory['by_specialization'] is not None and directory['version'] == version:
+        return directory['by_specialization']
+
+    generation = _generation[0]
+    by_specialization = _load()
+    with _lock:
+        if generation == _generation[0]:
+            _directory['by_specialization'] = by_specialization
+            _directory['version'] = version
+    return by_specialization
+
+
+# =========================
+# LOOKUPS
+# =========================
+def counselors_for(specialization_id):
+    """Approved counselors for a specialization, as [{'id', 'name'}, ...]."""
+    try:
+        specialization_id = int(specialization_id)
+    except (TypeError, ValueError):
+        return []
+    return list(_get().get(specialization_id, []))
+
+
+def counselor_ids_for(specialization_id):
+    return [c['id'] for c in counselors_for(specialization_id)]
+
+
+# =========================
+# INVALIDATION
+# =========================
+def invalidate():
+    """Drop this process's copy and, if shared, everybody else's."""
+    with _lock:
+        _generation[0] += 1
+        _directory['by_specialization'] = None
+        _directory['version'] = None
+    if SHARED_VERSION:
+        try:
+            _cache().incr(VERSION_KEY)
+        except ValueError:
+            _reset_version()
@@ -0,0 +1,159 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .streaming import aiter_file, serving_async
+
+# None serves files from Python. 'x-accel-redirect' (nginx) or 'x-sendfile'
+# (Apache mod_xsendfile, lighttpd) hands the transfer to the web server.
+OFFLOAD = getattr(settings, 'FILE_DOWNLOAD_OFFLOAD', None)
+# nginx `internal` location that maps onto MEDIA_ROOT
+ACCEL_PREFIX = getattr(settings, 'FILE_DOWNLOAD_ACCEL_PREFIX', '/protected/')
+
+BLOCK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+# =========================
+# VALIDATORS
+# =========================
+def file_validators(path):
+    """(etag, last_modified timestamp, size) from a single stat()."""
+    st = os.stat(path)
+    etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+    return etag, int(st.st_mtime), st.st_size
+
+
+# =========================
+# RANGES
+# =========================
+def parse_range(header, size):
+    """
+    Returns (start, end) inclusive for a single byte range, None when the
+    header is absent or not something we serve partially (the whole file
+    is sent instead), or False when the range can't be satisfied.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        # Multiple ranges or another unit: ignoring Range is allowed
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes. An empty file has none to give.
+        length = int(last)
+        if length == 0 or size == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+async def _aread_range(path, start, length):
+    # Opened on first read, so a body that is never sent holds no file
+    with open(path, 'rb') as f:
+        f.seek(start)
+        async for block in aiter_file(f, length):
+            yield block
+
+
+# =========================
+# RESPONSE
+# =========================
+def serve_file(request, field_file):
+    """
+    Send a FileField's file with conditional GET and single-range support.
+    With OFFLOAD set the response is just headers and the web server
+    streams the bytes. Otherwise the file is read in blocks: through an
+    async iterator under ASGI, where Django would read a sync body into
+    one list first.
+    """
+    try:
+        path = field_file.path
+        etag, last_modified, size = file_validators(path)
+    except (ValueError, OSError):
+        raise Http404("File not found")
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    filename = os.path.basename(field_file.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    if OFFLOAD == 'x-accel-redirect':
+        # nginx handles Range and its own conditional requests
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = ACCEL_PREFIX + quote(field_file.name)
+    elif OFFLOAD == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+    else:
+        byte_range = None
+        if _if_range_matches(request, etag, last_modified):
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        start, end = byte_range or (0, size - 1)
+        status = 200 if byte_range is None else 206
+        if serving_async(request):
+            response = StreamingHttpResponse(
+                _aread_range(path, start, end - start + 1), status=status, content_type=content_type,
+            )
+            response['Content-Length'] = str(end - start + 1)
+        elif byte_range is None:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+        else:
+            response = StreamingHttpResponse(
+                _read_range(path, start, end - start + 1), status=status, content_type=content_type,
+            )
+            response['Content-Length'] = str(end - start + 1)
+        if byte_range is not None:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Accept-Ranges'] = 'bytes'
+
+    response['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Access is checked per user, so shared caches must not keep a copy
+    response['Cache-Control'] = 'private'
+    return response
@@ -0,0 +1,117 @@
+import csv
+import tempfile
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+from .streaming import aiter_chunks, aiter_file
+
+CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+STUDENT_HEADERS = ["Service Number", "Rank", "Full Name", "School", "Class", "Status"]
+
+
+# =========================
+# ROWS
+# =========================
+def student_rows(students):
+    """
+    Yields export rows for a student queryset. Reads plain tuples in chunks
+    so memory stays flat regardless of how many students there are.
+    """
+    rows = students.values_list(
+        'service_number', 'rank', 'first_name', 'last_name', 'username',
+        'school', 'class_name', 'is_approved',
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+    for service_number, rank, first_name, last_name, username, school, class_name, is_approved in rows:
+        full_name = f"{first_name} {last_name}" if first_name or last_name else username
+        yield [
+            service_number,
+            rank,
+            full_name,
+            school,
+            class_name,
+            "Approved" if is_approved else "Pending",
+        ]
+
+
+# =========================
+# CSV
+# =========================
+class _Echo:
+    """File-like object whose write() hands the line straight back."""
+
+    def write(self, value):
+        return value
+
+
+def csv_response(headers, rows, filename, asynchronous=False):
+    """
+    Streams the CSV as rows are read. Pass ``asynchronous`` under ASGI
+    (streaming.serving_async), where a sync body would be buffered whole.
+    """
+    writer = csv.writer(_Echo())
+
+    def content():
+        yield writer.writerow(headers)
+        for row in rows:
+            yield writer.writerow(row)
+
+    async def async_content():
+        yield writer.writerow(headers)
+        async for chunk in aiter_chunks(rows, CHUNK_SIZE):
+            yield ''.join(writer.writerow(row) for row in chunk)
+
+    body = async_content() if asynchronous else content()
+    response = StreamingHttpResponse(body, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+# =========================
+# EXCEL
+# =========================
+def xlsx_response(headers, rows, filename, title="Sheet", asynchronous=False):
+    """
+    Builds the workbook in write-only mode into a temporary file, then
+    sends that file in blocks. Rows are spooled to disk, so memory stays
+    flat, but nothing is sent until the whole workbook is written: the
+    first byte waits on the full export. Pass ``asynchronous`` under ASGI,
+    where a sync file body would be read into memory.
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = Font(bold=True)
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    for row in rows:
+        ws.append(row)
+
+    output = tempfile.TemporaryFile()
+    wb.save(output)
+    size = output.tell()
+    output.seek(0)
+
+    content_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    if asynchronous:
+        response = StreamingHttpResponse(aiter_file(output), content_type=content_type)
+        response['Content-Length'] = str(size)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        return response
+
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=filename,
+        content_type=content_type,
+    )
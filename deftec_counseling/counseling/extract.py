@@ -0,0 +1,50 @@
+import os
+import zipfile
+from xml.etree import ElementTree
+
+# Longest text kept per book
+MAX_TEXT = 2_000_000
+
+
+# =========================
+# TEXT EXTRACTION
+# =========================
+def _pdf_text(path):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        # Optional dependency; without it PDFs are searchable by title only
+        return ''
+    reader = PdfReader(path)
+    return '\n'.join(page.extract_text() or '' for page in reader.pages)
+
+
+def _docx_text(path):
+    ns = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+    with zipfile.ZipFile(path) as docx:
+        root = ElementTree.fromstring(docx.read('word/document.xml'))
+    return '\n'.join(
+        ''.join(node.text or '' for node in paragraph.iter(f'{ns}t'))
+        for paragraph in root.iter(f'{ns}p')
+    )
+
+
+def extract_text(path):
+    """
+    Plain text of a book file, or '' for formats we can't read. Runs in
+    the search worker processes, so this module must not import Django.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext == '.pdf':
+            text = _pdf_text(path)
+        elif ext == '.docx':
+            text = _docx_text(path)
+        elif ext in ('.txt', '.md'):
+            with open(path, encoding='utf-8', errors='replace') as f:
+                text = f.read(MAX_TEXT)
+        else:
+            text = ''
+    except Exception:
+        text = ''
+    return text[:MAX_TEXT]
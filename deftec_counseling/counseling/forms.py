@@ -2,7 +2,10 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model
 
+from . import directory
 from .models import Specialization, Appointment, Counselor, Book
+from .availability import check_working_hours, SlotUnavailable
+from .uploads import validate_book_file
 
 User = get_user_model()
 
@@ -42,6 +45,20 @@ class StudentRegistrationForm(UserCreationForm):
         return user
 
 
+class StudentImportForm(forms.Form):
+    roster = forms.FileField(help_text="XLSX or CSV with a Service Number column")
+    APPROVAL_CHOICES = (
+        ('', 'Use the Status column'),
+        ('approve', 'Approve everyone'),
+        ('pending', 'Leave everyone pending'),
+    )
+    approval = forms.ChoiceField(choices=APPROVAL_CHOICES, required=False)
+
+    def approve(self):
+        """True/False to override the roster's Status column, None to follow it."""
+        return {'approve': True, 'pending': False}.get(self.cleaned_data['approval'])
+
+
 # =========================
 # COUNSELOR USER CREATION
 # =========================
@@ -141,15 +158,22 @@ class AppointmentForm(forms.ModelForm):
         self.fields['counselor'].queryset = User.objects.none()
 
         if 'specialization' in self.data:
+            counselor_ids = directory.counselor_ids_for(self.data.get('specialization'))
+            if counselor_ids:
+                self.fields['counselor'].queryset = User.objects.filter(pk__in=counselor_ids)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        counselor = cleaned_data.get('counselor')
+        date = cleaned_data.get('date')
+        time = cleaned_data.get('time')
+
+        if counselor and date and time:
             try:
-                spec_id = int(self.data.get('specialization'))
-                self.fields['counselor'].queryset = User.objects.filter(
-                    role='counselor',
-                    counselor_profile__specialization_id=spec_id,
-                    is_approved=True
-                )
-            except (ValueError, TypeError):
-                pass
+                check_working_hours(counselor.id, date, time)
+            except SlotUnavailable as e:
+                raise forms.ValidationError(str(e))
+        return cleaned_data
 
 # =========================
 # BOOKS
@@ -157,4 +181,10 @@ class AppointmentForm(forms.ModelForm):
 class BookUploadForm(forms.ModelForm):
     class Meta:
         model = Book
-        fields = ['title', 'file']
\ No newline at end of file
+        fields = ['title', 'file']
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        # The chunked upload path applies the same check
+        validate_book_file(file)
+        return file
@@ -0,0 +1,97 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+# Upper bound on how long a dashboard section can lag a change no signal
+# tracks (e.g. a renamed user)
+TIMEOUT = getattr(settings, 'DASHBOARD_FRAGMENT_TIMEOUT', 3600)
+
+# Where the versions live. Every worker has to see every bump, so this must
+# be a cache the workers share.
+VERSION_CACHE = getattr(settings, 'DASHBOARD_VERSION_CACHE', 'default')
+
+# Version scopes, each kept in the cache and bumped when its data changes:
+#   dashboard:<user>  appointments (and counselor profile) of one user
+#   calls:<user>      calls received by one user
+#   books             the book list
+#   specializations   the specialization list
+#   stats             the admin dashboard counters
+USER_SCOPES = {'dashboard', 'calls'}
+
+
+def _cache():
+    return caches[VERSION_CACHE]
+
+
+def enabled():
+    """False when versions are process-local, so caching would go stale."""
+    return not isinstance(_cache(), LocMemCache)
+
+
+def _key(scope, user_id=None):
+    if scope in USER_SCOPES:
+        return f'fragments:{scope}:{user_id}'
+    return f'fragments:{scope}'
+
+
+# =========================
+# LOOKUP
+# =========================
+def versions(user_id, *scopes):
+    """{scope: version} for ``scopes``, with one cache round trip."""
+    cache = _cache()
+    keys = {scope: _key(scope, user_id) for scope in scopes}
+    found = cache.get_many(keys.values())
+    missing = [key for key in keys.values() if key not in found]
+    if missing:
+        # Start from the clock rather than 1, so a flushed cache never hands
+        # back a version whose fragments are still stored
+        for key in missing:
+            cache.add(key, time.time_ns(), None)
+        found.update(cache.get_many(missing))
+    return {scope: found.get(key) for scope, key in keys.items()}
+
+
+def context(user_id, *scopes):
+    """
+    Template context for {% cache %} tags keyed on these versions. While
+    caching is off the timeout is 0, so every section renders afresh.
+    """
+    if not enabled():
+        return {'fragment_versions': {}, 'fragment_timeout': 0}
+    return {
+        'fragment_versions': versions(user_id, *scopes),
+        'fragment_timeout': TIMEOUT,
+    }
+
+
+def validator(user_id, *scopes):
+    """
+    ETag parts for a page built from these scopes, or None while caching
+    is off. The time bucket makes a tag expire within TIMEOUT, like the
+    fragments, even if a bump never arrives.
+    """
+    if not enabled():
+        return None
+    current = versions(user_id, *scopes)
+    return [current[scope] for scope in scopes] + [int(time.time() // TIMEOUT)]
+
+
+# =========================
+# INVALIDATION
+# =========================
+def bump(scope, user_id=None):
+    # A lost update between two workers' incr() still moves the version on
+    try:
+        _cache().incr(_key(scope, user_id))
+    except ValueError:
+        # Never handed out, so nothing is cached under it
+        pass
+
+
+def bump_on_commit(scope, user_id=None):
+    """Bump once the change commits, so no render stores old data under the new version."""
+    transaction.on_commit(lambda: bump(scope, user_id))
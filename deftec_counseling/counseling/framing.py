@@ -0,0 +1,61 @@
+import json
+
+import msgpack
+
+# Clients that offer this WebSocket subprotocol get MessagePack binary
+# frames both ways; everyone else keeps JSON text frames
+MSGPACK_SUBPROTOCOL = 'deftec.msgpack.v1'
+
+
+def encode(payload):
+    """
+    Both wire forms of ``payload``, for a group event. Each member sends
+    whichever its socket negotiated, so a fan-out costs two encodes rather
+    than one per recipient.
+    """
+    return {
+        'text': json.dumps(payload),
+        'bytes': msgpack.packb(payload, use_bin_type=True),
+    }
+
+
+class FramedConsumerMixin:
+    """
+    JSON or MessagePack framing for an AsyncWebsocketConsumer. Call
+    accept_framed() instead of accept(), read frames in receive_frame()
+    and send with send_frame() / send_encoded().
+    """
+
+    binary = False
+
+    async def accept_framed(self):
+        self.binary = MSGPACK_SUBPROTOCOL in self.scope.get('subprotocols', ())
+        await self.accept(subprotocol=MSGPACK_SUBPROTOCOL if self.binary else None)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            if bytes_data is not None:
+                data = msgpack.unpackb(bytes_data, raw=False)
+            else:
+                data = json.loads(text_data)
+        except ValueError:
+            return
+        if isinstance(data, dict):
+            await self.receive_frame(data)
+
+    async def receive_frame(self, data):
+        raise NotImplementedError
+
+    async def send_frame(self, payload):
+        """Encode and send to this socket only."""
+        if self.binary:
+            await self.send(bytes_data=msgpack.packb(payload, use_bin_type=True))
+        else:
+            await self.send(text_data=json.dumps(payload))
+
+    async def send_encoded(self, event):
+        """Send a group event built with encode()."""
+        if self.binary:
+            await self.send(bytes_data=event['bytes'])
+        else:
+            await self.send(text_data=event['text'])
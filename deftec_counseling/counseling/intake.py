@@ -0,0 +1,262 @@
+import codecs
+import csv
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+
+import openpyxl
+from django.conf import settings
+from django.db import transaction
+
+from . import stats, student_search
+from .models import User, normalize_service_number
+
+# Roster rows written per bulk_create
+CHUNK_SIZE = getattr(settings, 'INTAKE_CHUNK_SIZE', 500)
+
+# Accepted column headings (lowercased) -> field. The student export's
+# headings are all accepted, so an exported sheet can be re-imported.
+COLUMNS = {
+    'service number': 'service_number',
+    'service_number': 'service_number',
+    'rank': 'rank',
+    'full name': 'full_name',
+    'name': 'full_name',
+    'first name': 'first_name',
+    'first_name': 'first_name',
+    'last name': 'last_name',
+    'last_name': 'last_name',
+    'username': 'username',
+    'email': 'email',
+    'school': 'school',
+    'class': 'class_name',
+    'class_name': 'class_name',
+    'status': 'status',
+}
+
+
+# Tried in turn for each CSV line. Excel's plain "CSV" save writes the
+# Windows code page, so a line that isn't UTF-8 is read as that.
+CSV_ENCODINGS = ('utf-8', 'cp1252')
+
+
+class RosterError(Exception):
+    pass
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    duplicates: int = 0
+    # (line number, message)
+    errors: list = field(default_factory=list)
+    # Why the import stopped part way, after committing the rows before it
+    stopped: str = ''
+
+
+# =========================
+# READING
+# =========================
+def _cell(value):
+    # Spreadsheets hand back whole numbers typed into a cell as floats
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip() if value is not None else ''
+
+
+def _records(rows):
+    """Dicts keyed by field from a header row followed by value rows."""
+    rows = iter(rows)
+    try:
+        header = next(rows)
+    except StopIteration:
+        raise RosterError("The roster is empty")
+
+    fields = [COLUMNS.get(str(heading or '').strip().lower()) for heading in header]
+    if 'service_number' not in fields:
+        raise RosterError("The roster needs a 'Service Number' column")
+
+    for line, row in enumerate(rows, start=2):
+        record = {name: _cell(value) for name, value in zip(fields, row) if name}
+        record = {name: value for name, value in record.items() if value}
+        if record:
+            yield line, record
+
+
+def _decode(line, number):
+    if number == 1 and line.startswith(codecs.BOM_UTF8):
+        line = line[len(codecs.BOM_UTF8):]
+    for encoding in CSV_ENCODINGS:
+        try:
+            return line.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+    raise RosterError(f"Line {number}: the text encoding isn't recognised; save the roster as CSV UTF-8")
+
+
+def _csv_rows(uploaded):
+    """Rows of a CSV file object, decoded a line at a time."""
+    lines = (_decode(line, number) for number, line in enumerate(uploaded, start=1))
+    reader = csv.reader(lines)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            raise RosterError(f"Line {reader.line_num}: {e}")
+        yield row
+
+
+def read_roster(uploaded, filename=None):
+    """
+    Yields (line number, record) from an XLSX or CSV file object without
+    loading the whole sheet; XLSX is read in openpyxl's read-only mode.
+    """
+    name = (filename or getattr(uploaded, 'name', '') or '').lower()
+    ext = os.path.splitext(name)[1]
+
+    if ext == '.xlsx':
+        try:
+            wb = openpyxl.load_workbook(uploaded, read_only=True, data_only=True)
+        except Exception:
+            raise RosterError("Could not read the workbook")
+        try:
+            yield from _records(wb.worksheets[0].iter_rows(values_only=True))
+        finally:
+            wb.close()
+    elif ext == '.csv':
+        yield from _records(_csv_rows(uploaded))
+    else:
+        raise RosterError("Upload an .xlsx or .csv file")
+
+
+# =========================
+# IMPORT
+# =========================
+def _student(record, approve):
+    key = normalize_service_number(record['service_number'])
+    first_name = record.get('first_name', '')
+    last_name = record.get('last_name', '')
+    if not (first_name or last_name) and 'full_name' in record:
+        first_name, _, last_name = record['full_name'].partition(' ')
+
+    if approve is None:
+        approve = record.get('status', '').lower() == 'approved'
+
+    user = User(
+        username=record.get('username') or key.lower(),
+        email=record.get('email', ''),
+        role='student',
+        is_approved=approve,
+        service_number=record['service_number'],
+        service_number_key=key,
+        rank=record.get('rank'),
+        first_name=first_name[:150],
+        last_name=last_name.strip()[:150],
+        school=record.get('school'),
+        class_name=record.get('class_name'),
+    )
+    # Hashing a real password per row would dominate the import; students
+    # get one set by an admin instead
+    user.set_unusable_password()
+    return user
+
+
+def _write_chunk(users, result):
+    keys = [user.service_number_key for user in users]
+    usernames = [user.username for user in users]
+    taken_keys = set(
+        User.objects.filter(role='student', service_number_key__in=keys)
+        .values_list('service_number_key', flat=True)
+    )
+    taken_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+
+    new = []
+    for user in users:
+        if user.service_number_key in taken_keys:
+            result.duplicates += 1
+        elif user.username in taken_usernames:
+            result.errors.append((user._line, f"Username {user.username} is already taken"))
+        else:
+            new.append(user)
+    if not new:
+        return
+
+    with transaction.atomic():
+        User.objects.bulk_create(new)
+        # bulk_create skips the signals that keep these up to date
+        counts = Counter(key for user in new for key in stats.keys_for(user))
+        for key, count in counts.items():
+            stats.bump([key], count)
+        student_search.index_many([user.pk for user in new])
+    result.created += len(new)
+
+
+def import_students(records, approve=None, chunk_size=CHUNK_SIZE):
+    """
+    Create students from (line, record) pairs in chunks, skipping service
+    numbers already registered or repeated in the roster. ``approve``
+    overrides the roster's Status column. Returns an ImportResult.
+
+    Chunks commit as they fill, so a RosterError part way through the
+    file can't undo them: the rows before it are committed and the error
+    is returned in ``stopped``. It is raised only when nothing was
+    imported. Importing the fixed file again skips what is already there.
+    """
+    result = ImportResult()
+    chunk = []
+    try:
+        _collect(records, approve, chunk_size, chunk, result)
+    except RosterError as e:
+        result.stopped = str(e)
+
+    if chunk:
+        _write_chunk(chunk, result)
+    if result.stopped and not result.created:
+        raise RosterError(result.stopped)
+    return result
+
+
+def _collect(records, approve, chunk_size, chunk, result):
+    seen, seen_usernames = set(), set()
+    for line, record in records:
+        if 'service_number' not in record:
+            result.errors.append((line, "Missing service number"))
+            continue
+        user = _student(record, approve)
+        if not user.service_number_key:
+            result.errors.append((line, "Invalid service number"))
+            continue
+        if user.service_number_key in seen:
+            result.duplicates += 1
+            continue
+        if user.username in seen_usernames:
+            result.errors.append((line, f"Username {user.username} appears twice"))
+            continue
+        seen.add(user.service_number_key)
+        seen_usernames.add(user.username)
+        user._line = line
+        chunk.append(user)
+
+        if len(chunk) >= chunk_size:
+            _write_chunk(chunk, result)
+            chunk.clear()
+
+
+# =========================
+# BULK APPROVAL
+# =========================
+@transaction.atomic
+def set_approval(students, approved):
+    """
+    Approve or reject every student in the ``students`` queryset with one
+    UPDATE. Only the pending counter depends on approval, so the
+    dashboard statistics need a single adjustment. Returns the number of
+    students changed.
+    """
+    changed = students.filter(role='student', is_approved=not approved) \
+        .order_by().update(is_approved=approved)
+    if changed:
+        stats.bump([('pending', '')], -changed if approved else changed)
+    return changed
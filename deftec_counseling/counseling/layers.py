@@ -0,0 +1,349 @@
+import asyncio
+import atexit
+import errno
+import os
+import random
+import socket
+import string
+import tempfile
+import time
+from collections import Counter
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer
+
+# Largest datagram we try to send; the kernel may cap it lower (wmem_max)
+MAX_DATAGRAM = 1024 * 1024
+# How long a listing of peer sockets is reused before the directory is read again
+PEER_REFRESH = 1.0
+
+
+def _random_suffix(length=12):
+    return ''.join(random.choice(string.ascii_letters) for _ in range(length))
+
+
+def _pack(payload):
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def _unpack(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+# =========================
+# UNIX SOCKET CHANNEL LAYER
+# =========================
+class UnixSocketChannelLayer(InMemoryChannelLayer):
+    """
+    Channel layer shared by several worker processes on one host, with no
+    broker. Each process keeps its own queues and group members like the
+    in-memory layer and binds a Unix datagram socket in ``socket_dir``:
+
+    * specific channel names carry the owning process's id, so send()
+      goes straight to that process's socket;
+    * group_send() delivers to local members and sends the message once to
+      every other process, which delivers to its own members.
+
+    A message must fit in one datagram (about 200KB with default kernel
+    limits). Sends to a process whose socket is full raise ChannelFull;
+    group sends drop and count instead, as Channels expects.
+    """
+
+    def __init__(self, socket_dir=None, **kwargs):
+        super().__init__(**kwargs)
+        self.socket_dir = socket_dir or os.path.join(tempfile.gettempdir(), 'deftec-channels')
+        os.makedirs(self.socket_dir, exist_ok=True)
+        self.worker_id = f'w{os.getpid()}-{_random_suffix(6)}'
+        self.path = self._socket_path(self.worker_id)
+        self.stats = Counter()
+
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        self._try_setsockopt(self._sender, socket.SO_SNDBUF, MAX_DATAGRAM)
+        self._receiver = None
+        self._loop = None
+        self._peers = []
+        self._peers_read = 0.0
+
+    extensions = ['groups', 'flush']
+
+    def _socket_path(self, worker_id):
+        return os.path.join(self.socket_dir, f'{worker_id}.sock')
+
+    @staticmethod
+    def _try_setsockopt(sock, option, value):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, value)
+        except OSError:
+            pass
+
+    def _owner(self, channel):
+        """Worker id of the process that receives ``channel``; None for general channels."""
+        if '!' not in channel:
+            return None
+        return channel.split('!', 1)[0].rsplit('.', 1)[-1]
+
+    def _on_owner_loop(self):
+        try:
+            return self._loop is not None and asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    # -------------------------
+    # Receiving socket
+    # -------------------------
+    def _listen(self):
+        """Bind our socket and read it on the running loop."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        if self._loop is not None and not self._loop.is_closed():
+            raise RuntimeError("UnixSocketChannelLayer is already receiving on another event loop")
+
+        if self._receiver is None:
+            self._receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._receiver.setblocking(False)
+            self._try_setsockopt(self._receiver, socket.SO_RCVBUF, 8 * MAX_DATAGRAM)
+            self._receiver.bind(self.path)
+            atexit.register(self._unlink)
+        # Queues made on a loop that has since closed can't be awaited
+        self.channels = {}
+        self._loop = loop
+        loop.add_reader(self._receiver.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data, sender = self._receiver.recvfrom(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                payload = _unpack(data)
+            except Exception:
+                self.stats['malformed'] += 1
+                continue
+
+            if 'stats' in payload:
+                self._reply_stats(payload['stats'])
+            elif 'group' in payload:
+                self._deliver_group(payload['group'], payload['message'])
+            else:
+                try:
+                    self._put(payload['channel'], payload['message'])
+                except ChannelFull:
+                    pass
+
+    def _unlink(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    # -------------------------
+    # Local delivery
+    # -------------------------
+    def _put(self, channel, message):
+        queue = self.channels.setdefault(channel, asyncio.Queue(maxsize=self.get_capacity(channel)))
+        try:
+            queue.put_nowait((time.time() + self.expiry, message))
+        except asyncio.QueueFull:
+            self.stats['full'] += 1
+            raise ChannelFull(channel)
+        self.stats['delivered'] += 1
+
+    def _deliver_group(self, group, message):
+        for channel in list(self.groups.get(group, ())):
+            try:
+                # Each consumer gets its own copy, as with send()
+                self._put(channel, _unpack(_pack(message)))
+            except ChannelFull:
+                pass
+
+    # -------------------------
+    # Remote delivery
+    # -------------------------
+    def _peer_paths(self):
+        now = time.monotonic()
+        if now - self._peers_read > PEER_REFRESH:
+            try:
+                names = os.listdir(self.socket_dir)
+            except FileNotFoundError:
+                names = []
+            self._peers = [
+                os.path.join(self.socket_dir, name) for name in names
+                if name.endswith('.sock') and os.path.join(self.socket_dir, name) != self.path
+            ]
+            self._peers_read = now
+        return self._peers
+
+    def _transmit(self, path, data):
+        """
+        Send one datagram. Returns False if the receiver's buffer is full;
+        sockets left behind by dead processes are removed.
+        """
+        try:
+            self._sender.sendto(data, path)
+        except (BlockingIOError, InterruptedError):
+            self.stats['full'] += 1
+            return False
+        except (ConnectionRefusedError, FileNotFoundError):
+            self.stats['undeliverable'] += 1
+            if path != self.path:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                self._peers_read = 0.0
+            return True
+        except OSError as e:
+            if e.errno == errno.EMSGSIZE:
+                self.stats['oversize'] += 1
+                raise ValueError(f"Message too large for a datagram ({len(data)} bytes)")
+            raise
+        self.stats['transmitted'] += 1
+        return True
+
+    # -------------------------
+    # Channel layer API
+    # -------------------------
+    async def new_channel(self, prefix='specific.'):
+        self._listen()
+        return f'{prefix}.{self.worker_id}!{_random_suffix()}'
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        assert '__asgi_channel__' not in message
+        self.stats['sent'] += 1
+
+        owner = self._owner(channel)
+        if owner is None or owner == self.worker_id:
+            if self._on_owner_loop():
+                self._put(channel, _unpack(_pack(message)))
+                return
+            # From another thread's loop: go through our own socket so the
+            # queue is only ever touched on the loop that reads it
+            path = self.path
+        else:
+            path = self._socket_path(owner)
+
+        if not self._transmit(path, _pack({'channel': channel, 'message': message})):
+            raise ChannelFull(channel)
+
+    async def receive(self, channel):
+        self._listen()
+        message = await super().receive(channel)
+        self.stats['received'] += 1
+        return message
+
+    async def group_add(self, group, channel):
+        self._listen()
+        await super().group_add(group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        self.require_valid_group_name(group)
+        self.stats['group_sent'] += 1
+        # Encoded once for every process
+        data = _pack({'group': group, 'message': message})
+
+        if self._on_owner_loop():
+            self._clean_expired()
+            self._deliver_group(group, message)
+        elif self._receiver is not None:
+            self._transmit(self.path, data)
+        for path in self._peer_paths():
+            self._transmit(path, data)
+
+    async def flush(self):
+        await super().flush()
+        self.stats.clear()
+
+    async def close(self):
+        if self._loop is not None and not self._loop.is_closed() and self._receiver is not None:
+            self._loop.remove_reader(self._receiver.fileno())
+        if self._receiver is not None:
+            self._receiver.close()
+            self._receiver = None
+            self._unlink()
+        self._loop = None
+
+    # -------------------------
+    # Expiry
+    # -------------------------
+    def _clean_expired(self):
+        # Same as the in-memory layer, counting what expires
+        now = time.time()
+        for channel, queue in list(self.channels.items()):
+            while not queue.empty() and queue._queue[0][0] < now:
+                queue.get_nowait()
+                self.stats['expired'] += 1
+                self._remove_from_groups(channel)
+                if queue.empty():
+                    self.channels.pop(channel, None)
+
+        timeout = int(now) - self.group_expiry
+        for channels in self.groups.values():
+            for name, joined in list(channels.items()):
+                if joined and joined < timeout:
+                    channels.pop(name, None)
+                    self.stats['group_expired'] += 1
+
+    # -------------------------
+    # Metrics
+    # -------------------------
+    def metrics(self):
+        """Counters since start plus current queue and group sizes for this process."""
+        queued = {channel: queue.qsize() for channel, queue in self.channels.items()}
+        fullest = max(
+            (size / self.get_capacity(channel) for channel, size in queued.items()),
+            default=0.0,
+        )
+        return {
+            'worker': self.worker_id,
+            'pid': os.getpid(),
+            'channels': len(queued),
+            'queued': sum(queued.values()),
+            'fullest': round(fullest, 3),
+            'groups': len(self.groups),
+            'memberships': sum(len(members) for members in self.groups.values()),
+            **self.stats,
+        }
+
+    def _reply_stats(self, path):
+        self._clean_expired()
+        try:
+            self._sender.sendto(_pack(self.metrics()), path)
+        except OSError:
+            pass
+
+
+def collect_metrics(socket_dir, timeout=1.0):
+    """Ask every process listening in ``socket_dir`` for its metrics()."""
+    reply_path = os.path.join(socket_dir, f'stats-{os.getpid()}-{_random_suffix(6)}')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(reply_path)
+    sock.settimeout(timeout)
+    try:
+        asked = 0
+        for name in os.listdir(socket_dir):
+            if not name.endswith('.sock'):
+                continue
+            try:
+                sock.sendto(_pack({'stats': reply_path}), os.path.join(socket_dir, name))
+                asked += 1
+            except OSError:
+                continue
+
+        replies = []
+        deadline = time.monotonic() + timeout
+        while len(replies) < asked and time.monotonic() < deadline:
+            try:
+                replies.append(_unpack(sock.recv(MAX_DATAGRAM)))
+            except socket.timeout:
+                break
+        return replies
+    finally:
+        sock.close()
+        os.unlink(reply_path)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_test_environment
+
+from counseling.benchmarks import http, report
+
+COLUMNS = ['view', 'status', 'median_ms', 'p95_ms', 'queries', 'peak_memory_kb', 'response_kb']
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the main views with the test client against the configured database "
+        "(fill it with seed_data first), recording query counts and peak memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help="Timed requests per view.")
+        parser.add_argument(
+            '--view', action='append', choices=[name for name, *_ in http.VIEWS],
+            help="View to measure; repeat for several (default: all).",
+        )
+        parser.add_argument('--cold', action='store_true', help="Clear the cache before every request.")
+        parser.add_argument('--output', default='bench-views.json', help="Where to write the JSON results.")
+        parser.add_argument('--compare', help="Earlier results file to compare against.")
+
+    def handle(self, *args, **options):
+        # Lets the test client's 'testserver' host through ALLOWED_HOSTS
+        setup_test_environment()
+        params = {'repeat': options['repeat'], 'cold': options['cold']}
+        results = http.run(views=options['view'], **params)
+
+        report.write(options['output'], 'views', params, results)
+        self.stdout.write('\t'.join(COLUMNS))
+        for row in results:
+            if 'skipped' in row:
+                self.stdout.write(f"{row['view']}\tskipped: {row['skipped']}")
+                continue
+            self.stdout.write('\t'.join(str(row[column]) for column in COLUMNS))
+
+        if options['compare']:
+            for line in report.compare(
+                options['compare'], results, key=['view'],
+                metrics=['median_ms', 'p95_ms', 'queries', 'peak_memory_kb'],
+            ):
+                self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from counseling.benchmarks import report, websocket
+
+COLUMNS = [
+    'layer', 'framing', 'connections', 'delivered', 'expected',
+    'p50_ms', 'p99_ms', 'throughput_per_s', 'memory_per_connection_kb',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure chat fan-out latency, throughput and memory per connection for "
+        "each channel layer, against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=10)
+        parser.add_argument('--clients', type=int, default=4, help="Sockets per room.")
+        parser.add_argument('--messages', type=int, default=20, help="Burst size per room.")
+        parser.add_argument(
+            '--layer', action='append', choices=sorted(websocket.LAYERS),
+            help="Channel layer to measure; repeat for several (default: all).",
+        )
+        parser.add_argument(
+            '--framing', action='append', choices=websocket.FRAMINGS,
+            help="Wire format to measure; repeat for several (default: all).",
+        )
+        parser.add_argument('--output', default='bench-websockets.json', help="Where to write the JSON results.")
+        parser.add_argument('--compare', help="Earlier results file to compare against.")
+
+    def handle(self, *args, **options):
+        params = {key: options[key] for key in ('rooms', 'clients', 'messages')}
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = websocket.run(layers=options['layer'], framings=options['framing'], **params)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report.write(options['output'], 'websockets', params, results)
+        self.stdout.write('\t'.join(COLUMNS))
+        for row in results:
+            self.stdout.write('\t'.join(str(row[column]) for column in COLUMNS))
+
+        if options['compare']:
+            for line in report.compare(
+                options['compare'], results, key=['layer', 'framing'],
+                metrics=['p50_ms', 'p99_ms', 'throughput_per_s', 'memory_per_connection_kb'],
+            ):
+                self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
@@ -0,0 +1,30 @@
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+
+from counseling.layers import UnixSocketChannelLayer, collect_metrics
+
+COLUMNS = [
+    'pid', 'channels', 'queued', 'fullest', 'memberships',
+    'sent', 'received', 'group_sent', 'full', 'expired', 'undeliverable',
+]
+
+
+class Command(BaseCommand):
+    help = "Show queue, capacity and expiry metrics from every worker on the channel layer."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--timeout', type=float, default=1.0,
+            help="Seconds to wait for workers to answer.",
+        )
+
+    def handle(self, *args, **options):
+        layer = get_channel_layer()
+        if not isinstance(layer, UnixSocketChannelLayer):
+            raise CommandError("The default channel layer is not a UnixSocketChannelLayer")
+
+        replies = sorted(collect_metrics(layer.socket_dir, options['timeout']), key=lambda r: r['pid'])
+        self.stdout.write('\t'.join(COLUMNS))
+        for reply in replies:
+            self.stdout.write('\t'.join(str(reply.get(column, 0)) for column in COLUMNS))
+        self.stdout.write(self.style.SUCCESS(f"{len(replies)} worker(s) answered"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from counseling import intake
+
+
+class Command(BaseCommand):
+    help = "Create students from an XLSX or CSV roster, skipping service numbers already registered."
+
+    def add_arguments(self, parser):
+        parser.add_argument('roster', help="Path to an .xlsx or .csv file.")
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--approve', action='store_true', help="Approve everyone imported.")
+        group.add_argument('--pending', action='store_true', help="Leave everyone imported pending.")
+
+    def handle(self, *args, **options):
+        approve = True if options['approve'] else False if options['pending'] else None
+        try:
+            with open(options['roster'], 'rb') as f:
+                result = intake.import_students(intake.read_roster(f), approve=approve)
+        except (OSError, intake.RosterError) as e:
+            raise CommandError(str(e))
+
+        for line, error in result.errors:
+            self.stderr.write(f"Line {line}: {error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result.created} student(s), skipped {result.duplicates} duplicate(s)"
+        ))
+        if result.stopped:
+            raise CommandError(
+                f"Stopped: {result.stopped}. The rows before it were imported; "
+                "fix the file and import it again to add the rest."
+            )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from counseling import sync
+
+
+class Command(BaseCommand):
+    help = "Delete appointment tombstones older than APPOINTMENT_TOMBSTONE_DAYS."
+
+    def handle(self, *args, **options):
+        count = sync.prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {count} tombstone(s)"))
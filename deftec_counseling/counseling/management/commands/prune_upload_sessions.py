@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from counseling import uploads
+
+
+class Command(BaseCommand):
+    help = "Delete chunked book uploads idle for longer than BOOK_UPLOAD_SESSION_DAYS."
+
+    def handle(self, *args, **options):
+        count = uploads.prune_sessions()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {count} upload(s)"))
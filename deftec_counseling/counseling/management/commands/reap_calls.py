@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from counseling import calls
+
+
+class Command(BaseCommand):
+    help = "Close calls that rang past CALL_RING_TIMEOUT or were left open by a dead process."
+
+    def handle(self, *args, **options):
+        count = calls.reap()
+        self.stdout.write(self.style.SUCCESS(f"Closed {count} stale call(s)"))
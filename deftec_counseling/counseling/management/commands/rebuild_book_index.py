@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from counseling import search
+
+
+class Command(BaseCommand):
+    help = "Re-extract every book's text and rebuild the full-text search index."
+
+    def handle(self, *args, **options):
+        if not search.available():
+            self.stdout.write(self.style.WARNING("Full-text search needs SQLite FTS5; nothing to do"))
+            return
+        count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} book(s)"))
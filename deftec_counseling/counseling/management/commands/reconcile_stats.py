@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from counseling import stats
+
+
+class Command(BaseCommand):
+    help = "Recount the admin dashboard statistics from the source tables."
+
+    def handle(self, *args, **options):
+        totals = stats.reconcile()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(totals)} counter(s)"))
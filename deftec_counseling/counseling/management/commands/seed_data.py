@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from counseling.benchmarks import seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-create synthetic students, counselors, appointments, chat messages "
+        "and call logs for benchmarking. Seeded users are named 'seed-...'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1000)
+        parser.add_argument('--counselors', type=int, default=50)
+        parser.add_argument('--specializations', type=int, default=10)
+        parser.add_argument('--appointments-per-student', type=int, default=5)
+        parser.add_argument('--messages-per-appointment', type=int, default=10)
+        parser.add_argument('--calls-per-appointment', type=int, default=1)
+        parser.add_argument('--password', default='password', help="Password for every seeded user.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for repeatable data.")
+        parser.add_argument(
+            '--clear', action='store_true',
+            help="Delete data from an earlier run first.",
+        )
+
+    def handle(self, *args, **options):
+        if options['specializations'] < 1:
+            raise CommandError("At least one specialization is needed")
+
+        if options['clear']:
+            seed.clear()
+        elif seed.User.objects.filter(username__startswith=seed.PREFIX).exists():
+            raise CommandError("Seeded data already exists; pass --clear to replace it")
+
+        counts = seed.seed(
+            students=options['students'],
+            counselors=options['counselors'],
+            specializations=options['specializations'],
+            appointments_per_student=options['appointments_per_student'],
+            messages_per_appointment=options['messages_per_appointment'],
+            calls_per_appointment=options['calls_per_appointment'],
+            password=options['password'],
+            rng_seed=options['seed'],
+        )
+        for model, count in counts.items():
+            self.stdout.write(f"{count:>10} {model}")
+        self.stdout.write(self.style.SUCCESS("Seeded"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from counseling import presence
+
+
+class Command(BaseCommand):
+    help = "Mark users offline whose last heartbeat is older than PRESENCE_TTL."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttl', type=int, default=presence.TTL,
+            help="Seconds without a heartbeat before a user is offline.",
+        )
+
+    def handle(self, *args, **options):
+        count = presence.sweep(ttl=options['ttl'])
+        self.stdout.write(self.style.SUCCESS(f"Marked {count} user(s) offline"))
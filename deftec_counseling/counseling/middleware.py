@@ -1,10 +1,13 @@
-from .models import UserStatus
-from django.utils import timezone
+from . import presence
 
 
 class OnlineNowMiddleware:
     """
     Middleware to update the user's online status automatically.
+
+    Requests only record a heartbeat; counseling.presence coalesces them
+    into at most one UserStatus write per PRESENCE_WRITE_WINDOW and the
+    sweep_presence command marks idle users offline.
     """
 
     def __init__(self, get_response):
@@ -13,14 +16,6 @@ class OnlineNowMiddleware:
     def __call__(self, request):
         # Only track authenticated users
         if request.user.is_authenticated and request.user.role == 'counselor':
-            # Get or create status object
-            status, _ = UserStatus.objects.get_or_create(user=request.user)
-            status.is_online = True
-            status.last_seen = timezone.now()
-            status.save()
-
-        response = self.get_response(request)
+            presence.heartbeat(request.user.id)
 
-        # Optional: mark offline after response if you want
-        # But better to use a periodic task or JavaScript ping
-        return response
+        return self.get_response(request)
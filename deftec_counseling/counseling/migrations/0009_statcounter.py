@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:51
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    # A frozen copy of counseling.stats.reconcile as it was here, so later
+    # changes to the live code can't change what this migration does
+    User = apps.get_model('counseling', 'User')
+    Appointment = apps.get_model('counseling', 'Appointment')
+    StatCounter = apps.get_model('counseling', 'StatCounter')
+
+    totals = Counter()
+    rows = User.objects.values('role', 'is_approved', 'school', 'class_name') \
+        .annotate(count=Count('id')).order_by()
+    for row in rows:
+        keys = [('role', row['role'] or '')]
+        if row['role'] == 'student':
+            if not row['is_approved']:
+                keys.append(('pending', ''))
+            keys.append(('school', row['school'] or ''))
+            keys.append(('class', row['class_name'] or ''))
+        for key in keys:
+            totals[key] += row['count']
+    totals[('appointments', '')] = Appointment.objects.count()
+
+    StatCounter.objects.all().delete()
+    StatCounter.objects.bulk_create([
+        StatCounter(group=group, key=key, value=value)
+        for (group, key), value in totals.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('counseling', '0008_workinghours_unique_counselor_slot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.CharField(choices=[('role', 'Users by role'), ('pending', 'Pending students'), ('school', 'Students by school'), ('class', 'Students by class'), ('appointments', 'Appointments')], max_length=20)),
+                ('key', models.CharField(blank=True, max_length=100)),
+                ('value', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('group', 'key'), name='unique_stat_counter')],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS counseling_book_fts "
+        "USING fts5(title, body, tokenize = 'porter unicode61 remove_diacritics 2', "
+        # Indexed 2- and 3-letter prefixes keep search-as-you-type fast
+        "prefix = '2 3')"
+    )
+    # ORDER BY rank then lets FTS5 hand rows back already sorted, so LIMIT
+    # stops early and snippet() only runs for the page being shown
+    schema_editor.execute(
+        "INSERT INTO counseling_book_fts (counseling_book_fts, rank) "
+        "VALUES ('rank', 'bm25(10.0, 1.0)')"
+    )
+    # Titles now; run `manage.py rebuild_book_index` to add file text
+    schema_editor.execute(
+        "INSERT INTO counseling_book_fts (rowid, title, body) "
+        "SELECT id, title, '' FROM counseling_book"
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS counseling_book_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('counseling', '0012_book_sha256_uploadsession'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
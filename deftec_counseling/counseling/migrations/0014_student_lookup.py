@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:05
+
+import re
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def normalize_service_number(value):
+    # Frozen copy of counseling.models.normalize_service_number
+    return re.sub(r'[^0-9A-Z]', '', (value or '').upper())
+
+
+def populate_keys(apps, schema_editor):
+    User = apps.get_model('counseling', 'User')
+    users = list(User.objects.exclude(service_number__isnull=True).only('id', 'service_number'))
+    for user in users:
+        user.service_number_key = normalize_service_number(user.service_number)
+    User.objects.bulk_update(users, ['service_number_key'], batch_size=500)
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS counseling_student_fts "
+        "USING fts5(service_number, name, tokenize = 'trigram')"
+    )
+    schema_editor.execute(
+        "INSERT INTO counseling_student_fts (rowid, service_number, name) "
+        "SELECT id, service_number_key, "
+        "trim(first_name || ' ' || last_name || ' ' || username) "
+        "FROM counseling_user WHERE role = 'student'"
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS counseling_student_fts")
+
+
+def populate_counters(apps, schema_editor):
+    # Adds the new per-rank counters: one per rank a student holds
+    User = apps.get_model('counseling', 'User')
+    StatCounter = apps.get_model('counseling', 'StatCounter')
+    ranks = User.objects.filter(role='student').exclude(rank__isnull=True).exclude(rank='') \
+        .values('rank').annotate(count=Count('id')).order_by()
+    StatCounter.objects.filter(group='rank').delete()
+    StatCounter.objects.bulk_create([
+        StatCounter(group='rank', key=row['rank'], value=row['count']) for row in ranks
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('counseling', '0013_book_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='service_number_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='statcounter',
+            name='group',
+            field=models.CharField(choices=[('role', 'Users by role'), ('pending', 'Pending students'), ('school', 'Students by school'), ('class', 'Students by class'), ('appointments', 'Appointments'), ('rank', 'Students by rank')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'service_number_key'], name='counseling__role_f7b244_idx'),
+        ),
+        migrations.RunPython(populate_keys, migrations.RunPython.noop),
+        migrations.RunPython(create_index, drop_index),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:07
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_answered_at(apps, schema_editor):
+    # Calls used to be logged as answered the moment they started
+    CallLog = apps.get_model('counseling', 'CallLog')
+    CallLog.objects.filter(status__in=['ongoing', 'completed']).update(answered_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('counseling', '0014_student_lookup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calllog',
+            name='answered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='calllog',
+            name='status',
+            field=models.CharField(choices=[('ringing', 'Ringing'), ('ongoing', 'Ongoing'), ('completed', 'Completed'), ('missed', 'Missed')], default='ongoing', max_length=20),
+        ),
+        migrations.RunPython(backfill_answered_at, migrations.RunPython.noop),
+    ]
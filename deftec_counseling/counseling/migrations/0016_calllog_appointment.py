@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('counseling', '0015_call_lifecycle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calllog',
+            name='appointment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='calls', to='counseling.appointment'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('counseling', '0016_calllog_appointment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PresenceConnection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel_name', models.CharField(max_length=255, unique=True)),
+                ('pid', models.PositiveIntegerField()),
+                ('opened_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='presence_connections', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
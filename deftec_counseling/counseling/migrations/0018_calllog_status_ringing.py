@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('counseling', '0017_presence_connection'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='calllog',
+            name='status',
+            field=models.CharField(choices=[('ringing', 'Ringing'), ('ongoing', 'Ongoing'), ('completed', 'Completed'), ('missed', 'Missed')], default='ringing', max_length=20),
+        ),
+    ]
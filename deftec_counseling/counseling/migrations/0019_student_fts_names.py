@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:54
+
+from django.db import migrations
+
+# Frozen copy of counseling.student_search._NAME_SQL
+NAME_SQL = (
+    "substr("
+    "coalesce(' ' || nullif(first_name, ''), '') || "
+    "coalesce(' ' || nullif(last_name, ''), '') || "
+    "coalesce(' ' || nullif(username, ''), ''), 2)"
+)
+
+
+def reindex_names(apps, schema_editor):
+    # Rows indexed in bulk had a double space where a name part was empty,
+    # so they tokenized differently from rows indexed one at a time
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DELETE FROM counseling_student_fts")
+    schema_editor.execute(
+        "INSERT INTO counseling_student_fts (rowid, service_number, name) "
+        f"SELECT id, service_number_key, {NAME_SQL} "
+        "FROM counseling_user WHERE role = 'student'"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('counseling', '0018_calllog_status_ringing'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex_names, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,6 @@
+import re
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
@@ -5,6 +8,10 @@ from django.conf import settings
 
 
 
+def normalize_service_number(value):
+    return re.sub(r'[^0-9A-Z]', '', (value or '').upper())
+
+
 # =========================
 # USER
 # =========================
@@ -27,10 +34,26 @@ class User(AbstractUser):
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
     is_approved = models.BooleanField(default=False)
 
+    # service_number uppercased with separators removed, for indexed
+    # prefix lookups ("sn-00" finds "SN0012")
+    service_number_key = models.CharField(max_length=50, blank=True, default='', editable=False)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # manage_students ordering / keyset pagination
+            models.Index(fields=['role', 'rank', 'service_number', 'first_name', 'last_name', 'id']),
+            # student service number autocomplete
+            models.Index(fields=['role', 'service_number_key']),
+        ]
+
     def save(self, *args, **kwargs):
         # Auto-approve non-students
         if self.role in ['admin', 'counselor']:
             self.is_approved = True
+        self.service_number_key = normalize_service_number(self.service_number)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'service_number' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'service_number_key'}
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -86,18 +109,80 @@ class Appointment(models.Model):
     date = models.DateField()
     time = models.TimeField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-date', '-time']
         indexes = [
             models.Index(fields=['status']),
-            models.Index(fields=['date']),
+            models.Index(fields=['date', 'time']),
+            models.Index(fields=['counselor', 'updated_at']),
+        ]
+        constraints = [
+            # One booking per counselor per slot; also serves as the
+            # (counselor, date, time) index for availability lookups
+            models.UniqueConstraint(
+                fields=['counselor', 'date', 'time'],
+                name='unique_counselor_slot',
+                violation_error_message="That slot is already booked.",
+            ),
         ]
 
     def __str__(self):
         return f"{self.student} with {self.counselor} on {self.date}"
 
 
+class AppointmentTombstone(models.Model):
+    """
+    Left behind when an appointment is deleted or moved to another
+    counselor, so delta polling can tell the old counselor to drop it.
+    """
+    # Plain ids rather than foreign keys: tombstones are written while the
+    # counselor may be in the middle of being deleted.
+    appointment_id = models.BigIntegerField()
+    counselor_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['counselor_id', 'deleted_at']),
+        ]
+
+    def __str__(self):
+        return f"Appointment {self.appointment_id} removed for counselor {self.counselor_id}"
+
+
+# =========================
+# WORKING HOURS
+# =========================
+class WorkingHours(models.Model):
+    WEEKDAY_CHOICES = (
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    )
+
+    counselor = models.ForeignKey(
+        User,
+        related_name='working_hours',
+        on_delete=models.CASCADE
+    )
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    class Meta:
+        ordering = ['counselor', 'weekday', 'start_time']
+        verbose_name_plural = 'working hours'
+
+    def __str__(self):
+        return f"{self.counselor} {self.get_weekday_display()} {self.start_time}-{self.end_time}"
+
+
 # =========================
 # CHAT
 # =========================
@@ -105,10 +190,13 @@ class ChatMessage(models.Model):
     appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE)
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     message = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['appointment', 'timestamp']),
+        ]
 
     def __str__(self):
         return f"{self.sender}: {self.message[:30]}"
@@ -126,6 +214,20 @@ class UserStatus(models.Model):
     def __str__(self):
         return f"{self.user.username} - {'Online' if self.is_online else 'Offline'}"
 
+
+class PresenceConnection(models.Model):
+    """One open chat socket, so presence is counted across worker processes."""
+    channel_name = models.CharField(max_length=255, unique=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='presence_connections'
+    )
+    # Worker process holding the socket; rows of workers that died are pruned
+    pid = models.PositiveIntegerField()
+    opened_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user_id} on {self.channel_name}"
+
 # =========================
 # CALL LOGS
 # =========================
@@ -135,7 +237,10 @@ class CallLog(models.Model):
         ('video', 'Video'),
     )
 
+    # ringing -> ongoing (answered) -> completed, or ringing -> missed;
+    # driven by counseling.calls
     STATUS_CHOICES = (
+        ('ringing', 'Ringing'),
         ('ongoing', 'Ongoing'),
         ('completed', 'Completed'),
         ('missed', 'Missed'),
@@ -151,11 +256,19 @@ class CallLog(models.Model):
         related_name='calls_received',
         on_delete=models.CASCADE
     )
+    appointment = models.ForeignKey(
+        Appointment,
+        related_name='calls',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
 
     call_type = models.CharField(max_length=10, choices=CALL_TYPE_CHOICES)
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ongoing')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ringing')
 
     started_at = models.DateTimeField(default=timezone.now)
+    answered_at = models.DateTimeField(null=True, blank=True)
     ended_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
@@ -163,16 +276,19 @@ class CallLog(models.Model):
         indexes = [
             models.Index(fields=['status']),
             models.Index(fields=['call_type']),
+            models.Index(fields=['started_at']),
         ]
 
     @property
     def duration(self):
         """
-        Returns duration in seconds.
-        Works for completed AND ongoing calls.
+        Returns talk time in seconds, counted from when the call was answered.
+        Works for completed AND ongoing calls; unanswered calls are 0.
         """
+        if self.answered_at is None:
+            return 0
         end_time = self.ended_at or timezone.now()
-        return int((end_time - self.started_at).total_seconds())
+        return int((end_time - self.answered_at).total_seconds())
 
     def __str__(self):
         return f"{self.caller} → {self.receiver} ({self.call_type}) [{self.status}]"
@@ -184,9 +300,58 @@ class CallLog(models.Model):
 class Book(models.Model):
     title = models.CharField(max_length=255)
     file = models.FileField(upload_to='books/')
+    # SHA-256 of the file; books with the same content share one stored file
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
     uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.title
 
+
+class UploadSession(models.Model):
+    """
+    A chunked book upload in progress. Chunks are appended to a partial
+    file until ``received`` reaches ``size``, then it becomes a Book.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    title = models.CharField(max_length=255)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+
+# =========================
+# DASHBOARD STATISTICS
+# =========================
+class StatCounter(models.Model):
+    """
+    Precomputed admin dashboard numbers, kept current by signals in
+    counseling.signals and rebuilt by the reconcile_stats command.
+    """
+    GROUP_CHOICES = (
+        ('role', 'Users by role'),
+        ('pending', 'Pending students'),
+        ('school', 'Students by school'),
+        ('class', 'Students by class'),
+        ('appointments', 'Appointments'),
+        ('rank', 'Students by rank'),
+    )
+
+    group = models.CharField(max_length=20, choices=GROUP_CHOICES)
+    key = models.CharField(max_length=100, blank=True)
+    value = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'key'], name='unique_stat_counter'),
+        ]
+
+    def __str__(self):
+        return f"{self.group}:{self.key} = {self.value}"
@@ -0,0 +1,190 @@
+import base64
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+
+PAGE_SIZE = getattr(settings, 'ADMIN_PAGE_SIZE', 50)
+
+
+# =========================
+# CURSORS
+# =========================
+# Temporal values are tagged so they decode back to the same type.
+# DjangoJSONEncoder would cut them to milliseconds, and a cursor that no
+# longer equals its row repeats or skips rows sharing the millisecond.
+_TEMPORAL = {'$dt': datetime.datetime, '$d': datetime.date, '$t': datetime.time}
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        for tag, kind in _TEMPORAL.items():
+            # datetime is a date subclass, so the exact type decides
+            if type(o) is kind:
+                return {tag: o.isoformat()}
+        return super().default(o)
+
+
+def _decode_temporal(obj):
+    if len(obj) == 1:
+        tag, value = next(iter(obj.items()))
+        if tag in _TEMPORAL and isinstance(value, str):
+            return _TEMPORAL[tag].fromisoformat(value)
+    return obj
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, cls=_CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Returns the list of key values, or None for a garbled cursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()), object_hook=_decode_temporal)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+# =========================
+# ORDERING / SEEK FILTERS
+# =========================
+def _parse_keys(keys):
+    """['-date', 'id'] -> [('date', True), ('id', False)]"""
+    return [(k.lstrip('-'), k.startswith('-')) for k in keys]
+
+
+def _order_by(keys, reverse=False):
+    # NULLs always sort as the smallest value so the seek filters below
+    # agree with the ORDER BY on every database.
+    ordering = []
+    for field, desc in keys:
+        if desc != reverse:
+            ordering.append(F(field).desc(nulls_last=True))
+        else:
+            ordering.append(F(field).asc(nulls_first=True))
+    return ordering
+
+
+def _greater(field, value):
+    if value is None:
+        return Q(**{f'{field}__isnull': False})
+    return Q(**{f'{field}__gt': value})
+
+
+def _less(field, value):
+    if value is None:
+        return Q(pk__in=[])
+    return Q(**{f'{field}__lt': value}) | Q(**{f'{field}__isnull': True})
+
+
+def _equal(field, value):
+    if value is None:
+        return Q(**{f'{field}__isnull': True})
+    return Q(**{field: value})
+
+
+def _seek(keys, values, reverse=False):
+    """Rows strictly after ``values`` in the (optionally reversed) ordering."""
+    condition = Q(pk__in=[])
+    prefix = Q()
+    for (field, desc), value in zip(keys, values):
+        forward = desc == reverse
+        step = _greater(field, value) if forward else _less(field, value)
+        condition |= prefix & step
+        prefix &= _equal(field, value)
+    return condition
+
+
+def _seek_filter(queryset, keys, values, reverse=False):
+    """
+    ``queryset`` narrowed by _seek(), or None when a cursor that decoded
+    fine holds values its fields can't take (a string for an id, say).
+    """
+    try:
+        return queryset.filter(_seek(keys, values, reverse))
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+# =========================
+# PAGE
+# =========================
+class KeysetPage:
+    """
+    One page of a queryset ordered by ``keys``, found by seeking past the
+    cursor row instead of OFFSET and without COUNT(*). The last key must be
+    unique (normally 'id' or '-id') so the ordering is total.
+    """
+
+    def __init__(self, request, queryset, keys, per_page=PAGE_SIZE):
+        self.request = request
+        self.keys = _parse_keys(keys)
+        self.per_page = per_page
+
+        after = request.GET.get('after')
+        before = request.GET.get('before')
+        after = decode_cursor(after, len(self.keys)) if after else None
+        before = decode_cursor(before, len(self.keys)) if before else None
+
+        # A cursor that doesn't fit the fields is ignored like a garbled one
+        seek = None
+        if before is not None:
+            seek = _seek_filter(queryset, self.keys, before, reverse=True)
+            if seek is None:
+                before = None
+        if before is None and after is not None:
+            seek = _seek_filter(queryset, self.keys, after)
+            if seek is None:
+                after = None
+
+        if before is not None:
+            rows = list(seek.order_by(*_order_by(self.keys, reverse=True))[:per_page + 1])
+            self.has_previous = len(rows) > per_page
+            self.has_next = True
+            rows = rows[:per_page]
+            rows.reverse()
+        else:
+            if after is not None:
+                queryset = seek
+            rows = list(queryset.order_by(*_order_by(self.keys))[:per_page + 1])
+            self.has_next = len(rows) > per_page
+            self.has_previous = after is not None
+            rows = rows[:per_page]
+
+        self.object_list = rows
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _cursor(self, obj):
+        return encode_cursor([getattr(obj, field) for field, _ in self.keys])
+
+    def _url(self, param, obj):
+        query = self.request.GET.copy()
+        query.pop('after', None)
+        query.pop('before', None)
+        query[param] = self._cursor(obj)
+        return f'?{query.urlencode()}'
+
+    @property
+    def next_url(self):
+        if self.has_next and self.object_list:
+            return self._url('after', self.object_list[-1])
+        return None
+
+    @property
+    def previous_url(self):
+        if self.has_previous and self.object_list:
+            return self._url('before', self.object_list[0])
+        return None
@@ -0,0 +1,180 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PresenceConnection, UserStatus
+
+# How often a user's heartbeat is allowed to reach the database (seconds)
+WRITE_WINDOW = getattr(settings, 'PRESENCE_WRITE_WINDOW', 60)
+# How long without a heartbeat before a user is considered offline (seconds)
+TTL = getattr(settings, 'PRESENCE_TTL', 300)
+# Heartbeats and open-socket flags are read by every worker, so this must
+# be a cache the workers share
+CACHE = getattr(settings, 'PRESENCE_CACHE', 'default')
+
+
+def _cache():
+    return caches[CACHE]
+
+
+def _seen_key(user_id):
+    return f'presence:seen:{user_id}'
+
+
+def _written_key(user_id):
+    return f'presence:written:{user_id}'
+
+
+def _sockets_key(user_id):
+    # Set while the user has a chat socket open on any worker
+    return f'presence:sockets:{user_id}'
+
+
+# =========================
+# HEARTBEATS
+# =========================
+def heartbeat(user_id):
+    """
+    Record that a user is active. The heartbeat always lands in the cache;
+    the UserStatus row is only touched once per WRITE_WINDOW.
+    """
+    cache = _cache()
+    cache.set(_seen_key(user_id), timezone.now(), TTL)
+
+    # cache.add only succeeds for the first heartbeat in the window
+    if cache.add(_written_key(user_id), True, WRITE_WINDOW):
+        _write_status(user_id, True)
+
+
+def set_status(user_id, online):
+    """Explicit online/offline toggle, written straight through."""
+    if online:
+        _cache().set(_seen_key(user_id), timezone.now(), TTL)
+    else:
+        _cache().delete(_seen_key(user_id))
+    _write_status(user_id, online)
+
+
+def _write_status(user_id, online):
+    now = timezone.now()
+    updated = UserStatus.objects.filter(user_id=user_id).update(
+        is_online=online, last_seen=now
+    )
+    if not updated:
+        UserStatus.objects.get_or_create(
+            user_id=user_id, defaults={'is_online': online}
+        )
+
+
+def last_seen(user_id):
+    return _cache().get(_seen_key(user_id))
+
+
+def is_online(user_id):
+    """O(1): an open socket on any worker, or a recent heartbeat."""
+    return bool(_cache().get_many([_sockets_key(user_id), _seen_key(user_id)]))
+
+
+def group_name(user_id):
+    return f'presence_{user_id}'
+
+
+# =========================
+# CONNECTION REGISTRY
+# =========================
+def _lock(user_id):
+    # Serialises one user's connects and disconnects across workers
+    UserStatus.objects.select_for_update().get_or_create(user_id=user_id)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class PresenceRegistry:
+    """
+    Reference-counts open WebSocket connections per user, so a user with
+    several tabs only goes offline when the last one closes, whichever
+    workers they landed on. Each socket is a PresenceConnection row; the
+    first and last one also write UserStatus and the shared socket flag,
+    under the same lock.
+
+    connect()/disconnect() return True when the user actually changed
+    state; callers only notify rooms in that case.
+    """
+
+    def connect(self, user_id, channel_name):
+        with transaction.atomic():
+            _lock(user_id)
+            first = not PresenceConnection.objects.filter(user_id=user_id).exists()
+            PresenceConnection.objects.create(user_id=user_id, channel_name=channel_name, pid=os.getpid())
+            if first:
+                _write_status(user_id, True)
+                _cache().set(_sockets_key(user_id), True, None)
+        return first
+
+    def disconnect(self, user_id, channel_name):
+        with transaction.atomic():
+            _lock(user_id)
+            closed, _ = PresenceConnection.objects.filter(channel_name=channel_name).delete()
+            last = bool(closed) and not PresenceConnection.objects.filter(user_id=user_id).exists()
+            if last:
+                _write_status(user_id, False)
+                _cache().delete_many([_sockets_key(user_id), _seen_key(user_id)])
+        return last
+
+    def is_online(self, user_id):
+        return PresenceConnection.objects.filter(user_id=user_id).exists()
+
+    def online_users(self):
+        return list(PresenceConnection.objects.values_list('user_id', flat=True).distinct())
+
+    def prune(self):
+        """
+        Forget sockets held by worker processes that have died. Workers
+        share a host, as they do for counseling.layers, so a pid is enough
+        to tell. Returns the ids of users left with no sockets.
+        """
+        pids = PresenceConnection.objects.values_list('pid', flat=True).distinct()
+        dead = [pid for pid in pids if not _alive(pid)]
+        if not dead:
+            return set()
+        rows = PresenceConnection.objects.filter(pid__in=dead)
+        users = set(rows.values_list('user_id', flat=True))
+        rows.delete()
+        gone = users - set(
+            PresenceConnection.objects.filter(user_id__in=users).values_list('user_id', flat=True)
+        )
+        _cache().delete_many([_sockets_key(user_id) for user_id in gone])
+        return gone
+
+
+registry = PresenceRegistry()
+
+
+# =========================
+# SWEEPER
+# =========================
+def sweep(ttl=TTL):
+    """
+    Mark users offline whose last recorded heartbeat is older than ``ttl``
+    and who have no socket open, after dropping sockets of dead workers.
+    Runs as a single UPDATE; returns the number of users marked offline.
+    """
+    registry.prune()
+    cutoff = timezone.now() - timedelta(seconds=ttl)
+    return UserStatus.objects.filter(
+        is_online=True, last_seen__lt=cutoff
+    ).exclude(
+        user_id__in=PresenceConnection.objects.values('user_id')
+    ).update(is_online=False)
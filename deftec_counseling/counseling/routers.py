@@ -0,0 +1,80 @@
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import FileResponse, StreamingHttpResponse
+
+_reporting = contextvars.ContextVar('reporting', default=False)
+
+
+def report_database():
+    """The alias report reads go to, or None when none is configured."""
+    alias = getattr(settings, 'REPORT_DATABASE', None)
+    return alias if alias in settings.DATABASES else None
+
+
+@contextmanager
+def reporting():
+    """Send reads made inside the block to the report database."""
+    token = _reporting.set(True)
+    try:
+        yield
+    finally:
+        _reporting.reset(token)
+
+
+def _stream(content):
+    with reporting():
+        yield from content
+
+
+async def _astream(content):
+    # sync_to_async copies the context, so chunks pulled in the sync
+    # thread see the flag too
+    with reporting():
+        async for part in content:
+            yield part
+
+
+def report_view(view):
+    """
+    Run a read-only view under reporting(). A streamed body is read after
+    the view returns, so its iteration is wrapped as well.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with reporting():
+            response = view(request, *args, **kwargs)
+        if isinstance(response, StreamingHttpResponse) and not isinstance(response, FileResponse):
+            stream = _astream if response.is_async else _stream
+            response.streaming_content = stream(response.streaming_content)
+        return response
+    return wrapper
+
+
+class ReportRouter:
+    """
+    Routing is opt-in: only reads made under reporting() leave 'default',
+    since most views read back what they have just written. Reads inside
+    a transaction on 'default' stay there too, so they see its writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _reporting.get():
+            return None
+        alias = report_database()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != report_database()
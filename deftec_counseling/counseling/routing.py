@@ -1,6 +1,7 @@
 from django.urls import re_path
-from .consumers import ChatConsumer
+from .consumers import ChatConsumer, SignalingConsumer
 
 websocket_urlpatterns = [
     re_path(r'ws/chat/(?P<appointment_id>\d+)/$', ChatConsumer.as_asgi()),
+    re_path(r'ws/call/(?P<appointment_id>\d+)/$', SignalingConsumer.as_asgi()),
 ]
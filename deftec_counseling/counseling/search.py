@@ -0,0 +1,209 @@
+import atexit
+import logging
+import multiprocessing
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .extract import extract_text
+from .models import Book
+
+logger = logging.getLogger(__name__)
+
+TABLE = 'counseling_book_fts'
+
+PAGE_SIZE = getattr(settings, 'BOOK_SEARCH_PAGE_SIZE', 20)
+# Processes used to pull text out of uploaded files
+WORKERS = getattr(settings, 'BOOK_INDEX_WORKERS', 2)
+# Snippet markers that can't appear in extracted text; swapped for <mark>
+# after the snippet has been escaped
+_OPEN, _CLOSE = '\x02', '\x03'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+# =========================
+# INDEX WRITES
+# =========================
+def index_title(book_id, title):
+    """Add or retitle a book, keeping any body text already indexed."""
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {TABLE} SET title = %s WHERE rowid = %s', [title, book_id])
+        if cursor.rowcount == 0:
+            cursor.execute(
+                f"INSERT INTO {TABLE} (rowid, title, body) VALUES (%s, %s, '')",
+                [book_id, title],
+            )
+
+
+def index_body(book_id, text):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {TABLE} SET body = %s WHERE rowid = %s', [text, book_id])
+
+
+def remove(book_id):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [book_id])
+
+
+def indexed_body(sha256):
+    """Text already extracted for another book with the same file, if any."""
+    if not sha256:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT f.body FROM {TABLE} f JOIN counseling_book b ON b.id = f.rowid "
+            f"WHERE b.sha256 = %s AND f.body != '' LIMIT 1",
+            [sha256],
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+# =========================
+# BACKGROUND EXTRACTION
+# =========================
+_lock = threading.Lock()
+_pools = {}
+
+
+def _extractors():
+    with _lock:
+        if 'extract' not in _pools:
+            # Spawned, not forked: the server process has threads running
+            _pools['extract'] = ProcessPoolExecutor(
+                max_workers=WORKERS, mp_context=multiprocessing.get_context('spawn'),
+            )
+            # One thread does every index write, so SQLite never sees two
+            # writers from this process
+            _pools['write'] = ThreadPoolExecutor(max_workers=1)
+        return _pools['extract'], _pools['write']
+
+
+def _store(book_id, future):
+    close_old_connections()
+    try:
+        index_body(book_id, future.result())
+    except Exception:
+        # The book stays searchable by title; rebuild_book_index retries it
+        logger.exception("Failed to index the text of book %s", book_id)
+    finally:
+        connection.close()
+
+
+def schedule(book):
+    """Extract ``book``'s text in the worker pool and index it when done."""
+    if not available() or not book.file:
+        return
+    text = indexed_body(book.sha256)
+    if text is not None:
+        index_body(book.pk, text)
+        return
+    try:
+        path = book.file.path
+    except (ValueError, NotImplementedError):
+        return
+
+    extract, write = _extractors()
+    future = extract.submit(extract_text, path)
+    future.add_done_callback(lambda f: write.submit(_store, book.pk, f))
+
+
+def rebuild(books=None):
+    """Reindex ``books`` (default: all) synchronously, extracting in parallel."""
+    books = list((books if books is not None else Book.objects.all()).only('id', 'title', 'file'))
+    extract, _ = _extractors()
+    paths = []
+    for book in books:
+        index_title(book.pk, book.title)
+        try:
+            paths.append(book.file.path if book.file else '')
+        except (ValueError, NotImplementedError):
+            paths.append('')
+    for book, text in zip(books, extract.map(extract_text, paths, chunksize=8)):
+        index_body(book.pk, text)
+    return len(books)
+
+
+@atexit.register
+def _shutdown():
+    for pool in _pools.values():
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# =========================
+# SEARCH
+# =========================
+def match_expression(query):
+    """
+    Turns free text into an FTS5 query: every word must match, and the
+    last one also matches as a prefix so results show up while typing.
+    """
+    tokens = _TOKEN_RE.findall(query)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _highlight(snippet):
+    return mark_safe(escape(snippet).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>'))
+
+
+def search(query, page=1, per_page=PAGE_SIZE):
+    """
+    Returns (results, has_next). Each result is the Book with ``snippet``
+    (safe HTML with <mark> around hits) and ``rank`` set, best first.
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return [], False
+    offset = (page - 1) * per_page
+
+    if available():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                # `rank` is bm25 with a title hit worth ten body hits; it is
+                # configured on the table in migration 0013
+                f"SELECT rowid, rank, snippet({TABLE}, -1, %s, %s, '…', 12) "
+                f"FROM {TABLE} WHERE {TABLE} MATCH %s "
+                f"ORDER BY rank LIMIT %s OFFSET %s",
+                [_OPEN, _CLOSE, expression, per_page + 1, offset],
+            )
+            hits = cursor.fetchall()
+    else:
+        hits = [
+            (pk, 0.0, '')
+            for pk in Book.objects.filter(title__icontains=query)
+            .order_by('-uploaded_at').values_list('pk', flat=True)[offset:offset + per_page + 1]
+        ]
+
+    has_next = len(hits) > per_page
+    hits = hits[:per_page]
+    books = Book.objects.select_related('uploaded_by').in_bulk([pk for pk, _, _ in hits])
+
+    results = []
+    for pk, rank, snippet in hits:
+        book = books.get(pk)
+        if book is None:
+            continue
+        book.rank = rank
+        book.snippet = _highlight(snippet)
+        results.append(book)
+    return results, has_next
@@ -0,0 +1,178 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import directory, fragments, search, stats, student_search
+from .models import User, Counselor, Specialization, Appointment, AppointmentTombstone, Book, CallLog
+
+STAT_FIELDS = {'role', 'is_approved', 'school', 'class_name', 'rank'}
+
+
+# =========================
+# DASHBOARD STATISTICS
+# =========================
+@receiver(pre_save, sender=User)
+def remember_user_stat_keys(sender, instance, update_fields=None, raw=False, **kwargs):
+    instance._old_stat_keys = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not STAT_FIELDS.intersection(update_fields):
+        return
+    old = User.objects.filter(pk=instance.pk) \
+        .values('role', 'is_approved', 'school', 'class_name', 'rank').first()
+    if old:
+        instance._old_stat_keys = stats.user_keys(**old)
+
+
+@receiver(post_save, sender=User)
+def update_user_stats(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        stats.bump(stats.keys_for(instance), 1)
+    elif getattr(instance, '_old_stat_keys', None) is not None:
+        stats.move(instance._old_stat_keys, stats.keys_for(instance))
+
+
+@receiver(post_delete, sender=User)
+def remove_user_stats(sender, instance, **kwargs):
+    stats.bump(stats.keys_for(instance), -1)
+
+
+@receiver(post_save, sender=Appointment)
+def count_appointment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.bump([('appointments', '')], 1)
+
+
+@receiver(post_delete, sender=Appointment)
+def uncount_appointment(sender, instance, **kwargs):
+    stats.bump([('appointments', '')], -1)
+
+
+# =========================
+# APPOINTMENT CHANGE TRACKING
+# =========================
+@receiver(pre_save, sender=Appointment)
+def tombstone_reassigned_appointment(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    old_counselor_id = Appointment.objects.filter(pk=instance.pk) \
+        .values_list('counselor_id', flat=True).first()
+    if old_counselor_id and old_counselor_id != instance.counselor_id:
+        AppointmentTombstone.objects.create(
+            appointment_id=instance.pk, counselor_id=old_counselor_id
+        )
+        fragments.bump_on_commit('dashboard', old_counselor_id)
+
+
+@receiver(post_delete, sender=Appointment)
+def tombstone_deleted_appointment(sender, instance, **kwargs):
+    AppointmentTombstone.objects.create(
+        appointment_id=instance.pk, counselor_id=instance.counselor_id
+    )
+
+
+# =========================
+# COUNSELOR DIRECTORY
+# =========================
+@receiver(post_save, sender=Counselor)
+@receiver(post_delete, sender=Counselor)
+@receiver(post_save, sender=Specialization)
+@receiver(post_delete, sender=Specialization)
+def invalidate_directory(sender, **kwargs):
+    transaction.on_commit(directory.invalidate)
+
+
+DIRECTORY_FIELDS = {'role', 'is_approved', 'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_directory_for_counselor(sender, instance, update_fields=None, **kwargs):
+    # Skips e.g. the last_login save on every counselor login
+    if update_fields is not None and not DIRECTORY_FIELDS.intersection(update_fields):
+        return
+    was_counselor = ('role', 'counselor') in (getattr(instance, '_old_stat_keys', None) or [])
+    if instance.role == 'counselor' or was_counselor:
+        transaction.on_commit(directory.invalidate)
+
+
+# =========================
+# DASHBOARD FRAGMENTS
+# =========================
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def invalidate_appointment_fragments(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    fragments.bump_on_commit('dashboard', instance.student_id)
+    fragments.bump_on_commit('dashboard', instance.counselor_id)
+
+
+@receiver(post_save, sender=Counselor)
+@receiver(post_delete, sender=Counselor)
+def invalidate_counselor_fragments(sender, instance, raw=False, **kwargs):
+    if not raw:
+        fragments.bump_on_commit('dashboard', instance.user_id)
+
+
+@receiver(post_save, sender=CallLog)
+@receiver(post_delete, sender=CallLog)
+def invalidate_call_fragments(sender, instance, raw=False, **kwargs):
+    if not raw:
+        fragments.bump_on_commit('calls', instance.receiver_id)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_fragments(sender, raw=False, **kwargs):
+    if not raw:
+        fragments.bump_on_commit('books')
+
+
+@receiver(post_save, sender=Specialization)
+@receiver(post_delete, sender=Specialization)
+def invalidate_specialization_fragments(sender, raw=False, **kwargs):
+    if not raw:
+        fragments.bump_on_commit('specializations')
+
+
+# =========================
+# BOOK SEARCH INDEX
+# =========================
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    def update():
+        search.index_title(instance.pk, instance.title)
+        search.schedule(instance)
+
+    transaction.on_commit(update)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    search.remove(instance.pk)
+
+
+# =========================
+# STUDENT LOOKUP INDEX
+# =========================
+STUDENT_SEARCH_FIELDS = {'role', 'service_number', 'first_name', 'last_name', 'username'}
+
+
+@receiver(post_save, sender=User)
+def index_student(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not STUDENT_SEARCH_FIELDS.intersection(update_fields):
+        return
+    student_search.index_student(instance)
+
+
+@receiver(post_delete, sender=User)
+def unindex_student(sender, instance, **kwargs):
+    student_search.remove(instance.pk)
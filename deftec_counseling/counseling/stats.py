@@ -0,0 +1,110 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from . import fragments
+from .models import User, Appointment, StatCounter
+
+
+# =========================
+# COUNTER KEYS
+# =========================
+def user_keys(role, is_approved, school, class_name, rank=None):
+    """The (group, key) counters a user with these values contributes to."""
+    keys = [('role', role or '')]
+    if role == 'student':
+        if not is_approved:
+            keys.append(('pending', ''))
+        keys.append(('school', school or ''))
+        keys.append(('class', class_name or ''))
+        if rank:
+            keys.append(('rank', rank))
+    return keys
+
+
+def keys_for(user):
+    return user_keys(user.role, user.is_approved, user.school, user.class_name, user.rank)
+
+
+# =========================
+# INCREMENTAL UPDATES
+# =========================
+def bump(keys, delta):
+    for group, key in keys:
+        counter, created = StatCounter.objects.get_or_create(
+            group=group, key=key, defaults={'value': delta}
+        )
+        if not created:
+            StatCounter.objects.filter(pk=counter.pk).update(value=F('value') + delta)
+    if keys:
+        fragments.bump_on_commit('stats')
+
+
+def move(old_keys, new_keys):
+    """Apply the difference between a user's old and new counters."""
+    old, new = Counter(old_keys), Counter(new_keys)
+    bump(list((old - new).elements()), -1)
+    bump(list((new - old).elements()), 1)
+
+
+# =========================
+# RECONCILIATION
+# =========================
+def compute(user_model=User, appointment_model=Appointment):
+    """Full recount from the source tables. Returns {(group, key): value}."""
+    totals = Counter()
+    rows = user_model.objects.values('role', 'is_approved', 'school', 'class_name', 'rank') \
+        .annotate(count=Count('id')).order_by()
+    for row in rows:
+        count = row.pop('count')
+        for key in user_keys(**row):
+            totals[key] += count
+    totals[('appointments', '')] = appointment_model.objects.count()
+    return totals
+
+
+@transaction.atomic
+def reconcile(user_model=User, appointment_model=Appointment, counter_model=StatCounter):
+    totals = compute(user_model, appointment_model)
+    counter_model.objects.all().delete()
+    counter_model.objects.bulk_create([
+        counter_model(group=group, key=key, value=value)
+        for (group, key), value in totals.items()
+    ])
+    fragments.bump_on_commit('stats')
+    return totals
+
+
+# =========================
+# DASHBOARD
+# =========================
+def dashboard_stats():
+    """Everything admin_dashboard shows, from one query on StatCounter."""
+    counters = {}
+    for group, key, value in StatCounter.objects.values_list('group', 'key', 'value'):
+        counters.setdefault(group, {})[key] = value
+
+    def breakdown(group, label):
+        return [
+            {label: key or None, 'count': value}
+            for key, value in sorted(counters.get(group, {}).items())
+            if value > 0
+        ]
+
+    return {
+        'students_count': counters.get('role', {}).get('student', 0),
+        'counselors_count': counters.get('role', {}).get('counselor', 0),
+        'appointments_count': counters.get('appointments', {}).get('', 0),
+        'pending_students': counters.get('pending', {}).get('', 0),
+        'students_by_school': breakdown('school', 'school'),
+        'students_by_class': breakdown('class', 'class_name'),
+    }
+
+
+def rank_facet():
+    """Ranks that at least one student holds, for the manage_students filter."""
+    return list(
+        StatCounter.objects.filter(group='rank', value__gt=0)
+        .order_by('key').values_list('key', flat=True)
+    )
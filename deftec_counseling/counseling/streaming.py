@@ -0,0 +1,45 @@
+import itertools
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+BLOCK_SIZE = 64 * 1024
+
+
+def serving_async(request):
+    """
+    True when the request came in over ASGI. There Django buffers a
+    StreamingHttpResponse's sync iterator into one list before sending,
+    so bodies that must stream need an async iterator instead.
+    """
+    return isinstance(request, ASGIRequest)
+
+
+async def aiter_chunks(iterable, size):
+    """
+    Lists of up to ``size`` items from a sync iterable. Each chunk is
+    pulled in the request's sync thread, so a queryset iterator stays on
+    the connection that opened it.
+    """
+    iterator = iter(iterable)
+    take = sync_to_async(lambda: list(itertools.islice(iterator, size)))
+    while True:
+        chunk = await take()
+        if not chunk:
+            return
+        yield chunk
+
+
+async def aiter_file(f, length=None, block_size=BLOCK_SIZE):
+    """Blocks of an open file from its current position, read off the event loop."""
+    read = sync_to_async(f.read, thread_sensitive=False)
+    try:
+        while length is None or length > 0:
+            block = await read(block_size if length is None else min(block_size, length))
+            if not block:
+                return
+            if length is not None:
+                length -= len(block)
+            yield block
+    finally:
+        f.close()
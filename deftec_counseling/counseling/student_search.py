@@ -0,0 +1,134 @@
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import User, normalize_service_number
+
+TABLE = 'counseling_student_fts'
+
+# The trigram index needs at least this many characters to match on
+MIN_TRIGRAM = 3
+
+AUTOCOMPLETE_LIMIT = 10
+
+# Sorts after any character a service number key can hold
+_PREFIX_END = '\U0010ffff'
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def _name(first_name, last_name, username):
+    return ' '.join(part for part in (first_name, last_name, username) if part)
+
+
+# _name() in SQL: every non-empty part gets one leading space, and the
+# first is cut off. Rows indexed either way must tokenize the same.
+_NAME_SQL = (
+    "substr("
+    "coalesce(' ' || nullif(first_name, ''), '') || "
+    "coalesce(' ' || nullif(last_name, ''), '') || "
+    "coalesce(' ' || nullif(username, ''), ''), 2)"
+)
+
+
+# =========================
+# INDEX WRITES
+# =========================
+def index_student(user):
+    """Add or refresh a student's row; other roles are removed instead."""
+    if not available():
+        return
+    if user.role != 'student':
+        remove(user.pk)
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [user.pk])
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, service_number, name) VALUES (%s, %s, %s)',
+            [user.pk, user.service_number_key, _name(user.first_name, user.last_name, user.username)],
+        )
+
+
+def remove(user_id):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [user_id])
+
+
+_INDEX_SELECT = (
+    f"INSERT INTO {TABLE} (rowid, service_number, name) "
+    f"SELECT id, service_number_key, {_NAME_SQL} "
+    f"FROM counseling_user WHERE role = 'student'"
+)
+
+
+def index_many(user_ids):
+    """Index newly bulk-created students in one statement."""
+    if not available() or not user_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'{_INDEX_SELECT} AND id IN ({placeholders})', list(user_ids))
+
+
+def rebuild():
+    """Reindex every student in one statement, e.g. after bulk_create."""
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        cursor.execute(_INDEX_SELECT)
+
+
+# =========================
+# LOOKUPS
+# =========================
+def prefix_q(field, prefix):
+    """
+    ``field`` starts with ``prefix``, as a range the index can seek on;
+    SQLite can't use an index for the case-insensitive LIKE behind
+    __startswith.
+    """
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + _PREFIX_END})
+
+
+def _phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def matching(query):
+    """
+    Q for students whose service number or name contains ``query``.
+    Three or more characters go through the trigram index; shorter
+    queries only match service numbers by prefix.
+    """
+    query = query.strip()
+    key = normalize_service_number(query)
+
+    if len(query) < MIN_TRIGRAM or not available():
+        q = prefix_q('service_number_key', key) if key else Q(pk__in=[])
+        if not available() and len(query) >= MIN_TRIGRAM:
+            q |= Q(first_name__icontains=query) | Q(last_name__icontains=query)
+        return q
+
+    terms = [f'name : {_phrase(query)}']
+    if len(key) >= MIN_TRIGRAM:
+        terms.append(f'service_number : {_phrase(key)}')
+    return Q(pk__in=RawSQL(
+        f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s', [' OR '.join(terms)]
+    ))
+
+
+def autocomplete(prefix, limit=AUTOCOMPLETE_LIMIT):
+    """Students whose service number starts with ``prefix``, by index range."""
+    key = normalize_service_number(prefix)
+    if not key:
+        return []
+    return list(
+        User.objects.filter(prefix_q('service_number_key', key), role='student')
+        .order_by('service_number_key')
+        .values('id', 'service_number', 'first_name', 'last_name', 'rank')[:limit]
+    )
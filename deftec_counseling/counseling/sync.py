@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Appointment, AppointmentTombstone
+
+# Tombstones older than this are pruned; clients with an older cursor get
+# a full snapshot instead of a delta.
+TOMBSTONE_RETENTION = timedelta(days=getattr(settings, 'APPOINTMENT_TOMBSTONE_DAYS', 7))
+
+# Re-send rows changed this close to the previous cursor, so a save that
+# committed just after the last poll read the table is not missed.
+OVERLAP = timedelta(seconds=2)
+
+
+def parse_cursor(value):
+    try:
+        cursor = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if timezone.is_naive(cursor):
+        return None
+    if cursor < timezone.now() - TOMBSTONE_RETENTION:
+        return None
+    return cursor
+
+
+def counselor_changes(counselor, since=None):
+    """
+    Returns (cursor, full, changed_queryset, deleted_ids).
+
+    With a valid ``since`` cursor only appointments updated after it and
+    the ids of appointments removed since then are returned; otherwise
+    ``full`` is True and the queryset holds every appointment.
+    """
+    cursor = timezone.now()
+    appointments = Appointment.objects.filter(counselor=counselor) \
+        .select_related('student', 'specialization') \
+        .order_by('date', 'time')
+
+    since = parse_cursor(since)
+    if since is None:
+        return cursor, True, appointments, []
+
+    since -= OVERLAP
+    changed = appointments.filter(updated_at__gt=since)
+    deleted = list(AppointmentTombstone.objects.filter(
+        counselor_id=counselor.id, deleted_at__gt=since
+    ).values_list('appointment_id', flat=True))
+    return cursor, False, changed, deleted
+
+
+def prune_tombstones():
+    return AppointmentTombstone.objects.filter(
+        deleted_at__lt=timezone.now() - TOMBSTONE_RETENTION
+    ).delete()[0]
@@ -1,3 +1,1027 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import Future
+from unittest import mock
+from urllib.parse import quote
+
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    availability, calls, consumers, directory, downloads, fragments, framing, intake, layers,
+    presence, search, stats, student_search, uploads,
+)
+from .pagination import KeysetPage, decode_cursor, encode_cursor
+from .models import (
+    User,
+    Specialization,
+    Counselor,
+    Appointment,
+    ChatMessage,
+    CallLog,
+    Book,
+    PresenceConnection,
+    UploadSession,
+    UserStatus,
+)
+
+
+# =========================
+# SEED DATA
+# =========================
+def seed(students=12, counselors=3, appointments_per_student=3):
+    """
+    A small but realistic population: every relation the views touch has
+    several rows, so a per-row query shows up as a blown budget.
+    """
+    specs = Specialization.objects.bulk_create([
+        Specialization(name=name, description=f"{name} support")
+        for name in ['Academic', 'Career', 'Wellbeing']
+    ])
+
+    counselor_users = []
+    for i in range(counselors):
+        user = User.objects.create(
+            username=f'counselor{i}', first_name='Counselor', last_name=str(i),
+            role='counselor', email=f'counselor{i}@example.com',
+        )
+        Counselor.objects.create(user=user, specialization=specs[i % len(specs)])
+        counselor_users.append(user)
+
+    student_users = [
+        User.objects.create(
+            username=f'student{i}', first_name='Student', last_name=str(i),
+            role='student', is_approved=True, service_number=f'SN{i:04d}',
+            rank=['Pte', 'Cpl', 'Sgt'][i % 3], school=f'School {i % 2}',
+            class_name=f'Class {i % 4}',
+        )
+        for i in range(students)
+    ]
+
+    appointments = []
+    start = datetime.date(2026, 1, 5)
+    for i, student in enumerate(student_users):
+        for j in range(appointments_per_student):
+            counselor = counselor_users[(i + j) % counselors]
+            appointments.append(Appointment.objects.create(
+                student=student,
+                counselor=counselor,
+                specialization=counselor.counselor_profile.specialization,
+                date=start + datetime.timedelta(days=j),
+                time=datetime.time(8 + i // counselors),
+                status=['pending', 'approved', 'completed'][(i + j) % 3],
+            ))
+
+    now = timezone.now()
+    for i, appointment in enumerate(appointments[:6]):
+        ChatMessage.objects.create(
+            appointment=appointment, sender=appointment.student, message=f"hello {i}"
+        )
+        CallLog.objects.create(
+            caller=appointment.student, receiver=appointment.counselor,
+            call_type='voice', status='missed', started_at=now, ended_at=now,
+        )
+
+    for i, counselor in enumerate(counselor_users):
+        Book.objects.create(title=f"Guide {i}", file=f'books/guide{i}.pdf', uploaded_by=counselor)
+
+    admin = User.objects.create(username='admin', role='admin', is_staff=True)
+    return {
+        'admin': admin,
+        'counselor': counselor_users[0],
+        'student': student_users[0],
+        'specialization': specs[0],
+        'appointment': appointments[0],
+    }
+
+
+# =========================
+# QUERY BUDGETS
+# =========================
+class QueryBudgetTestCase(TestCase):
+    """
+    Each view gets a fixed number of queries regardless of how many rows
+    it renders. Two of every budget are the session and user lookups done
+    by the auth middleware.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed()
+
+    def assertBudget(self, user, url, budget, status=200):
+        self.client.force_login(user)
+        # Land inside the presence write window so OnlineNowMiddleware's
+        # once-per-window UserStatus write doesn't count against the view
+        cache.clear()
+        caches[presence.CACHE].clear()
+        directory.invalidate()
+        presence.heartbeat(user.id)
+        with self.assertNumQueries(budget):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status)
+        return response
+
+
+class AdminViewBudgetTests(QueryBudgetTestCase):
+    def test_admin_dashboard(self):
+        self.assertBudget(self.data['admin'], reverse('admin_dashboard'), 3)
+
+    def test_admin_dashboard_cached(self):
+        url = reverse('admin_dashboard')
+        self.assertBudget(self.data['admin'], url, 3)
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create(username='late', role='student', school='School 9')
+        self.assertContains(self.client.get(url), 'School 9')
+
+    def test_manage_students(self):
+        self.assertBudget(self.data['admin'], reverse('manage_students'), 4)
+
+    async def test_exports_stream_under_asgi(self):
+        # A sync body would be buffered whole by Django's ASGI handler
+        await self.async_client.aforce_login(self.data['admin'])
+        response = await self.async_client.get(reverse('export_students_csv'))
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(body.count(b'\r\n'), 13)
+        self.assertIn(b'SN0011', body)
+
+        response = await self.async_client.get(reverse('export_students_excel'))
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(body), int(response['Content-Length']))
+
+    def test_manage_students_filtered(self):
+        url = reverse('manage_students') + '?service_number=SN00&rank=Pte'
+        self.assertBudget(self.data['admin'], url, 4)
+
+    def test_manage_students_name_search(self):
+        url = reverse('manage_students') + '?service_number=student1'
+        response = self.assertBudget(self.data['admin'], url, 4)
+        self.assertEqual(
+            {s.username for s in response.context['students']},
+            {'student1', 'student10', 'student11'},
+        )
+
+    def test_student_autocomplete(self):
+        url = reverse('student_autocomplete') + '?q=sn-001'
+        response = self.assertBudget(self.data['admin'], url, 3)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_bulk_student_approval(self):
+        User.objects.filter(role='student').update(is_approved=False)
+        stats.reconcile()
+        self.client.force_login(self.data['admin'])
+        cache.clear()
+        caches[presence.CACHE].clear()
+        presence.heartbeat(self.data['admin'].id)
+        # One UPDATE for every matching student, plus the pending counter
+        with self.assertNumQueries(7):
+            response = self.client.post(reverse('bulk_student_approval'), {
+                'scope': 'all', 'action': 'approve', 'rank': 'Pte',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(User.objects.filter(role='student', rank='Pte', is_approved=False).exists())
+        self.assertEqual(stats.dashboard_stats()['pending_students'], 8)
+
+    def test_import_students(self):
+        roster = (
+            "Service Number,Rank,Full Name,School,Class\r\n"
+            "SN-9001,Pte,Ama Mensah,School 0,Class 1\r\n"
+            "SN0001,Cpl,Already Registered,School 0,Class 1\r\n"
+            "sn9001,Pte,Listed Twice,School 0,Class 1\r\n"
+            "SN9002,Sgt,Kofi Owusu,School 1,Class 2\r\n"
+        )
+        self.client.force_login(self.data['admin'])
+        response = self.client.post(reverse('import_students'), {
+            'roster': SimpleUploadedFile('intake.csv', roster.encode()),
+        })
+        result = response.context['result']
+        self.assertEqual((result.created, result.duplicates, result.errors), (2, 2, []))
+
+        student = User.objects.get(service_number_key='SN9001')
+        self.assertEqual((student.first_name, student.last_name, student.is_approved), ('Ama', 'Mensah', False))
+        self.assertEqual(stats.dashboard_stats()['students_count'], 14)
+        self.assertIn('Sgt', stats.rank_facet())
+        url = reverse('manage_students') + '?service_number=Owusu'
+        response = self.assertBudget(self.data['admin'], url, 4)
+        self.assertEqual([s.username for s in response.context['students']], ['sn9002'])
+
+    def test_import_students_encodings(self):
+        self.client.force_login(self.data['admin'])
+        # Excel's plain CSV save uses the Windows code page
+        roster = "Service Number,Full Name\r\nSN9001,Ren\u00e9e Asante\r\n".encode('cp1252')
+        response = self.client.post(reverse('import_students'), {
+            'roster': SimpleUploadedFile('intake.csv', roster),
+        })
+        self.assertEqual(response.context['result'].created, 1)
+        self.assertEqual(User.objects.get(service_number_key='SN9001').first_name, 'Ren\u00e9e')
+
+        # Bytes no encoding accepts, after one chunk has been written
+        roster = b"Service Number,Full Name\r\nSN9002,Ama Mensah\r\nSN9003,Kofi Owusu\r\nSN9004,\x81\x8d\r\n"
+        result = intake.import_students(intake.read_roster(io.BytesIO(roster), 'intake.csv'), chunk_size=1)
+        self.assertEqual(result.created, 2)
+        self.assertIn('Line 4', result.stopped)
+
+        # Nothing imported: the error is raised for the form
+        response = self.client.post(reverse('import_students'), {
+            'roster': SimpleUploadedFile('intake.csv', b"Service Number,Full Name\r\nSN9005,\x81\r\n"),
+        })
+        self.assertIsNone(response.context['result'])
+        self.assertIn('Line 2', str(response.context['form'].errors['roster']))
+
+    def test_manage_counselors(self):
+        self.assertBudget(self.data['admin'], reverse('manage_counselors'), 3)
+
+    def test_manage_specializations(self):
+        self.assertBudget(self.data['admin'], reverse('manage_specializations'), 3)
+
+    def test_view_appointments(self):
+        self.assertBudget(self.data['admin'], reverse('view_appointments'), 3)
+
+    def test_admin_call_logs(self):
+        self.assertBudget(self.data['admin'], reverse('admin_call_logs'), 3)
+
+    def test_view_counselor(self):
+        profile = self.data['counselor'].counselor_profile
+        self.assertBudget(self.data['admin'], reverse('view_counselor', args=[profile.id]), 3)
+
+
+class CounselorViewBudgetTests(QueryBudgetTestCase):
+    def test_counselor_dashboard(self):
+        self.assertBudget(self.data['counselor'], reverse('counselor_dashboard'), 8)
+
+    def test_counselor_dashboard_cached(self):
+        url = reverse('counselor_dashboard')
+        self.assertBudget(self.data['counselor'], url, 8)
+        # Only the session, user, profile and status lookups remain
+        with self.assertNumQueries(4):
+            self.client.get(url)
+
+        # A new book refreshes the book list and nothing else. Its file
+        # doesn't exist, so skip text extraction.
+        with mock.patch.object(search, 'schedule'), self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(title="Fresh Guide", file='books/fresh.pdf', uploaded_by=self.data['counselor'])
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertContains(response, "Fresh Guide")
+
+    def test_counselor_dashboard_uncached_with_local_versions(self):
+        # Versions in a per-process cache would go stale on other workers
+        url = reverse('counselor_dashboard')
+        with mock.patch.object(fragments, 'VERSION_CACHE', 'default'):
+            self.assertBudget(self.data['counselor'], url, 8)
+            with self.assertNumQueries(8):
+                self.client.get(url)
+
+    def test_counselor_appointments_ajax(self):
+        # One of these is the ETag's max(updated_at)/count aggregate
+        response = self.assertBudget(
+            self.data['counselor'], reverse('counselor_appointments_ajax'), 4
+        )
+        self.assertTrue(response.json()['appointments'])
+
+    def test_counselor_appointments_ajax_unchanged(self):
+        url = reverse('counselor_appointments_ajax')
+        self.client.force_login(self.data['counselor'])
+        cursor = self.client.get(url)['X-Sync-Cursor']
+        Appointment.objects.update(updated_at=timezone.now() - datetime.timedelta(minutes=5))
+        self.assertBudget(
+            self.data['counselor'], f'{url}?since={quote(cursor)}', 4, status=304
+        )
+
+
+class StudentViewBudgetTests(QueryBudgetTestCase):
+    def test_student_dashboard(self):
+        self.assertBudget(self.data['student'], reverse('student_dashboard'), 5)
+
+    def test_student_dashboard_cached(self):
+        url = reverse('student_dashboard')
+        self.assertBudget(self.data['student'], url, 5)
+        with self.assertNumQueries(3):
+            self.client.get(url)
+
+        appointment = Appointment.objects.filter(student=self.data['student'], status='pending').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.status = 'approved'
+            appointment.save()
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertNotContains(response, 'status-badge pending')
+
+    def test_student_books(self):
+        self.assertBudget(self.data['student'], reverse('student_books'), 3)
+
+    def test_appointment_detail(self):
+        url = reverse('appointment_detail', args=[self.data['appointment'].id])
+        self.assertBudget(self.data['student'], url, 4)
+
+    def test_get_counselors(self):
+        url = reverse('get_counselors') + f"?specialization={self.data['specialization'].id}"
+        response = self.assertBudget(self.data['student'], url, 3)
+        counselor = self.data['counselor']
+        self.assertIn(counselor.id, [c['id'] for c in response.json()])
+
+    def test_get_counselors_cached(self):
+        url = reverse('get_counselors') + f"?specialization={self.data['specialization'].id}"
+        self.assertBudget(self.data['student'], url, 3)
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+    def test_get_counselors_sees_edits_from_other_workers(self):
+        url = reverse('get_counselors') + f"?specialization={self.data['specialization'].id}"
+        counselor = self.data['counselor']
+        self.assertBudget(self.data['student'], url, 3)
+        # The version lives where every worker can see it, not in this
+        # process's private cache
+        self.assertIsNotNone(caches[directory.CACHE].get(directory.VERSION_KEY))
+        self.assertIsNone(cache.get(directory.VERSION_KEY))
+
+        # Another worker unapproves the counselor and bumps the version;
+        # no signal runs in this process
+        User.objects.filter(pk=counselor.pk).update(is_approved=False)
+        caches[directory.CACHE].incr(directory.VERSION_KEY)
+        self.assertNotIn(counselor.id, [c['id'] for c in self.client.get(url).json()])
+
+    def test_download_book(self):
+        book = Book.objects.get(title='Guide 0')
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            os.makedirs(os.path.join(media_root, 'books'))
+            with open(os.path.join(media_root, book.file.name), 'wb') as f:
+                f.write(b'%PDF-1.4')
+            response = self.assertBudget(
+                self.data['student'], reverse('download_book', args=[book.id]), 3
+            )
+            response.close()
+
+    async def test_download_book_under_asgi(self):
+        book = await Book.objects.aget(title='Guide 0')
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            os.makedirs(os.path.join(media_root, 'books'))
+            with open(os.path.join(media_root, book.file.name), 'wb') as f:
+                f.write(b'%PDF-1.4 sample')
+            await self.async_client.aforce_login(self.data['student'])
+            url = reverse('download_book', args=[book.id])
+
+            response = await self.async_client.get(url)
+            self.assertTrue(response.is_async)
+            self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), b'%PDF-1.4 sample')
+
+            response = await self.async_client.get(url, headers={'Range': 'bytes=-6'})
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response['Content-Range'], 'bytes 9-14/15')
+            self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), b'sample')
+
+    def test_parse_range(self):
+        self.assertEqual(downloads.parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(downloads.parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(downloads.parse_range('bytes=90-', 100), (90, 99))
+        self.assertIsNone(downloads.parse_range('bytes=0-1,5-6', 100))
+        self.assertIs(downloads.parse_range('bytes=100-', 100), False)
+        # Nothing to send from an empty file, suffix or not
+        self.assertIs(downloads.parse_range('bytes=-5', 0), False)
+        self.assertIs(downloads.parse_range('bytes=0-', 0), False)
+
+    def test_search_books(self):
+        for book in Book.objects.all():
+            search.index_title(book.pk, book.title)
+        response = self.assertBudget(self.data['student'], reverse('search_books') + '?q=guid', 4)
+        self.assertEqual(len(response.json()['results']), 3)
+
+    def test_open_slots(self):
+        url = reverse('open_slots') + f"?specialization={self.data['specialization'].id}&date=2026-01-05"
+        self.assertBudget(self.data['student'], url, 5)
+
+
+class StudentIndexTests(TestCase):
+    def test_bulk_and_single_rows_index_the_same_name(self):
+        students = User.objects.bulk_create([
+            User(username=f'sn{i}', role='student', first_name=first, last_name=last)
+            for i, (first, last) in enumerate([('Ama', 'Mensah'), ('Ama', ''), ('', 'Mensah'), ('', '')])
+        ])
+        student_search.index_many([student.pk for student in students])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid, name FROM {student_search.TABLE}')
+            indexed = dict(cursor.fetchall())
+        self.assertEqual(indexed, {
+            student.pk: student_search._name(student.first_name, student.last_name, student.username)
+            for student in students
+        })
+
+
+class AvailabilityTests(TestCase):
+    MONDAY = datetime.date(2026, 1, 5)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed(students=2, counselors=1, appointments_per_student=1)
+        cls.counselor = cls.data['counselor']
+        cls.student = cls.data['student']
+
+    def at(self, hour, minute=0, date=MONDAY):
+        now = timezone.make_aware(datetime.datetime.combine(date, datetime.time(hour, minute)))
+        return mock.patch.object(timezone, 'now', return_value=now)
+
+    def appointment(self, slot, date=MONDAY):
+        return Appointment(
+            student=self.student, counselor=self.counselor,
+            specialization=self.data['specialization'], date=date, time=slot,
+        )
+
+    def free_slots(self, date=MONDAY):
+        return availability.SlotIndex([self.counselor.id], date, date).free_slots(self.counselor.id, date)
+
+    def test_open_slots_skip_booked_and_started_slots(self):
+        # seed() booked 08:00 and 09:00 on Monday.
+        with self.at(7):
+            self.assertEqual(self.free_slots()[0], datetime.time(10, 0))
+        with self.at(10, 30):
+            self.assertEqual(self.free_slots()[0], datetime.time(11, 0))
+        with self.at(17, 0, date=self.MONDAY + datetime.timedelta(days=1)):
+            self.assertEqual(self.free_slots(), [])
+        with self.at(10, 30, date=self.MONDAY - datetime.timedelta(days=7)):
+            self.assertEqual(len(self.free_slots()), 7)
+
+    def test_book_rejects_started_slot(self):
+        with self.at(10, 30), self.assertRaisesMessage(availability.SlotUnavailable, 'already started'):
+            availability.book(self.appointment(datetime.time(10, 0)))
+        self.assertFalse(Appointment.objects.filter(date=self.MONDAY, time=datetime.time(10, 0)).exists())
+
+    def test_unique_counselor_slot(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.appointment(datetime.time(8, 0)).save()
+
+    def test_book_loses_race_for_same_slot(self):
+        # Both students pass the checks before either saves; the constraint
+        # decides, and the loser gets SlotUnavailable instead of a 500.
+        slot = datetime.time(11, 0)
+        other = User.objects.filter(role='student').exclude(pk=self.student.pk).get()
+        rival = Appointment(
+            student=other, counselor=self.counselor,
+            specialization=self.data['specialization'], date=self.MONDAY, time=slot,
+        )
+        check = availability.check_working_hours
+
+        def race(*args):
+            check(*args)
+            rival.save()
+
+        with self.at(7), mock.patch.object(availability, 'check_working_hours', side_effect=race):
+            with self.assertRaisesMessage(availability.SlotUnavailable, 'already booked'):
+                availability.book(self.appointment(slot))
+        self.assertEqual(
+            list(Appointment.objects.filter(date=self.MONDAY, time=slot).values_list('student', flat=True)),
+            [other.pk],
+        )
+
+class BookUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.media_root = media_root.name
+        self.client.force_login(User.objects.create(username='counselor', role='counselor'))
+
+    def start(self, filename='guide.pdf', size=10):
+        return self.client.post(reverse('start_book_upload'), {
+            'title': 'Guide', 'filename': filename, 'size': size,
+        })
+
+    def put(self, upload_id, offset, data):
+        return self.client.put(
+            reverse('book_upload', args=[upload_id]), data,
+            content_type='application/octet-stream', headers={'Upload-Offset': str(offset)},
+        )
+
+    def test_resume(self):
+        content = b'0123456789'
+        upload_id = self.start().json()['id']
+        self.assertEqual(self.put(upload_id, 0, content[:4]).json()['offset'], 4)
+
+        # A chunk that doesn't start where the upload left off is refused
+        response = self.put(upload_id, 6, content[6:])
+        self.assertEqual((response.status_code, response.json()['offset']), (409, 4))
+
+        # Resumed after a restart: the running hash is rebuilt from disk
+        uploads._hashers.clear()
+        self.assertEqual(self.client.get(reverse('book_upload', args=[upload_id])).json()['offset'], 4)
+        response = self.put(upload_id, 4, content[4:])
+        self.assertEqual(response.status_code, 201)
+
+        book = Book.objects.get(pk=response.json()['book'])
+        self.assertEqual(book.sha256, hashlib.sha256(content).hexdigest())
+        with book.file.open('rb') as f:
+            self.assertEqual(f.read(), content)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(uploads._partial_path(upload_id)))
+        self.assertTrue(uploads._partial_path(upload_id).startswith(self.media_root))
+
+    def test_identical_uploads_share_a_file(self):
+        for _ in range(2):
+            upload_id = self.start().json()['id']
+            self.assertEqual(self.put(upload_id, 0, b'same bytes').status_code, 201)
+        first, second = Book.objects.order_by('pk')
+        self.assertEqual(first.file.name, second.file.name)
+        blobs = [name for _, _, names in os.walk(os.path.join(self.media_root, 'books')) for name in names]
+        self.assertEqual(len(blobs), 1)
+
+    def test_file_type_is_checked(self):
+        response = self.start(filename='setup.exe')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadSession.objects.exists())
+
+        # Sessions opened without the check are stopped when they finish
+        session = UploadSession.objects.create(
+            uploaded_by=User.objects.get(username='counselor'), title='Tool', filename='tool.exe', size=3,
+        )
+        self.assertEqual(self.put(session.pk, 0, b'MZ!').status_code, 400)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(Book.objects.exists())
+
+        response = self.client.post(reverse('upload_book'), {
+            'title': 'Tool', 'file': SimpleUploadedFile('tool.exe', b'MZ!'),
+        })
+        self.assertIn('file', response.context['form'].errors)
+
+
+class BookIndexTests(SimpleTestCase):
+    def test_failed_extraction_is_logged(self):
+        future = Future()
+        future.set_exception(ValueError("Corrupt PDF"))
+        with self.assertLogs('counseling.search', 'ERROR') as logs:
+            search._store(7, future)
+        self.assertIn('book 7', logs.output[0])
+
+
+# =========================
+# CONDITIONAL GET
+# =========================
+class ConditionalGetTests(QueryBudgetTestCase):
+    def assertNotModified(self, user, url, budget):
+        """A repeat request with the first response's ETag gets a 304."""
+        self.client.force_login(user)
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(budget):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def test_dashboards(self):
+        self.assertNotModified(self.data['admin'], reverse('admin_dashboard'), 2)
+        self.assertNotModified(self.data['student'], reverse('student_dashboard'), 2)
+        self.assertNotModified(self.data['counselor'], reverse('counselor_dashboard'), 3)
+
+    def test_json_endpoints(self):
+        url = reverse('get_counselors') + f"?specialization={self.data['specialization'].id}"
+        self.assertNotModified(self.data['student'], url, 2)
+
+        url = reverse('counselor_appointments_ajax')
+        etag = self.assertNotModified(self.data['counselor'], url, 3)
+        appointment = self.data['appointment']
+        appointment.status = 'approved'
+        appointment.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_no_validators_with_local_versions(self):
+        url = reverse('student_dashboard')
+        self.client.force_login(self.data['student'])
+        etag = self.client.get(url)['ETag']
+        with mock.patch.object(fragments, 'VERSION_CACHE', 'default'):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+    def test_etag_expires(self):
+        url = reverse('admin_dashboard')
+        self.client.force_login(self.data['admin'])
+        etag = self.client.get(url)['ETag']
+        later = time.time() + fragments.TIMEOUT
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_changes_invalidate(self):
+        url = reverse('manage_specializations')
+        etag = self.assertNotModified(self.data['admin'], url, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Specialization.objects.create(name='Finance')
+        self.assertContains(self.client.get(url, HTTP_IF_NONE_MATCH=etag), 'Finance')
+
+        # Same data, different user: the ETag doesn't carry over
+        url = reverse('student_books')
+        etag = self.assertNotModified(self.data['student'], url, 2)
+        self.client.force_login(self.data['counselor'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+# =========================
+# PAGINATION
+# =========================
+class KeysetPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        caller = User.objects.create(username='caller', role='student')
+        receiver = User.objects.create(username='receiver', role='counselor')
+        # Pairs sharing a millisecond, plus a tie on the whole timestamp
+        base = timezone.now().replace(microsecond=0)
+        offsets = [0, 100, 200, 1100, 1200, 1200, 5000]
+        cls.calls = [
+            CallLog.objects.create(
+                caller=caller, receiver=receiver, call_type='voice', status='missed',
+                started_at=base + datetime.timedelta(microseconds=offset),
+            )
+            for offset in offsets
+        ]
+        cls.keys = ['-started_at', '-id']
+        cls.expected = [
+            call.id for call in sorted(cls.calls, key=lambda c: (c.started_at, c.id), reverse=True)
+        ]
+
+    def page(self, query=''):
+        request = RequestFactory().get('/calls/' + query)
+        return KeysetPage(request, CallLog.objects.all(), self.keys, per_page=2)
+
+    def test_cursor_round_trip(self):
+        values = [
+            self.calls[1].started_at, datetime.date(2026, 1, 5),
+            datetime.time(9, 30, 0, 123456), None, 'text', 7,
+        ]
+        self.assertEqual(decode_cursor(encode_cursor(values), len(values)), values)
+        self.assertIsNone(decode_cursor('not-a-cursor', 2))
+
+    def test_cursor_with_wrong_types_is_ignored(self):
+        first = [obj.id for obj in self.page()]
+        started_at = self.calls[1].started_at
+        for values in [['abc', 'abc'], [started_at, 'abc'], [7, self.calls[1].id], [started_at, [1]]]:
+            cursor = encode_cursor(values)
+            for param in ['after', 'before']:
+                page = self.page(f'?{param}={cursor}')
+                self.assertEqual([obj.id for obj in page], first)
+                self.assertFalse(page.has_previous)
+
+        self.client.force_login(User.objects.create(username='admin', role='admin', is_staff=True))
+        response = self.client.get(reverse('manage_students') + f"?after={encode_cursor(['abc'] * 5)}")
+        self.assertEqual(response.status_code, 200)
+
+    def test_walk_forward_and_back(self):
+        pages = [self.page()]
+        while pages[-1].next_url:
+            pages.append(self.page(pages[-1].next_url))
+        self.assertEqual([obj.id for page in pages for obj in page], self.expected)
+        self.assertFalse(pages[0].has_previous)
+
+        # Previous from each page lands exactly on the page before it
+        for earlier, later in zip(pages, pages[1:]):
+            back = self.page(later.previous_url)
+            self.assertEqual([obj.id for obj in back], [obj.id for obj in earlier])
+
+
+# =========================
+# MULTI-WORKER STATE
+# =========================
+class ChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.socket_dir = tmp.name
+
+    def layer(self, **config):
+        layer = layers.UnixSocketChannelLayer(socket_dir=self.socket_dir, **config)
+        self.addCleanup(async_to_sync(layer.close))
+        return layer
+
+    async def test_send_group_send_receive(self):
+        layer = self.layer()
+        channel = await layer.new_channel()
+        await layer.send(channel, {'type': 'hello', 'n': 1})
+        self.assertEqual(await layer.receive(channel), {'type': 'hello', 'n': 1})
+
+        await layer.group_add('room', channel)
+        await layer.group_send('room', {'type': 'chat', 'text': 'hi'})
+        self.assertEqual(await layer.receive(channel), {'type': 'chat', 'text': 'hi'})
+        await layer.group_discard('room', channel)
+        await layer.group_send('room', {'type': 'chat', 'text': 'gone'})
+        self.assertNotIn(channel, layer.channels)
+
+    async def test_delivery_between_workers(self):
+        first, second = self.layer(), self.layer()
+        a, b = await first.new_channel(), await second.new_channel()
+        await second.group_add('room', b)
+
+        # Specific channels go to their owner; groups fan out to every worker
+        await first.send(b, {'type': 'direct'})
+        await first.group_send('room', {'type': 'broadcast'})
+        received = [await asyncio.wait_for(second.receive(b), 1) for _ in range(2)]
+        self.assertEqual([m['type'] for m in received], ['direct', 'broadcast'])
+        self.assertNotIn(a, first.channels)
+
+    async def test_expiry(self):
+        layer = self.layer(expiry=60, group_expiry=3600)
+        channel = await layer.new_channel()
+        await layer.group_add('room', channel)
+        await layer.send(channel, {'type': 'late'})
+
+        with mock.patch.object(layers.time, 'time', return_value=time.time() + 61):
+            layer._clean_expired()
+        self.assertNotIn(channel, layer.channels)
+        self.assertNotIn(channel, layer.groups.get('room', {}))
+        self.assertEqual(layer.metrics()['expired'], 1)
+
+
+class PresenceRegistryTests(TestCase):
+    def setUp(self):
+        caches[presence.CACHE].clear()
+        self.user = User.objects.create(username='counselor', role='counselor')
+
+    def test_online_until_last_socket_closes(self):
+        # Two tabs, as if on two different workers
+        self.assertTrue(presence.registry.connect(self.user.id, 'specific.w1!a'))
+        self.assertFalse(presence.registry.connect(self.user.id, 'specific.w2!b'))
+        self.assertTrue(presence.is_online(self.user.id))
+
+        self.assertFalse(presence.registry.disconnect(self.user.id, 'specific.w1!a'))
+        self.assertTrue(presence.is_online(self.user.id))
+        self.assertTrue(UserStatus.objects.get(user=self.user).is_online)
+
+        self.assertTrue(presence.registry.disconnect(self.user.id, 'specific.w2!b'))
+        self.assertFalse(presence.is_online(self.user.id))
+        self.assertFalse(UserStatus.objects.get(user=self.user).is_online)
+
+    def test_sweep_prunes_sockets_of_dead_workers(self):
+        presence.registry.connect(self.user.id, 'specific.w1!a')
+        # Past the kernel's largest pid, so never a live process
+        PresenceConnection.objects.update(pid=2 ** 22 + 1)
+        UserStatus.objects.update(last_seen=timezone.now() - datetime.timedelta(hours=1))
+
+        self.assertEqual(presence.sweep(), 1)
+        self.assertFalse(PresenceConnection.objects.exists())
+        self.assertFalse(presence.is_online(self.user.id))
+
+
+@mock.patch.object(calls, 'ensure_reaper')
+class CallLifecycleTests(TestCase):
+    def setUp(self):
+        caches[calls.CACHE].clear()
+        self.caller = User.objects.create(username='caller', role='student')
+        self.receiver = User.objects.create(username='receiver', role='counselor')
+        self.addCleanup(lambda: [calls.registry.remove(call_id) for call_id in calls.registry.ids()])
+
+    def status(self, call):
+        return CallLog.objects.get(pk=call.id).status
+
+    def test_answer_and_hang_up(self, _):
+        call = calls.ring(self.caller.id, self.receiver.id, 'video')
+        self.assertEqual(self.status(call), 'ringing')
+        # Only the receiver answers
+        with self.assertRaises(calls.InvalidTransition):
+            calls.answer(call.id, self.caller.id)
+
+        calls.answer(call.id, self.receiver.id)
+        self.assertEqual(self.status(call), 'ongoing')
+        self.assertIsNotNone(CallLog.objects.get(pk=call.id).answered_at)
+        with self.assertRaises(calls.InvalidTransition):
+            calls.decline(call.id, self.receiver.id)
+
+        calls.hang_up(call.id, self.caller.id)
+        log = CallLog.objects.get(pk=call.id)
+        self.assertEqual(log.status, 'completed')
+        self.assertIsNotNone(log.ended_at)
+        self.assertNotIn(call.id, calls.registry.ids())
+        with self.assertRaises(calls.InvalidTransition):
+            calls.hang_up(call.id, self.caller.id)
+
+    def test_unanswered_calls_are_missed(self, _):
+        declined = calls.ring(self.caller.id, self.receiver.id, 'voice')
+        calls.decline(declined.id, self.receiver.id)
+        cancelled = calls.ring(self.caller.id, self.receiver.id, 'voice')
+        calls.hang_up(cancelled.id, self.caller.id)
+        self.assertEqual([self.status(declined), self.status(cancelled)], ['missed', 'missed'])
+
+    def test_reap(self, _):
+        now = timezone.now()
+        rang = calls.ring(self.caller.id, self.receiver.id, 'voice')
+        idle = calls.ring(self.caller.id, self.receiver.id, 'video')
+        calls.answer(idle.id, self.receiver.id)
+        fresh = calls.ring(self.caller.id, self.receiver.id, 'voice')
+        rang.started_at = now - datetime.timedelta(seconds=calls.RING_TIMEOUT + 1)
+        idle.last_seen = now - datetime.timedelta(seconds=calls.IDLE_TIMEOUT + 1)
+        # Left open by a worker that died, so in no registry
+        orphan = CallLog.objects.create(
+            caller=self.caller, receiver=self.receiver, call_type='voice',
+            started_at=now - datetime.timedelta(minutes=5),
+        )
+
+        self.assertEqual(calls.reap(now=now), 3)
+        self.assertEqual(self.status(rang), 'missed')
+        self.assertEqual(self.status(idle), 'completed')
+        # An idle call ended when it was last heard from
+        self.assertEqual(CallLog.objects.get(pk=idle.id).ended_at, idle.last_seen)
+        self.assertEqual(CallLog.objects.get(pk=orphan.pk).status, 'missed')
+        self.assertEqual(self.status(fresh), 'ringing')
+        self.assertEqual(calls.registry.ids(), [fresh.id])
+
+    def test_transition_sees_changes_made_by_another_worker(self, _):
+        call = calls.ring(self.caller.id, self.receiver.id, 'voice')
+        # Answered through another worker, so this registry still says ringing
+        CallLog.objects.filter(pk=call.id).update(status='ongoing', answered_at=timezone.now())
+        calls.hang_up(call.id, self.caller.id)
+        self.assertEqual(CallLog.objects.get(pk=call.id).status, 'completed')
+
+    def test_reap_counts_signs_of_life_from_other_workers(self, _):
+        call = calls.ring(self.caller.id, self.receiver.id, 'voice')
+        calls.answer(call.id, self.receiver.id)
+        later = call.last_seen + datetime.timedelta(seconds=calls.IDLE_TIMEOUT + 10)
+        # Relayed by another worker: only the shared cache hears about it
+        caches[calls.CACHE].set(calls._seen_key(call.id), later)
+
+        self.assertEqual(calls.reap(now=later + datetime.timedelta(seconds=1)), 0)
+        self.assertEqual(calls.reap(now=later + datetime.timedelta(seconds=calls.IDLE_TIMEOUT + 1)), 1)
+        self.assertEqual(CallLog.objects.get(pk=call.id).ended_at, later)
+
+
+# =========================
+# WEBSOCKETS
+# =========================
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+@mock.patch.object(calls, 'ensure_reaper')
+class SignalingConsumerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create(username='student', role='student')
+        cls.counselor = User.objects.create(username='counselor', role='counselor')
+        cls.appointment = Appointment.objects.create(
+            student=cls.student, counselor=cls.counselor,
+            specialization=Specialization.objects.create(name='Wellbeing'),
+            date=datetime.date(2026, 1, 5), time=datetime.time(9, 0),
+        )
+
+    def tearDown(self):
+        for call_id in calls.registry.ids():
+            calls.registry.remove(call_id)
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(
+            consumers.SignalingConsumer.as_asgi(), f'/ws/call/{self.appointment.id}/',
+        )
+        communicator.scope['user'] = user
+        communicator.scope['url_route'] = {'kwargs': {'appointment_id': self.appointment.id}}
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_offer_answer_relay(self, _):
+        student, counselor = await self.connect(self.student), await self.connect(self.counselor)
+
+        await student.send_json_to({'type': 'offer', 'call_type': 'voice', 'data': {'sdp': 'offer'}})
+        ringing = await student.receive_json_from()
+        self.assertEqual((ringing['type'], ringing['state']), ('call_state', 'ringing'))
+        call_id = ringing['call_id']
+        self.assertEqual((await counselor.receive_json_from())['state'], 'ringing')
+        self.assertEqual(await counselor.receive_json_from(), {
+            'type': 'offer', 'call_id': call_id, 'data': {'sdp': 'offer'},
+        })
+        # Relayed to the peer only
+        self.assertTrue(await student.receive_nothing())
+
+        await counselor.send_json_to({'type': 'answer', 'call_id': call_id, 'data': {'sdp': 'answer'}})
+        self.assertEqual((await student.receive_json_from())['state'], 'ongoing')
+        self.assertEqual(await student.receive_json_from(), {
+            'type': 'answer', 'call_id': call_id, 'data': {'sdp': 'answer'},
+        })
+        self.assertEqual((await counselor.receive_json_from())['state'], 'ongoing')
+
+        # Closing the page hangs up
+        await student.disconnect()
+        self.assertEqual((await counselor.receive_json_from())['state'], 'completed')
+        await counselor.disconnect()
+
+    async def test_keepalive_reaches_the_shared_cache(self, _):
+        student = await self.connect(self.student)
+        await student.send_json_to({'type': 'keepalive', 'call_id': 7})
+        self.assertTrue(await student.receive_nothing())
+        seen = await caches[calls.CACHE].aget(calls._seen_key(7))
+        self.assertIsNotNone(seen)
+        await caches[calls.CACHE].adelete(calls._seen_key(7))
+        await student.disconnect()
+
+    async def test_ice_candidates_are_batched(self, _):
+        student, counselor = await self.connect(self.student), await self.connect(self.counselor)
+        for n in range(3):
+            await student.send_json_to({'type': 'ice_candidate', 'call_id': 5, 'data': {'n': n}})
+        batch = await counselor.receive_json_from(timeout=1)
+        self.assertEqual(batch, {'type': 'ice_candidates', 'call_id': 5, 'data': [{'n': 0}, {'n': 1}, {'n': 2}]})
+        self.assertTrue(await counselor.receive_nothing())
+
+        # A full batch goes at once, and candidates never trail a later frame
+        with mock.patch.object(consumers, 'ICE_BATCH_MAX', 2), \
+                mock.patch.object(consumers, 'ICE_BATCH_DELAY', 60):
+            await student.send_json_to({'type': 'ice_candidates', 'call_id': 5, 'data': [{'n': 3}, {'n': 4}]})
+            self.assertEqual(len((await counselor.receive_json_from())['data']), 2)
+            await student.send_json_to({'type': 'ice_candidate', 'call_id': 5, 'data': {'n': 5}})
+            await student.send_json_to({'type': 'offer', 'call_id': 5, 'data': {'sdp': 'renegotiate'}})
+            self.assertEqual((await counselor.receive_json_from())['data'], [{'n': 5}])
+            self.assertEqual((await counselor.receive_json_from())['type'], 'offer')
+        await student.disconnect()
+        await counselor.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChatConsumerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create(username='student', role='student')
+        cls.counselor = User.objects.create(username='counselor', role='counselor')
+        cls.appointment = Appointment.objects.create(
+            student=cls.student, counselor=cls.counselor,
+            specialization=Specialization.objects.create(name='Wellbeing'),
+            date=datetime.date(2026, 1, 5), time=datetime.time(9, 0),
+        )
+
+    def setUp(self):
+        caches[presence.CACHE].clear()
+        self.addCleanup(caches[presence.CACHE].clear)
+        # A failed test must not leave messages for the exit-time flush
+        self.addCleanup(consumers.chat_buffer._take)
+
+    async def connect(self, user, subprotocols=None):
+        communicator = WebsocketCommunicator(
+            consumers.ChatConsumer.as_asgi(), f'/ws/chat/{self.appointment.id}/',
+            subprotocols=subprotocols,
+        )
+        communicator.scope['user'] = user
+        communicator.scope['url_route'] = {'kwargs': {'appointment_id': self.appointment.id}}
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        communicator.binary = subprotocol == framing.MSGPACK_SUBPROTOCOL
+        # Skip the presence frames and history sent on connect
+        while (await self.receive(communicator))['type'] != 'chat_history':
+            pass
+        while not await communicator.receive_nothing():
+            await self.receive(communicator)
+        return communicator, subprotocol
+
+    async def receive(self, communicator):
+        """Next frame, checking it came in the form the socket negotiated."""
+        frame = await communicator.receive_from()
+        if communicator.binary:
+            self.assertIsInstance(frame, bytes)
+            return msgpack.unpackb(frame, raw=False)
+        self.assertIsInstance(frame, str)
+        return json.loads(frame)
+
+    async def next_chat_message(self, communicator):
+        while (frame := await self.receive(communicator))['type'] != 'chat_message':
+            pass
+        return frame
+
+    async def test_msgpack_and_json_clients_share_a_room(self):
+        student, subprotocol = await self.connect(self.student, [framing.MSGPACK_SUBPROTOCOL])
+        self.assertEqual(subprotocol, framing.MSGPACK_SUBPROTOCOL)
+        counselor, subprotocol = await self.connect(self.counselor)
+        self.assertIsNone(subprotocol)
+
+        await student.send_to(bytes_data=msgpack.packb({'message': 'hello'}))
+        self.assertEqual((await self.next_chat_message(student))['message'], 'hello')
+        received = await self.next_chat_message(counselor)
+        self.assertEqual((received['message'], received['sender']), ('hello', 'student'))
+
+        await counselor.send_json_to({'message': 'hi'})
+        self.assertEqual((await self.next_chat_message(student))['message'], 'hi')
+        self.assertEqual((await self.next_chat_message(counselor))['message'], 'hi')
+
+        await student.disconnect()
+        await counselor.disconnect()
+        stored = await database_sync_to_async(list)(
+            ChatMessage.objects.filter(appointment=self.appointment).order_by('id').values_list('message', flat=True)
+        )
+        self.assertEqual(stored, ['hello', 'hi'])
+
+    async def test_malformed_frames_are_ignored(self):
+        student, _ = await self.connect(self.student, [framing.MSGPACK_SUBPROTOCOL])
+        for frame in [b'\xc1', b'\x92\x01', msgpack.packb(['not', 'a', 'dict'])]:
+            await student.send_to(bytes_data=frame)
+        await student.send_to(text_data='{not json')
+        self.assertTrue(await student.receive_nothing())
+
+        # The socket is still open and working
+        await student.send_to(bytes_data=msgpack.packb({'message': 'still here'}))
+        self.assertEqual((await self.next_chat_message(student))['message'], 'still here')
+        await student.disconnect()
 
-# Create your tests here.
@@ -0,0 +1,220 @@
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.validators import FileExtensionValidator
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Book, UploadSession
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: chunks are only serialised within one process
+    fcntl = None
+
+# Largest chunk the client is told to send per request
+CHUNK_SIZE = getattr(settings, 'BOOK_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024)
+# Unfinished uploads older than this are removed by prune_upload_sessions
+SESSION_MAX_AGE = timedelta(days=getattr(settings, 'BOOK_UPLOAD_SESSION_DAYS', 2))
+
+# File types accepted for books, by either upload path
+EXTENSIONS = getattr(settings, 'BOOK_FILE_EXTENSIONS', ['pdf', 'epub', 'doc', 'docx', 'txt', 'md'])
+
+BLOCK_SIZE = 64 * 1024
+
+validate_book_file = FileExtensionValidator(allowed_extensions=EXTENSIONS)
+
+# Running hashes of in-progress uploads, so each chunk is hashed once as it
+# is written, with the byte count each covers. Rebuilt from the partial
+# file after a restart or when another process took the last chunk.
+_hashers = {}
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+class UploadConflict(Exception):
+    """The chunk doesn't start where the upload left off."""
+
+    def __init__(self, offset):
+        super().__init__(f"Expected a chunk starting at byte {offset}")
+        self.offset = offset
+
+
+# =========================
+# CONTENT-ADDRESSED STORAGE
+# =========================
+def blob_name(digest, filename):
+    """books/ab/cd/abcd....pdf -- the name depends only on the content."""
+    ext = os.path.splitext(filename)[1].lower()
+    return f'books/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+
+def store(digest, filename, content):
+    """Save ``content`` under its blob name unless that blob already exists."""
+    name = blob_name(digest, filename)
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, content)
+        if saved != name:
+            # Lost a race with an identical upload; keep the first copy
+            default_storage.delete(saved)
+    return name
+
+
+def save_uploaded_file(uploaded):
+    """Hash a Django UploadedFile and store it. Returns (name, digest)."""
+    hasher = hashlib.sha256()
+    for chunk in uploaded.chunks():
+        hasher.update(chunk)
+    uploaded.seek(0)
+    digest = hasher.hexdigest()
+    return store(digest, uploaded.name, uploaded), digest
+
+
+# =========================
+# CHUNKED UPLOADS
+# =========================
+def _partial_path(session_id):
+    path = os.path.join(settings.MEDIA_ROOT, 'uploads', f'{session_id}.part')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+@contextmanager
+def _locked(session_id):
+    """
+    The partial file opened for appending, locked against every other
+    writer. The lock is on the file, so it holds across worker processes.
+    """
+    with open(_partial_path(session_id), 'ab') as f:
+        if fcntl is None:
+            with _locks_guard:
+                lock = _locks.setdefault(session_id, threading.Lock())
+            with lock:
+                yield f
+            return
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield f
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _hasher(session):
+    """The running hash for ``session``, re-read from disk if we lost it."""
+    covered, hasher = _hashers.get(session.pk, (None, None))
+    # Another process may have taken the last chunk
+    if covered != session.received:
+        hasher = hashlib.sha256()
+        path = _partial_path(session.pk)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                remaining = session.received
+                while remaining > 0:
+                    block = f.read(min(BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    hasher.update(block)
+                    remaining -= len(block)
+    return hasher
+
+
+def start(user, title, filename, size):
+    """Open an upload session; raises ValidationError for a file type books can't be."""
+    validate_book_file(File(None, name=filename))
+    return UploadSession.objects.create(
+        uploaded_by=user, title=title, filename=os.path.basename(filename), size=size,
+    )
+
+
+def append(session, offset, stream, length):
+    """
+    Write ``length`` bytes read from ``stream`` at ``offset``, hashing them
+    on the way to disk. Returns the finished Book once the last byte is in,
+    otherwise None. Raises UploadSession.DoesNotExist if the upload
+    finished or was pruned meanwhile.
+    """
+    with _locked(session.pk) as f:
+        try:
+            session.refresh_from_db(fields=['received'])
+        except UploadSession.DoesNotExist:
+            # Opening the partial file recreated it
+            _discard(session.pk)
+            raise
+        if offset != session.received or offset + length > session.size:
+            raise UploadConflict(session.received)
+
+        hasher = _hasher(session)
+        # Drop bytes past `received` left by a write that died midway
+        f.truncate(session.received)
+        remaining = length
+        while remaining > 0:
+            block = stream.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            f.write(block)
+            hasher.update(block)
+            remaining -= len(block)
+        f.flush()
+
+        session.received += length - remaining
+        _hashers[session.pk] = (session.received, hasher)
+        UploadSession.objects.filter(pk=session.pk).update(
+            received=session.received, updated_at=timezone.now()
+        )
+        # A short read means the client went away mid-chunk; it resumes
+        # from `received`
+        if session.received < session.size:
+            return None
+        return _finish(session, hasher.hexdigest())
+
+
+def _finish(session, digest):
+    session_id = session.pk
+    path = _partial_path(session_id)
+    with open(path, 'rb') as f:
+        content = File(f, name=session.filename)
+        try:
+            # Checked when the session opened too; this covers sessions
+            # opened before the check, or under other settings
+            validate_book_file(content)
+        except ValidationError:
+            session.delete()
+            _discard(session_id)
+            raise
+        name = store(digest, session.filename, content)
+
+    with transaction.atomic():
+        book = Book.objects.create(
+            title=session.title, file=name, sha256=digest, uploaded_by=session.uploaded_by,
+        )
+        session.delete()
+    _discard(session_id)
+    return book
+
+
+def _discard(session_id):
+    _hashers.pop(session_id, None)
+    with _locks_guard:
+        _locks.pop(session_id, None)
+    try:
+        os.remove(_partial_path(session_id))
+    except FileNotFoundError:
+        pass
+
+
+def prune_sessions():
+    stale = list(UploadSession.objects.filter(
+        updated_at__lt=timezone.now() - SESSION_MAX_AGE
+    ).values_list('pk', flat=True))
+    for session_id in stale:
+        _discard(session_id)
+    UploadSession.objects.filter(pk__in=stale).delete()
+    return len(stale)
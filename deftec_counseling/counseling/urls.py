@@ -18,6 +18,8 @@ urlpatterns = [
     path('manage_students/', views.manage_students, name='manage_students'),
     path('approve_student/<int:student_id>/', views.approve_student, name='approve_student'),
     path('reject_student/<int:student_id>/', views.reject_student, name='reject_student'),
+    path('students/bulk-approval/', views.bulk_student_approval, name='bulk_student_approval'),
+    path('students/import/', views.import_students, name='import_students'),
 
     path('manage_counselors/', views.manage_counselors, name='manage_counselors'),
     path('add_counselor/', views.add_counselor, name='add_counselor'),
@@ -31,6 +33,7 @@ urlpatterns = [
     path('admin_appointments/', views.view_appointments, name='view_appointments'),
     path('admin_call_logs/', views.admin_call_logs, name='admin_call_logs'),
     path('export-students/', views.export_students_excel, name='export_students_excel'),
+    path('export-students/csv/', views.export_students_csv, name='export_students_csv'),
 
     # =======================
     # Student
@@ -52,16 +55,21 @@ urlpatterns = [
     # AJAX for counselor dashboard
     path('ajax/counselor_appointments/', views.counselor_appointments_ajax, name='counselor_appointments_ajax'),
     path('ajax/get_counselors/', views.get_counselors, name='get_counselors'),
+    path('ajax/student_autocomplete/', views.student_autocomplete, name='student_autocomplete'),
+    path('ajax/open_slots/', views.open_slots, name='open_slots'),
 
     # =======================
     # Calls
     # =======================
-    path('start_call/<int:receiver_id>/<str:call_type>/', views.start_call, name='start_call'),
     path('end_call/<int:call_id>/', views.end_call, name='end_call'),
 
     # =======================
     # Books
     # =======================
     path('upload-book/', views.upload_book, name='upload_book'),
+    path('upload-book/chunked/', views.start_book_upload, name='start_book_upload'),
+    path('upload-book/chunked/<uuid:upload_id>/', views.book_upload, name='book_upload'),
     path('books/', views.student_books, name='student_books'),
+    path('books/search/', views.search_books, name='search_books'),
+    path('books/<int:pk>/download/', views.download_book, name='download_book'),
 ]
\ No newline at end of file
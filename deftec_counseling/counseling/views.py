@@ -1,22 +1,26 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.contrib.auth import logout
-from django.db.models import Count
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db.models import Count, Max, Q
 from django.utils import timezone
-from django.http import HttpResponse, JsonResponse
-import openpyxl
-from openpyxl.styles import Font
+from django.utils.functional import SimpleLazyObject
+from django.http import Http404, HttpResponseNotAllowed, HttpResponseNotModified, JsonResponse
+from django.views.decorators.http import require_POST
+from datetime import date, timedelta
+from urllib.parse import urlencode
 
 from .models import (
     User,
     Specialization,
     Appointment,
-    ChatMessage,
     UserStatus,
     Counselor,
     CallLog,
-    Book
+    Book,
+    UploadSession,
 )
 
 from .forms import (
@@ -25,7 +29,16 @@ from .forms import (
     SpecializationForm,
     CounselorCreationForm,
     CounselorForm,
-    BookUploadForm
+    BookUploadForm,
+    StudentImportForm,
+)
+from .chat_history import history_page
+from .conditional import conditional
+from .pagination import KeysetPage
+from .routers import report_view
+from . import (
+    availability, calls, directory, downloads, exports, fragments, intake, presence, search,
+    stats, streaming, student_search, sync, uploads,
 )
 
 
@@ -78,64 +91,82 @@ def register(request):
     return render(request, 'counseling/register.html', {'form': form})
 
 
+# =========================
+# CONDITIONAL GET
+# =========================
+def versioned(*scopes):
+    """Validators for a page that changes only with these fragment versions."""
+    def validators(request, *args, **kwargs):
+        parts = fragments.validator(request.user.id, *scopes)
+        return (parts, None) if parts is not None else None
+    return validators
+
+
 # =========================
 # ADMIN DASHBOARD
 # =========================
 @login_required
 @user_passes_test(is_admin)
+@report_view
+@conditional(versioned('stats'))
 def admin_dashboard(request):
-    context = {
-        'students_count': User.objects.filter(role='student').count(),
-        'counselors_count': User.objects.filter(role='counselor').count(),
-        'appointments_count': Appointment.objects.count(),
-        'pending_students': User.objects.filter(role='student', is_approved=False).count(),
-        'students_by_school': User.objects.filter(role='student')
-            .values('school').annotate(count=Count('id')),
-        'students_by_class': User.objects.filter(role='student')
-            .values('class_name').annotate(count=Count('id')),
-    }
-    return render(request, 'counseling/admin_dashboard.html', context)
+    # Lazy, so a cached dashboard section skips the query
+    return render(request, 'counseling/admin_dashboard.html', {
+        'stats': SimpleLazyObject(stats.dashboard_stats),
+        **fragments.context(request.user.id, 'stats'),
+    })
 
 
 # =========================
 # STUDENT MANAGEMENT
 # =========================
-@login_required
-@user_passes_test(is_admin)
-def manage_students(request):
+STUDENT_ORDERING = ['rank', 'service_number', 'first_name', 'last_name', 'id']
+
+
+def filter_students(params):
+    """Students matching the manage_students search form, in display order."""
     students = User.objects.filter(role='student')
 
-    service_query = request.GET.get('service_number', '').strip()
-    rank_filter = request.GET.get('rank', '').strip()
+    service_query = params.get('service_number', '').strip()
+    rank_filter = params.get('rank', '').strip()
 
     if service_query:
-        students = students.filter(service_number__icontains=service_query)
+        students = students.filter(student_search.matching(service_query))
 
     if rank_filter:
-        students = students.filter(rank__iexact=rank_filter)
+        # Exact, so (role, rank, ...) serves both the filter and the ordering
+        students = students.filter(rank=rank_filter)
+
+    students = students.order_by(*STUDENT_ORDERING)
+    return students, service_query, rank_filter
 
-    students = students.order_by('rank', 'service_number', 'first_name', 'last_name')
 
-    ranks = User.objects.filter(role='student') \
-        .exclude(rank__isnull=True) \
-        .exclude(rank__exact='') \
-        .values_list('rank', flat=True) \
-        .distinct()
+@login_required
+@user_passes_test(is_admin)
+@report_view
+def manage_students(request):
+    students, service_query, rank_filter = filter_students(request.GET)
 
     return render(request, 'counseling/manage_students.html', {
-        'students': students,
-        'ranks': ranks,
+        'students': KeysetPage(request, students, STUDENT_ORDERING),
+        'ranks': stats.rank_facet(),
         'service_query': service_query,
         'rank_filter': rank_filter,
     })
 
 
+@login_required
+@user_passes_test(is_admin)
+def student_autocomplete(request):
+    """Service number suggestions for the manage_students search box."""
+    return JsonResponse(student_search.autocomplete(request.GET.get('q', '')), safe=False)
+
+
 @login_required
 @user_passes_test(is_admin)
 def approve_student(request, student_id):
     student = get_object_or_404(User, id=student_id, role='student')
-    student.is_approved = True
-    student.save()
+    intake.set_approval(User.objects.filter(pk=student.pk), True)
     messages.success(request, "Student approved")
     return redirect('manage_students')
 
@@ -144,53 +175,79 @@ def approve_student(request, student_id):
 @user_passes_test(is_admin)
 def reject_student(request, student_id):
     student = get_object_or_404(User, id=student_id, role='student')
-    student.is_approved = False
-    student.save()
+    intake.set_approval(User.objects.filter(pk=student.pk), False)
     messages.warning(request, "Student rejected")
     return redirect('manage_students')
 
 
 @login_required
 @user_passes_test(is_admin)
-def export_students_excel(request):
-    students = User.objects.filter(role='student')
+@require_POST
+def bulk_student_approval(request):
+    """
+    Approve or reject the ticked students, or with scope=all every student
+    matching the manage_students filter, in one UPDATE.
+    """
+    students, service_query, rank_filter = filter_students(request.POST)
+    if request.POST.get('scope') != 'all':
+        ids = [pk for pk in request.POST.getlist('students') if pk.isdigit()]
+        students = students.filter(pk__in=ids)
+
+    approve = request.POST.get('action') == 'approve'
+    changed = intake.set_approval(students, approve)
+    if approve:
+        messages.success(request, f"Approved {changed} student(s)")
+    else:
+        messages.warning(request, f"Rejected {changed} student(s)")
 
-    service_query = request.GET.get('service_number', '').strip()
-    rank_filter = request.GET.get('rank', '').strip()
+    query = urlencode({'service_number': service_query, 'rank': rank_filter})
+    return redirect(reverse('manage_students') + '?' + query)
 
-    if service_query:
-        students = students.filter(service_number__icontains=service_query)
 
-    if rank_filter:
-        students = students.filter(rank__iexact=rank_filter)
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Students"
-
-    headers = ["Service Number", "Rank", "Full Name", "School", "Class", "Status"]
-    ws.append(headers)
-    for col in ws[1]:
-        col.font = Font(bold=True)
-
-    for student in students:
-        full_name = f"{student.first_name} {student.last_name}" if student.first_name or student.last_name else student.username
-        status = "Approved" if student.is_approved else "Pending"
-        ws.append([
-            student.service_number,
-            student.rank,
-            full_name,
-            student.school,
-            student.class_name,
-            status
-        ])
-
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+@login_required
+@user_passes_test(is_admin)
+def import_students(request):
+    result = None
+    if request.method == 'POST':
+        form = StudentImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                result = intake.import_students(
+                    intake.read_roster(form.cleaned_data['roster']),
+                    approve=form.approve(),
+                )
+            except intake.RosterError as e:
+                form.add_error('roster', str(e))
+    else:
+        form = StudentImportForm()
+    return render(request, 'counseling/import_students.html', {'form': form, 'result': result})
+
+
+@login_required
+@user_passes_test(is_admin)
+@report_view
+def export_students_excel(request):
+    students, _, _ = filter_students(request.GET)
+    return exports.xlsx_response(
+        exports.STUDENT_HEADERS,
+        exports.student_rows(students),
+        'students.xlsx',
+        title="Students",
+        asynchronous=streaming.serving_async(request),
+    )
+
+
+@login_required
+@user_passes_test(is_admin)
+@report_view
+def export_students_csv(request):
+    students, _, _ = filter_students(request.GET)
+    return exports.csv_response(
+        exports.STUDENT_HEADERS,
+        exports.student_rows(students),
+        'students.csv',
+        asynchronous=streaming.serving_async(request),
     )
-    response['Content-Disposition'] = 'attachment; filename=students.xlsx'
-    wb.save(response)
-    return response
 
 
 # =========================
@@ -199,7 +256,7 @@ def export_students_excel(request):
 @login_required
 @user_passes_test(is_admin)
 def manage_counselors(request):
-    counselors = Counselor.objects.select_related('user')
+    counselors = KeysetPage(request, Counselor.objects.select_related('user', 'specialization'), ['id'])
     return render(request, 'counseling/manage_counselors.html', {'counselors': counselors})
 
 
@@ -256,7 +313,7 @@ def delete_counselor(request, pk):
 @login_required
 @user_passes_test(is_admin)
 def view_counselor(request, id):
-    counselor = get_object_or_404(Counselor, id=id)
+    counselor = get_object_or_404(Counselor.objects.select_related('user', 'specialization'), id=id)
     return render(request, 'counseling/view_counselor.html', {'counselor': counselor})
 
 
@@ -265,8 +322,9 @@ def view_counselor(request, id):
 # =========================
 @login_required
 @user_passes_test(is_admin)
+@conditional(versioned('specializations'))
 def manage_specializations(request):
-    specs = Specialization.objects.all()
+    specs = KeysetPage(request, Specialization.objects.all(), ['name', 'id'])
     return render(request, 'counseling/manage_specializations.html', {'specs': specs})
 
 
@@ -289,31 +347,44 @@ def add_specialization(request):
 # =========================
 @login_required
 @user_passes_test(is_admin)
+@report_view
 def view_appointments(request):
-    appointments = Appointment.objects.all().order_by('-date', '-time')
+    appointments = KeysetPage(
+        request,
+        Appointment.objects.select_related('student', 'counselor'),
+        ['-date', '-time', '-id'],
+    )
     return render(request, 'counseling/view_appointments.html', {'appointments': appointments})
 
 
 @login_required
+@conditional(versioned('dashboard', 'books', 'specializations'))
 def student_dashboard(request):
     if request.user.role != 'student' or not request.user.is_approved:
         return redirect('login')
 
-    appointments = Appointment.objects.filter(student=request.user).order_by('date', 'time')
-    books = Book.objects.all()
+    appointments = Appointment.objects.filter(student=request.user) \
+        .select_related('student', 'counselor') \
+        .order_by('date', 'time')
+    books = Book.objects.select_related('uploaded_by')
     form = AppointmentForm(request.POST or None)
 
     if request.method == 'POST' and form.is_valid():
         appt = form.save(commit=False)
         appt.student = request.user
-        appt.save()
-        messages.success(request, "Appointment booked")
-        return redirect('student_dashboard')
+        try:
+            availability.book(appt)
+        except availability.SlotUnavailable as e:
+            form.add_error(None, str(e))
+        else:
+            messages.success(request, "Appointment booked")
+            return redirect('student_dashboard')
 
     return render(request, 'counseling/student_dashboard.html', {
         'appointments': appointments,
         'books': books,
-        'form': form
+        'form': form,
+        **fragments.context(request.user.id, 'dashboard', 'books'),
     })
 
 
@@ -324,16 +395,41 @@ def book_appointment(request):
         if form.is_valid():
             appointment = form.save(commit=False)
             appointment.student = request.user
-            appointment.save()
-            messages.success(request, 'Appointment booked successfully.')
-            return redirect('student_dashboard')
+            try:
+                availability.book(appointment)
+            except availability.SlotUnavailable as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(request, 'Appointment booked successfully.')
+        else:
+            for error in form.non_field_errors():
+                messages.error(request, error)
     return redirect('student_dashboard')
 
 
 # =========================
 # COUNSELOR DASHBOARD
 # =========================
+def counselor_status(request):
+    """The counselor's UserStatus, read once per request."""
+    if not hasattr(request, '_counselor_status'):
+        request._counselor_status, _ = UserStatus.objects.get_or_create(user=request.user)
+    return request._counselor_status
+
+
+def counselor_dashboard_validators(request):
+    if request.user.role != 'counselor':
+        return None
+    parts = fragments.validator(request.user.id, 'dashboard', 'calls', 'books')
+    if parts is None:
+        return None
+    # The online badge isn't versioned; reading it is the one query a
+    # revalidation costs
+    return [*parts, counselor_status(request).is_online], None
+
+
 @login_required
+@conditional(counselor_dashboard_validators)
 def counselor_dashboard(request):
     if request.user.role != 'counselor':
         return redirect('login')
@@ -345,22 +441,29 @@ def counselor_dashboard(request):
         messages.error(request, "Counselor profile not found.")
         return redirect('login')
 
-    appointments = Appointment.objects.filter(counselor=request.user).order_by('date', 'time')
-    status, _ = UserStatus.objects.get_or_create(user=request.user)
-
-    total_appointments = appointments.count()
-    pending_count = appointments.filter(status__iexact='pending').count()
-    completed_count = appointments.filter(status__iexact='completed').count()
-    missed_calls = CallLog.objects.filter(receiver=request.user, status='missed')
+    appointments = Appointment.objects.filter(counselor=request.user) \
+        .select_related('student', 'specialization') \
+        .order_by('date', 'time')
+    status = counselor_status(request)
+
+    # Everything below is lazy: sections served from the fragment cache
+    # never run their queries
+    counts = SimpleLazyObject(lambda: Appointment.objects.filter(counselor=request.user).aggregate(
+        total=Count('id'),
+        pending=Count('id', filter=Q(status__iexact='pending')),
+        completed=Count('id', filter=Q(status__iexact='completed')),
+    ))
+    missed_calls = CallLog.objects.filter(receiver=request.user, status='missed').select_related('caller')
+    books = Book.objects.select_related('uploaded_by')
 
     return render(request, 'counseling/counselor_dashboard.html', {
         'counselor_profile': counselor_profile,
         'appointments': appointments,
         'status': status,
         'missed_calls': missed_calls,
-        'total_appointments': total_appointments,
-        'pending_count': pending_count,
-        'completed_count': completed_count,
+        'books': books,
+        'counts': counts,
+        **fragments.context(request.user.id, 'dashboard', 'calls', 'books'),
     })
 
 
@@ -372,17 +475,19 @@ def appointment_list(request):
 
 @login_required
 def appointment_detail(request, appointment_id):
-    appointment = get_object_or_404(Appointment, id=appointment_id)
+    appointment = get_object_or_404(
+        Appointment.objects.select_related('student', 'counselor'), id=appointment_id
+    )
     if request.user not in [appointment.student, appointment.counselor]:
         return redirect('login')
 
-    messages_qs = ChatMessage.objects.filter(appointment=appointment).select_related('sender')
-    counselor_status = UserStatus.objects.filter(user=appointment.counselor).first()
+    chat_messages, history_cursor = history_page(appointment.id)
 
     return render(request, 'counseling/appointment_detail.html', {
         'appointment': appointment,
-        'messages': messages_qs,
-        'counselor_status': counselor_status.is_online if counselor_status else False
+        'messages': chat_messages,
+        'history_cursor': history_cursor,
+        'counselor_status': presence.is_online(appointment.counselor_id)
     })
 
 
@@ -390,41 +495,30 @@ def appointment_detail(request, appointment_id):
 def update_status(request, status):
     if request.user.role != 'counselor':
         return redirect('login')
-    obj, _ = UserStatus.objects.get_or_create(user=request.user)
-    obj.is_online = (status == 'online')
-    obj.save()
+    presence.set_status(request.user.id, status == 'online')
     return redirect('counselor_dashboard')
 
 
 # =========================
 # CALLS
 # =========================
+# Calls are placed over the signaling socket (SignalingConsumer), which
+# carries the WebRTC offer the other side answers
 @login_required
-def start_call(request, receiver_id, call_type):
-    receiver = get_object_or_404(User, id=receiver_id)
-    CallLog.objects.create(
-        caller=request.user,
-        receiver=receiver,
-        call_type=call_type,
-        status='ongoing',
-        started_at=timezone.now()
-    )
-    return redirect(request.META.get('HTTP_REFERER', 'dashboard'))
-
-
-@login_required
+@require_POST
 def end_call(request, call_id):
-    call = get_object_or_404(CallLog, id=call_id)
-    call.ended_at = timezone.now()
-    call.status = 'missed' if call.ended_at == call.started_at else 'completed'
-    call.save()
+    try:
+        calls.hang_up(call_id, request.user.id)
+    except calls.InvalidTransition as e:
+        messages.error(request, str(e))
     return redirect(request.META.get('HTTP_REFERER', 'dashboard'))
 
 
 @login_required
 @user_passes_test(is_admin)
+@report_view
 def admin_call_logs(request):
-    calls = CallLog.objects.all().order_by('-started_at')[:50]
+    calls = KeysetPage(request, CallLog.objects.select_related('caller', 'receiver'), ['-started_at', '-id'])
     return render(request, 'counseling/admin_call_logs.html', {'calls': calls})
 
 
@@ -440,6 +534,7 @@ def upload_book(request):
         form = BookUploadForm(request.POST, request.FILES)
         if form.is_valid():
             book = form.save(commit=False)
+            book.file, book.sha256 = uploads.save_uploaded_file(request.FILES['file'])
             book.uploaded_by = request.user
             book.save()
             messages.success(request, "Book uploaded successfully")
@@ -450,28 +545,212 @@ def upload_book(request):
 
 
 @login_required
+@require_POST
+def start_book_upload(request):
+    """Open a chunked upload; the client then PUTs chunks to book_upload."""
+    if request.user.role != 'counselor':
+        raise PermissionDenied
+    try:
+        size = int(request.POST['size'])
+        filename = request.POST['filename']
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'filename and size are required'}, status=400)
+    title = request.POST.get('title') or filename
+    if size <= 0:
+        return JsonResponse({'error': 'Empty file'}, status=400)
+
+    try:
+        session = uploads.start(request.user, title[:255], filename[:255], size)
+    except ValidationError as e:
+        return JsonResponse({'error': ' '.join(e.messages)}, status=400)
+    return JsonResponse({
+        'id': str(session.pk),
+        'offset': 0,
+        'chunk_size': uploads.CHUNK_SIZE,
+    }, status=201)
+
+
+@login_required
+def book_upload(request, upload_id):
+    """
+    GET reports how many bytes have arrived, so an interrupted upload can
+    resume. PUT appends one chunk; its Upload-Offset header must equal
+    that count.
+    """
+    session = get_object_or_404(UploadSession, pk=upload_id, uploaded_by=request.user)
+
+    if request.method == 'GET':
+        return JsonResponse({
+            'offset': session.received,
+            'size': session.size,
+            'chunk_size': uploads.CHUNK_SIZE,
+        })
+    if request.method != 'PUT':
+        return HttpResponseNotAllowed(['GET', 'PUT'])
+
+    try:
+        offset = int(request.headers['Upload-Offset'])
+        length = int(request.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Upload-Offset and Content-Length are required'}, status=400)
+    if length > uploads.CHUNK_SIZE:
+        return JsonResponse({'error': 'Chunk too large'}, status=413)
+
+    try:
+        book = uploads.append(session, offset, request, length)
+    except uploads.UploadConflict as e:
+        return JsonResponse({'offset': e.offset}, status=409)
+    except UploadSession.DoesNotExist:
+        raise Http404("No such upload")
+    except ValidationError as e:
+        # The session is gone; the client must not resume it
+        return JsonResponse({'error': ' '.join(e.messages)}, status=400)
+
+    if book is None:
+        return JsonResponse({'offset': session.received})
+    messages.success(request, "Book uploaded successfully")
+    return JsonResponse({'offset': session.received, 'book': book.pk}, status=201)
+
+
+def _search_page(request):
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    query = request.GET.get('q', '').strip()
+    results, has_next = search.search(query, page)
+    return query, page, results, has_next
+
+
+def student_books_validators(request):
+    # Search results change as book text gets indexed, which bumps nothing
+    if request.GET.get('q', '').strip():
+        return None
+    return versioned('books')(request)
+
+
+@login_required
+@conditional(student_books_validators)
 def student_books(request):
-    books = Book.objects.all()
-    return render(request, 'counseling/student_books.html', {'books': books})
+    query, page, results, has_next = _search_page(request)
+    if query:
+        books = results
+    else:
+        books = Book.objects.select_related('uploaded_by')
+    return render(request, 'counseling/student_books.html', {
+        'books': books,
+        'query': query,
+        'page': page,
+        'has_next': has_next,
+    })
+
+
+@login_required
+def search_books(request):
+    """Ranked full-text search over titles and book contents."""
+    query, page, results, has_next = _search_page(request)
+    return JsonResponse({
+        'query': query,
+        'page': page,
+        'has_next': has_next,
+        'results': [
+            {
+                'id': book.id,
+                'title': book.title,
+                'snippet': book.snippet,
+                'uploaded_by': book.uploaded_by.get_full_name() or book.uploaded_by.username,
+                'url': reverse('download_book', args=[book.id]),
+            }
+            for book in results
+        ],
+    })
+
+
+def can_download_book(user, book):
+    if user.is_superuser or user.role in ('admin', 'counselor'):
+        return True
+    return user.role == 'student' and user.is_approved
+
+
+@login_required
+def download_book(request, pk):
+    book = get_object_or_404(Book, pk=pk)
+    if not can_download_book(request.user, book):
+        raise PermissionDenied
+    return downloads.serve_file(request, book.file)
 
 
 # =========================
 # AJAX ENDPOINTS
 # =========================
+def get_counselors_validators(request):
+    # The directory is in memory, so hashing the answer is cheaper than
+    # any version lookup
+    specialization = request.GET.get('specialization')
+    return [specialization, directory.counselors_for(specialization)], None
+
+
 @login_required
+@conditional(get_counselors_validators)
 def get_counselors(request):
-    specialization_id = request.GET.get('specialization')
-    counselors = Counselor.objects.filter(specialization_id=specialization_id).select_related('user')
-    data = [
-        {"id": c.id, "name": f"{c.user.first_name} {c.user.last_name}" if c.user.first_name else c.user.username}
-        for c in counselors
-    ]
+    # Served from the in-process directory; ids are User ids, which is
+    # what AppointmentForm's counselor field expects
+    data = directory.counselors_for(request.GET.get('specialization'))
+    return JsonResponse(data, safe=False)
+
+
+@login_required
+def open_slots(request):
+    """Free slots per counselor for a specialization over a date range."""
+    try:
+        specialization_id = int(request.GET.get('specialization', ''))
+        start = date.fromisoformat(request.GET['date']) if request.GET.get('date') else timezone.localdate()
+        days = min(max(int(request.GET.get('days', 7)), 1), 31)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid specialization, date or days'}, status=400)
+    end = start + timedelta(days=days - 1)
+
+    counselors = list(User.objects.filter(
+        role='counselor',
+        is_approved=True,
+        counselor_profile__specialization_id=specialization_id,
+    ).only('id', 'username', 'first_name', 'last_name'))
+    index = availability.SlotIndex([c.id for c in counselors], start, end)
+
+    data = []
+    for counselor in counselors:
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            slots = index.free_slots(counselor.id, day)
+            if slots:
+                data.append({
+                    'counselor_id': counselor.id,
+                    'name': counselor.get_full_name() or counselor.username,
+                    'date': day.strftime("%Y-%m-%d"),
+                    'slots': [s.strftime("%H:%M") for s in slots],
+                })
     return JsonResponse(data, safe=False)
 
 
+def counselor_appointments_validators(request):
+    # Delta polls already answer 304 from their cursor
+    if request.GET.get('since'):
+        return None
+    latest = Appointment.objects.filter(counselor=request.user) \
+        .aggregate(count=Count('id'), updated=Max('updated_at'))
+    return [latest['count'], latest['updated']], latest['updated']
+
+
 @login_required
+@conditional(counselor_appointments_validators)
 def counselor_appointments_ajax(request):
-    appointments = Appointment.objects.filter(counselor=request.user).order_by('date', 'time')
+    """
+    Without ?since= returns every appointment; with the cursor from the
+    previous response returns only what changed, or 304 if nothing did.
+    """
+    cursor, full, appointments, deleted = sync.counselor_changes(
+        request.user, request.GET.get('since')
+    )
     data = [
         {
             'id': appt.id,
@@ -484,4 +763,15 @@ def counselor_appointments_ajax(request):
         }
         for appt in appointments
     ]
-    return JsonResponse(data, safe=False)
\ No newline at end of file
+
+    if not full and not data and not deleted:
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse({
+            'cursor': cursor.isoformat(),
+            'full': full,
+            'appointments': data,
+            'deleted': deleted,
+        })
+    response['X-Sync-Cursor'] = cursor.isoformat()
+    return response
\ No newline at end of file
@@ -48,7 +48,6 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'counseling.middleware.OnlineNowMiddleware',
-    'counseling.middleware.OnlineNowMiddleware',
 ]
 
 ROOT_URLCONF = 'deftec_counseling.urls'
@@ -75,13 +74,71 @@ ASGI_APPLICATION = 'deftec_counseling.asgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Applied to every new SQLite connection. WAL lets readers carry on while a
+# write commits; synchronous=NORMAL is durable across application crashes in
+# WAL mode and only risks the last commits on power loss.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative means KiB: 64 MB of page cache per connection
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+}
+
+# Read-only pragmas for the reporting connection (journal_mode is a
+# property of the file and can't be set from a read-only connection)
+SQLITE_READ_PRAGMAS = {
+    'query_only': 1,
+    'mmap_size': SQLITE_PRAGMAS['mmap_size'],
+    'cache_size': SQLITE_PRAGMAS['cache_size'],
+    'temp_store': SQLITE_PRAGMAS['temp_store'],
+}
+
+
+def sqlite_init_command(pragmas):
+    return ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items())
+
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Served over ASGI, where Django can't close persistent connections
+        # reliably, so each request opens its own. The mmap still shares
+        # pages between connections.
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'init_command': sqlite_init_command(SQLITE_PRAGMAS),
+            # Take the write lock when a transaction starts, so two writers
+            # queue on the busy timeout instead of one failing with
+            # "database is locked" when it tries to upgrade a read lock
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    },
+    # Report and dashboard reads (counseling.routers). Point NAME at a
+    # replica file (e.g. kept up to date by Litestream or `sqlite3 .backup`)
+    # to move them off the main file entirely; by default it is a read-only
+    # connection to the same file, which under WAL never blocks the writer.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"{(BASE_DIR / 'db.sqlite3').as_uri()}?mode=ro",
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'init_command': sqlite_init_command(SQLITE_READ_PRAGMAS),
+            'timeout': 20,
+        },
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['counseling.routers.ReportRouter']
+
+# Database alias counseling.routers.reporting() reads from; None keeps
+# every query on 'default'
+REPORT_DATABASE = 'replica'
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -117,6 +174,9 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
+# Uploaded books and partial chunked uploads, kept apart from the code
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -136,17 +196,107 @@ EMAIL_HOST_USER = 'your@email.com'
 EMAIL_HOST_PASSWORD = 'yourpassword'
 DEFAULT_FROM_EMAIL = 'DEFTEC Counseling <no-reply@deftec.com>'
 
-# Channels
+# Channels. Workers on this host reach each other over Unix sockets in
+# socket_dir (counseling.layers), so any number of ASGI processes can run
+# without Redis; `manage.py channel_layer_stats` shows each worker's queues.
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
+        'BACKEND': 'counseling.layers.UnixSocketChannelLayer',
         'CONFIG': {
-            "hosts": [('127.0.0.1', 6379)],
+            'socket_dir': str(BASE_DIR / 'run' / 'channels'),
+            'capacity': 100,
+            'expiry': 60,
         },
     },
 }
 
+# 'default' is private to each process (presence heartbeats, rendered
+# dashboard fragments). 'shared' holds what every worker must agree on,
+# such as the dashboard fragment versions; the file cache covers workers
+# on one host, like the channel layer above. Use Redis or memcached for
+# both when workers span hosts.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(BASE_DIR / 'run' / 'cache'),
+    },
+}
 
-
-
+# Chat persistence (write-behind buffer in counseling.chat_buffer)
+CHAT_BUFFER_MAX_BATCH = 50
+CHAT_BUFFER_FLUSH_INTERVAL = 1.0
+CHAT_HISTORY_PAGE_SIZE = 30
+
+# Presence heartbeats (counseling.presence); run `manage.py sweep_presence`
+# periodically to mark idle users offline. PRESENCE_WRITE_WINDOW must stay
+# below PRESENCE_TTL.
+PRESENCE_WRITE_WINDOW = 60
+PRESENCE_TTL = 300
+# Heartbeats and open sockets must be visible to every worker
+PRESENCE_CACHE = 'shared'
+
+# Appointment slots (counseling.availability). Counselors without WorkingHours
+# rows fall back to Monday-Friday 08:00-17:00.
+APPOINTMENT_SLOT_MINUTES = 60
+
+# Rows fetched per database round trip by the streaming exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Rows per page on the admin list pages (counseling.pagination)
+ADMIN_PAGE_SIZE = 50
+
+# Delta sync for counselor_appointments_ajax (counseling.sync); run
+# `manage.py prune_appointment_tombstones` periodically.
+APPOINTMENT_TOMBSTONE_DAYS = 7
+
+# Counselor directory (booking dropdown) is cached in each process; a
+# version number in COUNSELOR_DIRECTORY_CACHE invalidates every process's
+# copy, so that cache must be visible to every worker
+COUNSELOR_DIRECTORY_SHARED_VERSION = True
+COUNSELOR_DIRECTORY_CACHE = 'shared'
+
+# Book downloads (counseling.downloads). Set to 'x-accel-redirect' behind
+# nginx, with an `internal` location at FILE_DOWNLOAD_ACCEL_PREFIX aliased
+# to the media directory, or 'x-sendfile' behind Apache/lighttpd.
+FILE_DOWNLOAD_OFFLOAD = None
+FILE_DOWNLOAD_ACCEL_PREFIX = '/protected/'
+
+# Chunked, content-addressed book uploads (counseling.uploads); run
+# `manage.py prune_upload_sessions` periodically.
+BOOK_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+BOOK_UPLOAD_SESSION_DAYS = 2
+# File types accepted for books, by the upload form and chunked uploads
+BOOK_FILE_EXTENSIONS = ['pdf', 'epub', 'doc', 'docx', 'txt', 'md']
+
+# Book full-text search (counseling.search). PDF text needs the optional
+# `pypdf` package; without it PDFs are found by title only. Run
+# `manage.py rebuild_book_index` after restoring or bulk-loading books.
+BOOK_SEARCH_PAGE_SIZE = 20
+BOOK_INDEX_WORKERS = 2
+
+# Call lifecycle (counseling.calls). A background thread closes stale calls
+# while any are active; `manage.py reap_calls` also closes calls left open
+# by a process that died.
+CALL_RING_TIMEOUT = 45
+CALL_IDLE_TIMEOUT = 120
+CALL_REAP_INTERVAL = 15
+CALL_MAX_MINUTES = 240
+# Signs of life on a call, recorded by whichever worker relays them
+CALL_CACHE = 'shared'
+
+# WebRTC signaling (counseling.consumers.SignalingConsumer): ICE candidates
+# are relayed to the peer in batches, after this many seconds or once this
+# many are queued
+SIGNALING_ICE_BATCH_DELAY = 0.05
+SIGNALING_ICE_BATCH_MAX = 20
+
+# Dashboard sections are cached per user (counseling.fragments) and dropped
+# when their data changes. The version numbers live in the cache named by
+# DASHBOARD_VERSION_CACHE; if that is process-local (LocMemCache) fragment
+# caching is switched off, as a bump would only reach one worker. The
+# timeout bounds staleness for changes nothing tracks.
+DASHBOARD_FRAGMENT_TIMEOUT = 3600
+DASHBOARD_VERSION_CACHE = 'shared'
@@ -0,0 +1,113 @@
+// Chunked, resumable book uploads for any form.book-upload-form with a
+// data-start-url. Without JavaScript the form still posts the whole file.
+const MAX_RETRIES = 5;
+
+function uploadKey(file) {
+    return 'book-upload:' + file.name + ':' + file.size + ':' + file.lastModified;
+}
+
+function sleep(ms) {
+    return new Promise(resolve => setTimeout(resolve, ms));
+}
+
+async function openUpload(form, file, title, csrfToken) {
+    // Resume an upload of the same file that was interrupted earlier
+    const saved = localStorage.getItem(uploadKey(file));
+    if (saved) {
+        const res = await fetch(saved);
+        if (res.ok) {
+            const data = await res.json();
+            return { url: saved, offset: data.offset, chunkSize: data.chunk_size };
+        }
+        localStorage.removeItem(uploadKey(file));
+    }
+
+    const body = new FormData();
+    body.append('title', title);
+    body.append('filename', file.name);
+    body.append('size', file.size);
+    const res = await fetch(form.dataset.startUrl, {
+        method: 'POST',
+        body: body,
+        headers: { 'X-CSRFToken': csrfToken },
+    });
+    if (!res.ok) {
+        throw new Error('Could not start the upload');
+    }
+    const data = await res.json();
+    const url = form.dataset.startUrl + data.id + '/';
+    localStorage.setItem(uploadKey(file), url);
+    return { url: url, offset: data.offset, chunkSize: data.chunk_size };
+}
+
+async function sendChunks(upload, file, csrfToken, onProgress) {
+    let offset = upload.offset;
+    let retries = 0;
+
+    while (offset < file.size) {
+        const chunk = file.slice(offset, offset + upload.chunkSize);
+        let res;
+        try {
+            res = await fetch(upload.url, {
+                method: 'PUT',
+                body: chunk,
+                headers: {
+                    'X-CSRFToken': csrfToken,
+                    'Upload-Offset': String(offset),
+                    'Content-Type': 'application/octet-stream',
+                },
+            });
+        } catch (err) {
+            // Network drop: wait, then ask the server where to carry on
+            if (++retries > MAX_RETRIES) throw err;
+            await sleep(1000 * retries);
+            const status = await fetch(upload.url);
+            if (!status.ok) throw err;
+            offset = (await status.json()).offset;
+            continue;
+        }
+
+        const data = await res.json();
+        if (res.status === 409) {
+            offset = data.offset;
+            continue;
+        }
+        if (!res.ok) {
+            throw new Error(data.error || 'Upload failed');
+        }
+        retries = 0;
+        offset = data.offset;
+        onProgress(offset / file.size);
+        if (data.book) {
+            return data.book;
+        }
+    }
+    return null;
+}
+
+document.querySelectorAll('form.book-upload-form[data-start-url]').forEach(form => {
+    form.addEventListener('submit', async function(e) {
+        const fileInput = form.querySelector('input[type=file]');
+        const file = fileInput.files[0];
+        if (!file) return;
+        e.preventDefault();
+
+        const button = form.querySelector('button[type=submit]');
+        const csrfToken = form.querySelector('[name=csrfmiddlewaretoken]').value;
+        const title = form.querySelector('[name=title]').value;
+        button.disabled = true;
+
+        try {
+            const upload = await openUpload(form, file, title, csrfToken);
+            await sendChunks(upload, file, csrfToken, fraction => {
+                button.textContent = 'Uploading ' + Math.floor(fraction * 100) + '%';
+            });
+            localStorage.removeItem(uploadKey(file));
+            window.location.href = form.dataset.doneUrl || window.location.href;
+        } catch (err) {
+            console.error(err);
+            button.disabled = false;
+            button.textContent = 'Resume upload';
+        }
+    });
+});
@@ -1,29 +1,64 @@
 const appointmentId = JSON.parse(document.getElementById('appointment-id').textContent);
-const chatSocket = new WebSocket(
-    'ws://' + window.location.host +
-    '/ws/chat/' + appointmentId + '/'
-);
+// See framing.js: JSON or MessagePack, whichever the server agrees to
+const chatSocket = openFramedSocket('/ws/chat/' + appointmentId + '/', handleChatFrame);
+const chatMessages = document.querySelector('#chat-messages');
+let historyCursor = chatMessages.dataset.cursor || null;
+let historyLoading = false;
 
-chatSocket.onmessage = function(e) {
-    const data = JSON.parse(e.data);
+function renderMessage(msg) {
+    const p = document.createElement('p');
+    const strong = document.createElement('strong');
+    strong.textContent = msg.sender + ':';
+    p.appendChild(strong);
+    p.appendChild(document.createTextNode(' ' + msg.message));
+    return p;
+}
+
+function handleChatFrame(data) {
     if (data.type === 'chat_message') {
-        document.querySelector('#chat-messages').innerHTML += '<p><strong>' + data.sender + ':</strong> ' + data.message + '</p>';
+        chatMessages.appendChild(renderMessage(data));
+        chatMessages.scrollTop = chatMessages.scrollHeight;
     } else if (data.type === 'chat_history') {
-        data.messages.forEach(msg => {
-            document.querySelector('#chat-messages').innerHTML += '<p><strong>' + msg.sender + ':</strong> ' + msg.message + '</p>';
+        const page = document.createDocumentFragment();
+        data.messages.forEach(msg => page.appendChild(renderMessage(msg)));
+        if (data.before) {
+            // Older page: prepend and keep the reader's scroll position
+            const previousHeight = chatMessages.scrollHeight;
+            chatMessages.insertBefore(page, chatMessages.firstChild);
+            chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+        } else {
+            // Latest page on (re)connect replaces the server-rendered one
+            chatMessages.innerHTML = '';
+            chatMessages.appendChild(page);
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        }
+        historyCursor = data.next_cursor;
+        historyLoading = false;
+    } else if (data.type === 'presence') {
+        const statusEl = document.querySelector('#counselor-status');
+        if (statusEl && String(data.user_id) === statusEl.dataset.userId) {
+            statusEl.className = data.is_online ? 'online' : 'offline';
+            statusEl.textContent = data.is_online ? 'Online' : 'Offline';
+        }
+    }
+}
+
+chatMessages.addEventListener('scroll', function() {
+    if (chatMessages.scrollTop === 0 && historyCursor && !historyLoading) {
+        historyLoading = true;
+        chatSocket.send({
+            'type': 'load_history',
+            'before': historyCursor
         });
-    } else if (data.type === 'offer' || data.type === 'answer' || data.type === 'ice_candidate') {
-        // Handle WebRTC signaling (see webrtc.js)
-        handleSignaling(data);
     }
-};
+});
 
 document.querySelector('#chat-message-submit').onclick = function(e) {
     const messageInputDom = document.querySelector('#chat-message-input');
     const message = messageInputDom.value;
-    chatSocket.send(JSON.stringify({
+    chatSocket.send({
         'type': 'chat_message',
         'message': message
-    }));
+    });
     messageInputDom.value = '';
-};
\ No newline at end of file
+};
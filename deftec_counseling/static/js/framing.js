@@ -0,0 +1,163 @@
+// WebSocket framing shared by chat.js and webrtc.js. Sockets offer the
+// MessagePack subprotocol; if the server picks it, frames are binary both
+// ways, otherwise JSON text. Only the types the consumers use are covered.
+const MSGPACK_SUBPROTOCOL = 'deftec.msgpack.v1';
+const textEncoder = new TextEncoder();
+const textDecoder = new TextDecoder();
+
+function msgpackEncode(value) {
+    const bytes = [];
+
+    function pushUint(n, size) {
+        for (let shift = (size - 1) * 8; shift >= 0; shift -= 8) {
+            bytes.push(Math.floor(n / Math.pow(2, shift)) & 0xff);
+        }
+    }
+
+    function pushLength(length, fix, fixMax, codes) {
+        if (fix !== null && length <= fixMax) {
+            bytes.push(fix | length);
+        } else if (codes[0] !== null && length < 0x100) {
+            bytes.push(codes[0]);
+            pushUint(length, 1);
+        } else if (length < 0x10000) {
+            bytes.push(codes[1]);
+            pushUint(length, 2);
+        } else {
+            bytes.push(codes[2]);
+            pushUint(length, 4);
+        }
+    }
+
+    function write(v) {
+        if (v === null || v === undefined) {
+            bytes.push(0xc0);
+        } else if (v === false || v === true) {
+            bytes.push(v ? 0xc3 : 0xc2);
+        } else if (typeof v === 'number') {
+            if (Number.isInteger(v) && v >= 0 && v < 0x100000000) {
+                if (v < 0x80) bytes.push(v);
+                else if (v < 0x10000) { bytes.push(0xcd); pushUint(v, 2); }
+                else { bytes.push(0xce); pushUint(v, 4); }
+            } else if (Number.isInteger(v) && v < 0 && v >= -0x20) {
+                bytes.push(v & 0xff);
+            } else {
+                const view = new DataView(new ArrayBuffer(8));
+                view.setFloat64(0, v);
+                bytes.push(0xcb);
+                for (let i = 0; i < 8; i++) bytes.push(view.getUint8(i));
+            }
+        } else if (typeof v === 'string') {
+            const encoded = textEncoder.encode(v);
+            pushLength(encoded.length, 0xa0, 31, [0xd9, 0xda, 0xdb]);
+            for (let i = 0; i < encoded.length; i++) bytes.push(encoded[i]);
+        } else if (Array.isArray(v)) {
+            pushLength(v.length, 0x90, 15, [null, 0xdc, 0xdd]);
+            v.forEach(write);
+        } else if (typeof v.toJSON === 'function') {
+            // RTCSessionDescription / RTCIceCandidate
+            write(v.toJSON());
+        } else {
+            const keys = Object.keys(v).filter(key => v[key] !== undefined);
+            pushLength(keys.length, 0x80, 15, [null, 0xde, 0xdf]);
+            keys.forEach(key => { write(key); write(v[key]); });
+        }
+    }
+
+    write(value);
+    return new Uint8Array(bytes);
+}
+
+function msgpackDecode(buffer) {
+    const view = new DataView(buffer);
+    let pos = 0;
+
+    function uint(size) {
+        let n = 0;
+        for (let i = 0; i < size; i++) n = n * 256 + view.getUint8(pos++);
+        return n;
+    }
+
+    function str(length) {
+        const s = textDecoder.decode(new Uint8Array(buffer, pos, length));
+        pos += length;
+        return s;
+    }
+
+    function array(length) {
+        const out = [];
+        for (let i = 0; i < length; i++) out.push(read());
+        return out;
+    }
+
+    function map(length) {
+        const out = {};
+        for (let i = 0; i < length; i++) {
+            const key = read();
+            out[key] = read();
+        }
+        return out;
+    }
+
+    function read() {
+        const code = view.getUint8(pos++);
+        if (code < 0x80) return code;
+        if (code < 0x90) return map(code & 0x0f);
+        if (code < 0xa0) return array(code & 0x0f);
+        if (code < 0xc0) return str(code & 0x1f);
+        if (code >= 0xe0) return code - 0x100;
+        switch (code) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xc4: case 0xc5: case 0xc6: {
+                const length = uint(1 << (code - 0xc4));
+                const bin = new Uint8Array(buffer.slice(pos, pos + length));
+                pos += length;
+                return bin;
+            }
+            case 0xca: pos += 4; return view.getFloat32(pos - 4);
+            case 0xcb: pos += 8; return view.getFloat64(pos - 8);
+            case 0xcc: return uint(1);
+            case 0xcd: return uint(2);
+            case 0xce: return uint(4);
+            case 0xcf: return uint(8);
+            case 0xd0: pos += 1; return view.getInt8(pos - 1);
+            case 0xd1: pos += 2; return view.getInt16(pos - 2);
+            case 0xd2: pos += 4; return view.getInt32(pos - 4);
+            case 0xd3: pos += 8; return Number(view.getBigInt64(pos - 8));
+            case 0xd9: return str(uint(1));
+            case 0xda: return str(uint(2));
+            case 0xdb: return str(uint(4));
+            case 0xdc: return array(uint(2));
+            case 0xdd: return array(uint(4));
+            case 0xde: return map(uint(2));
+            case 0xdf: return map(uint(4));
+        }
+        throw new Error('Unsupported MessagePack type 0x' + code.toString(16));
+    }
+
+    return read();
+}
+
+// Opens a socket at `path` and calls onFrame(object) for every frame.
+// Returns { socket, send(object) }.
+function openFramedSocket(path, onFrame) {
+    const socket = new WebSocket('ws://' + window.location.host + path, [MSGPACK_SUBPROTOCOL]);
+    socket.binaryType = 'arraybuffer';
+
+    socket.onmessage = function(e) {
+        onFrame(e.data instanceof ArrayBuffer ? msgpackDecode(e.data) : JSON.parse(e.data));
+    };
+
+    return {
+        socket: socket,
+        send: function(payload) {
+            if (socket.protocol === MSGPACK_SUBPROTOCOL) {
+                socket.send(msgpackEncode(payload));
+            } else {
+                socket.send(JSON.stringify(payload));
+            }
+        },
+    };
+}
@@ -1,13 +1,51 @@
 let localStream;
 let remoteStream;
 let peerConnection;
+// CallLog id of the call in progress, assigned by the server
+let currentCallId = null;
 
 const configuration = {
     iceServers: [{ urls: 'stun:stun.l.google.com:19302' }]
 };
 
-async function startCall() {
-    localStream = await navigator.mediaDevices.getUserMedia({ video: true, audio: true });
+// Signaling has its own socket; the server relays each frame to the other
+// participant only (appointmentId comes from chat.js)
+const signalSocket = openFramedSocket('/ws/call/' + appointmentId + '/', handleSignalFrame);
+// Candidates gathered within this many ms go out as one frame
+const ICE_BATCH_DELAY = 50;
+let pendingCandidates = [];
+let iceTimer = null;
+// A connected call sends no signaling of its own; this tells the server
+// it is still up (well inside CALL_IDLE_TIMEOUT)
+const KEEPALIVE_INTERVAL = 30000;
+let keepaliveTimer = null;
+
+function sendSignal(type, data) {
+    signalSocket.send({
+        'type': type,
+        'call_id': currentCallId,
+        'data': data
+    });
+}
+
+function flushCandidates() {
+    clearTimeout(iceTimer);
+    iceTimer = null;
+    // Until the server assigns the call id, candidates wait here
+    if (currentCallId === null || !pendingCandidates.length) return;
+    sendSignal('ice_candidates', pendingCandidates);
+    pendingCandidates = [];
+}
+
+function queueCandidate(candidate) {
+    pendingCandidates.push(candidate);
+    if (iceTimer === null) {
+        iceTimer = setTimeout(flushCandidates, ICE_BATCH_DELAY);
+    }
+}
+
+async function preparePeer(callType = 'video') {
+    localStream = await navigator.mediaDevices.getUserMedia({ video: callType === 'video', audio: true });
     document.getElementById('localVideo').srcObject = localStream;
 
     peerConnection = new RTCPeerConnection(configuration);
@@ -23,45 +61,117 @@ async function startCall() {
 
     peerConnection.onicecandidate = event => {
         if (event.candidate) {
-            chatSocket.send(JSON.stringify({
-                'type': 'ice_candidate',
-                'data': event.candidate
-            }));
+            queueCandidate(event.candidate);
+        } else {
+            // Gathering finished: don't wait out the timer
+            flushCandidates();
         }
     };
+}
 
+async function startCall(callType = 'video') {
+    await preparePeer(callType);
     const offer = await peerConnection.createOffer();
     await peerConnection.setLocalDescription(offer);
-    chatSocket.send(JSON.stringify({
+    // No call_id yet: the server rings the other participant and replies
+    // with a call_state frame carrying the new id
+    signalSocket.send({
         'type': 'offer',
+        'call_type': callType,
         'data': offer
-    }));
+    });
+}
+
+async function answerCall(callId, offer) {
+    currentCallId = callId;
+    await preparePeer();
+    await peerConnection.setRemoteDescription(new RTCSessionDescription(offer));
+    const answer = await peerConnection.createAnswer();
+    await peerConnection.setLocalDescription(answer);
+    sendSignal('answer', answer);
 }
 
 function handleSignaling(data) {
     if (data.type === 'offer') {
-        peerConnection.setRemoteDescription(new RTCSessionDescription(data.data));
-        peerConnection.createAnswer().then(answer => {
-            peerConnection.setLocalDescription(answer);
-            chatSocket.send(JSON.stringify({
-                'type': 'answer',
-                'data': answer
-            }));
-        });
+        if (peerConnection && data.call_id === currentCallId) {
+            // Renegotiation inside the current call
+            peerConnection.setRemoteDescription(new RTCSessionDescription(data.data))
+                .then(() => peerConnection.createAnswer())
+                .then(answer => {
+                    peerConnection.setLocalDescription(answer);
+                    sendSignal('answer', answer);
+                });
+        } else if (!peerConnection) {
+            answerCall(data.call_id, data.data);
+        }
     } else if (data.type === 'answer') {
         peerConnection.setRemoteDescription(new RTCSessionDescription(data.data));
-    } else if (data.type === 'ice_candidate') {
-        peerConnection.addIceCandidate(new RTCIceCandidate(data.data));
+    } else if (data.type === 'ice_candidates') {
+        if (peerConnection) {
+            data.data.forEach(candidate => {
+                peerConnection.addIceCandidate(new RTCIceCandidate(candidate));
+            });
+        }
     }
 }
 
-function endCall() {
-    peerConnection.close();
-    localStream.getTracks().forEach(track => track.stop());
+function handleCallState(data) {
+    if (data.state === 'ringing' && currentCallId === null && peerConnection) {
+        // Our own offer was accepted by the server; send what gathered meanwhile
+        currentCallId = data.call_id;
+        flushCandidates();
+    } else if (data.state === 'ongoing' && data.call_id === currentCallId && keepaliveTimer === null) {
+        keepaliveTimer = setInterval(() => sendSignal('keepalive', null), KEEPALIVE_INTERVAL);
+    } else if ((data.state === 'completed' || data.state === 'missed') && data.call_id === currentCallId) {
+        teardown();
+    }
+}
+
+function teardown() {
+    clearTimeout(iceTimer);
+    iceTimer = null;
+    clearInterval(keepaliveTimer);
+    keepaliveTimer = null;
+    pendingCandidates = [];
+    if (peerConnection) {
+        peerConnection.close();
+        peerConnection = null;
+    }
+    if (localStream) {
+        localStream.getTracks().forEach(track => track.stop());
+        localStream = null;
+    }
+    remoteStream = null;
+    currentCallId = null;
     document.getElementById('localVideo').srcObject = null;
     document.getElementById('remoteVideo').srcObject = null;
 }
 
+function endCall() {
+    if (currentCallId !== null) {
+        sendSignal('hangup', null);
+    }
+    teardown();
+}
+
+function handleSignalFrame(data) {
+    if (data.type === 'call_state') {
+        handleCallState(data);
+    } else if (data.type === 'call_error') {
+        console.warn('Call error:', data.error);
+    } else {
+        handleSignaling(data);
+    }
+}
+
 // Attach to buttons in HTML
-document.getElementById('start-call').addEventListener('click', startCall);
-document.getElementById('end-call').addEventListener('click', endCall);
\ No newline at end of file
+document.getElementById('start-call').addEventListener('click', () => startCall('video'));
+document.getElementById('end-call').addEventListener('click', endCall);
+
+// The dashboard's call buttons open this page with ?call=voice or ?call=video
+const requestedCall = new URLSearchParams(window.location.search).get('call');
+if (requestedCall) {
+    signalSocket.socket.addEventListener('open', () => {
+        startCall(requestedCall === 'voice' ? 'voice' : 'video');
+    }, { once: true });
+}